@@ -0,0 +1,58 @@
+"""Memory and time of attachment text extraction, and of the unchanged-file skip.
+
+    python -m benchmarks.attachment_text --sizes 10 100
+
+For each size, a text file is hashed (what an unchanged attachment costs)
+and extracted (what a changed one costs). "peak" is the tracemalloc peak
+of the extraction; it is bounded by ATTACHMENT_TEXT_MAX_CHARS, not by the
+file size.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+
+MB = 1024 * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100], help="File sizes in MB")
+    args = parser.parse_args()
+
+    import django
+
+    django.setup()
+
+    from reviews.extraction import extract_text, file_hash
+
+    line = b"Reading notes: the narrator doubts the albatross again.\n"
+    for size_mb in args.sizes:
+        with tempfile.TemporaryFile() as f:
+            for _ in range(size_mb * MB // len(line)):
+                f.write(line)
+
+            f.seek(0)
+            started = time.perf_counter()
+            file_hash(f)
+            hashed = time.perf_counter() - started
+
+            f.seek(0)
+            tracemalloc.start()
+            started = time.perf_counter()
+            text = extract_text(f, "notes.txt")
+            extracted = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        print(
+            f"{size_mb} MB: hash {hashed * 1000:.0f} ms; extract {extracted * 1000:.1f} ms, "
+            f"{len(text)} chars, peak {peak / 1024:.0f} KiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Attachment URL generation for a page of review cards.
+
+    python -m benchmarks.attachment_urls --cards 200
+
+Runs offline against each storage: the signed local stand-in, S3 with
+querystring auth (boto3 signs locally, no network needed) and the unsigned
+S3 static storage the site uses today. "per card" calls file_upload.url
+four times per card, as the card template used to; "cold" resolves the
+page through the attachment URL service with an empty cache, "warm" with
+the URLs cached.
+"""
+import argparse
+import time
+
+from benchmarks.common import percentile, test_database
+
+STORAGES = {
+    "local signed": {"BACKEND": "mysite.storage.SignedFileSystemStorage"},
+    "s3 signed": {
+        "BACKEND": "storages.backends.s3.S3Storage",
+        "OPTIONS": {"custom_domain": "", "querystring_auth": True, "region_name": "us-east-1"},
+    },
+    "s3 static": {"BACKEND": "storages.backends.s3boto3.S3StaticStorage"},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cards", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=30)
+    args = parser.parse_args()
+
+    with test_database():
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        from django.core.files.storage import storages
+
+        from reviews.attachments import prefetch_attachment_urls
+        from reviews.models import BookReview
+
+        user = User.objects.create_user(username="attacher")
+        BookReview.objects.bulk_create([
+            BookReview(
+                user=user, title=f"Review {i}", author="Author", comment="", rating=3,
+                average_rating=3, file_upload=f"uploads/attachment{i}.pdf",
+            )
+            for i in range(args.cards)
+        ])
+
+        def sample(label, fn, before=None):
+            samples = []
+            for _ in range(args.runs):
+                if before:
+                    before()
+                started = time.perf_counter()
+                fn()
+                samples.append((time.perf_counter() - started) * 1000)
+            print(f"  {label}: p50 {percentile(samples, 50):.2f} ms, p95 {percentile(samples, 95):.2f} ms")
+
+        # Swapped on the field directly: override_settings(STORAGES=...) drops
+        # OPTIONS on Django 4.2
+        field = BookReview._meta.get_field("file_upload")
+        for label, params in STORAGES.items():
+            field.storage = storages.create_storage(params)
+            reviews = list(BookReview.objects.order_by("id"))
+            print(f"{label} ({args.cards} cards):")
+
+            def per_card():
+                for review in reviews:
+                    for _ in range(4):
+                        review.file_upload.url
+
+            def service():
+                for review in prefetch_attachment_urls(reviews):
+                    review.attachment_url
+
+            sample("per card", per_card)
+            sample("cold", service, cache.clear)
+            sample("warm", service)
+
+
+if __name__ == "__main__":
+    main()
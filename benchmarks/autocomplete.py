@@ -0,0 +1,86 @@
+"""Autocomplete endpoint latency under a steady request rate.
+
+    python -m benchmarks.autocomplete --books 300000 --rate 500
+
+Requests go through the WSGI handler and full middleware stack, paced at
+``--rate`` per second against a single worker. Latency is measured from each
+request's scheduled start, so any queueing behind a slow request counts;
+service time is the request alone.
+"""
+import argparse
+import random
+import time
+
+from benchmarks.book_search import make_vocabulary, populate
+from benchmarks.common import percentile, test_database, timer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--books", type=int, default=300_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--rate", type=int, default=500)
+    parser.add_argument("--seconds", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+
+    with test_database():
+        from django.core.handlers.wsgi import WSGIHandler
+        from django.test.client import RequestFactory
+        from django.urls import reverse
+
+        from reviews import autocomplete
+
+        with timer(f"populate {args.books} books"):
+            populate(args.books, vocabulary, rng)
+        with timer("build prefix index"):
+            autocomplete.prefix_index.get()
+        print(f"{len(autocomplete.prefix_index.get().keys)} keys")
+
+        # What people type: 1-6 leading characters of a word, biased to common words
+        prefixes = [
+            rng.choice(vocabulary[:200] if rng.random() < 0.3 else vocabulary)[: rng.randint(1, 6)]
+            for _ in range(args.rate * args.seconds)
+        ]
+        handler = WSGIHandler()
+        factory = RequestFactory()
+        url = reverse("search_autocomplete")
+
+        def get(prefix):
+            environ = factory.get(url, {"q": prefix}).environ
+            return b"".join(handler(environ, lambda status, headers: None))
+
+        get("warm")
+
+        interval = 1 / args.rate
+        samples, service = [], []
+        started = time.perf_counter()
+        for i, prefix in enumerate(prefixes):
+            scheduled = started + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            begun = time.perf_counter()
+            get(prefix)
+            finished = time.perf_counter()
+            samples.append((finished - scheduled) * 1000)
+            service.append((finished - begun) * 1000)
+
+        print(
+            f"{len(samples)} requests at {args.rate}/s: "
+            f"p50 {percentile(samples, 50):.2f} ms, "
+            f"p95 {percentile(samples, 95):.2f} ms, "
+            f"p99 {percentile(samples, 99):.2f} ms"
+        )
+        print(
+            "service time: "
+            f"p50 {percentile(service, 50):.2f} ms, "
+            f"p99 {percentile(service, 99):.2f} ms, "
+            f"max {max(service):.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
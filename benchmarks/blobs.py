@@ -0,0 +1,66 @@
+"""Storage used and save latency when many members upload the same file.
+
+    python -m benchmarks.blobs --copies 50 --size 2 [--mbps 10]
+
+Saves the same file ``--copies`` times through a plain storage (what
+attachments did before) and through BlobStorage, and reports bytes stored
+and per-save latency. Files go to a local temp directory; ``--mbps``
+throttles writes to model an upload link to S3.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import percentile, test_database
+
+MB = 1024 * 1024
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, default=50)
+    parser.add_argument("--size", type=int, default=2, help="File size in MB")
+    parser.add_argument("--mbps", type=float, default=None, help="Simulated upload bandwidth, MB/s")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        with test_database():
+            from django.core.files.base import ContentFile
+            from django.core.files.storage import FileSystemStorage
+
+            from reviews.blobs import BlobStorage
+
+            class Storage(FileSystemStorage):
+                def _save(self, name, content):
+                    if args.mbps:
+                        time.sleep(content.size / MB / args.mbps)
+                    return super()._save(name, content)
+
+            data = os.urandom(args.size * MB)
+            for label, storage in [
+                ("plain", Storage(location=os.path.join(tmp, "plain"))),
+                ("blobs", BlobStorage(Storage(location=os.path.join(tmp, "blobs")))),
+            ]:
+                samples = []
+                for i in range(args.copies):
+                    started = time.perf_counter()
+                    storage.save(f"uploads/member{i}.pdf", ContentFile(data))
+                    samples.append((time.perf_counter() - started) * 1000)
+                stored = directory_size(os.path.join(tmp, label))
+                print(
+                    f"{label}: {stored / MB:.1f} MB stored for {args.copies} uploads; "
+                    f"first save {samples[0]:.1f} ms, repeat p50 {percentile(samples[1:], 50):.1f} ms"
+                )
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
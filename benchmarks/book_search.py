@@ -0,0 +1,97 @@
+"""Top-20 catalog search latency on a generated catalog.
+
+    python -m benchmarks.book_search --books 1000000
+"""
+import argparse
+import random
+from itertools import accumulate
+import time
+from datetime import date, timedelta
+
+from benchmarks.common import percentile, test_database, timer
+
+
+def make_vocabulary(rng, size):
+    # Stopwords first: they are the most frequent words in real text
+    from mysite.search import STOPWORDS
+
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = ["".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(size)]
+    return sorted(STOPWORDS) + words
+
+
+def populate(books, vocabulary, rng, batch_size=5000):
+    from books.models import Book
+
+    start = date(1900, 1, 1)
+    # Zipf-like: a few common words, a long tail of rare ones
+    cum_weights = list(accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+
+    def words(n):
+        return " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=n))
+
+    for offset in range(0, books, batch_size):
+        Book.objects.bulk_create(
+            Book(
+                title=f"{words(3)} {i}",
+                author=words(2),
+                genre="Fiction",
+                description=words(40),
+                publisher=words(2),
+                date_published=start + timedelta(days=i % 40000),
+                catalog_key=str(i),
+            )
+            for i in range(offset, min(offset + batch_size, books))
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--books", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+
+    with test_database():
+        from books.search import book_index
+
+        with timer(f"populate {args.books} books (indexed by triggers)"):
+            populate(args.books, vocabulary, rng)
+
+        from mysite.search import STOPWORDS
+
+        content = vocabulary[len(STOPWORDS):]
+        queries = []
+        for _ in range(args.queries):
+            # Mostly specific words, some very common ones, prefixes and pairs
+            word = rng.choice(content[:500] if rng.random() < 0.2 else content)
+            roll = rng.random()
+            if roll < 0.15:
+                query = word[:3]
+            elif roll < 0.35:
+                query = f"{word} {rng.choice(content[:5000])}"
+            elif roll < 0.45:
+                query = f"the {word}"
+            else:
+                query = word
+            queries.append(query)
+
+        samples = []
+        for query in queries:
+            started = time.perf_counter()
+            book_index.results(query, limit=20)
+            samples.append((time.perf_counter() - started) * 1000)
+
+        print(
+            f"{len(samples)} queries, top 20 with snippets: "
+            f"p50 {percentile(samples, 50):.2f} ms, "
+            f"p95 {percentile(samples, 95):.2f} ms, "
+            f"p99 {percentile(samples, 99):.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Shared setup for the scripts in this package.
+
+Run a benchmark from the repository root, e.g.::
+
+    python -m benchmarks.import_books --rows 500000
+
+Each script runs against a throwaway test database, so it never touches the
+development DB. The usual environment variables (see .env.example) must be set.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+
+
+@contextmanager
+def test_database():
+    import django
+
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+@contextmanager
+def timer(label):
+    started = time.perf_counter()
+    yield
+    print(f"{label}: {time.perf_counter() - started:.3f}s")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
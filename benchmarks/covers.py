@@ -0,0 +1,84 @@
+"""Cover request time and the bytes a catalog page of covers costs.
+
+    python -m benchmarks.covers --latency 300
+
+Serves a page of book covers through the book_cover view, with a stand-in
+fetcher that sleeps --latency ms per cover like a slow third-party host:
+once cold (each cover fetched and resized) and then from the cache.
+Compares the bytes of the hot-linked originals with the thumbnails.
+"""
+import argparse
+import shutil
+import tempfile
+import time
+from functools import lru_cache
+from io import BytesIO
+
+from benchmarks.common import percentile, test_database
+
+
+@lru_cache
+def source_cover():
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.effect_noise((1200, 1800), 24).convert("RGB").save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def slow_fetch(url):
+    # Imported by path from COVER_FETCHER, so the latency travels in the URL
+    time.sleep(int(url.rsplit("latency=", 1)[1]) / 1000)
+    return source_cover()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=int, default=300, help="Source host latency in ms")
+    parser.add_argument("--covers", type=int, default=24, help="Covers on a catalog page")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        with test_database():
+            from django.test import Client, override_settings
+            from books.models import Book
+
+            books = [
+                Book.objects.create(
+                    title=f"Book {i}", author="A", genre="Fiction", description="", publisher="P",
+                    date_published="2000-01-01", img_url=f"https://covers.example.com/{i}.jpg?latency={args.latency}",
+                )
+                for i in range(args.covers)
+            ]
+            client = Client()
+            storages = {
+                "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+                "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+            }
+            with override_settings(
+                STORAGES=storages, MEDIA_ROOT=tmp, FILE_DELIVERY="django",
+                COVER_FETCHER="benchmarks.covers.slow_fetch",
+            ):
+                thumbnail_bytes = 0
+                for label in ("cold", "cached"):
+                    samples = []
+                    for book in books:
+                        started = time.perf_counter()
+                        response = client.get(book.cover_url)
+                        body = b"".join(response.streaming_content)
+                        samples.append((time.perf_counter() - started) * 1000)
+                        thumbnail_bytes = len(body)
+                    print(f"{label}: p50 {percentile(samples, 50):.1f} ms, p95 {percentile(samples, 95):.1f} ms per cover")
+
+            print(
+                f"page of {args.covers} covers: {args.covers * len(source_cover()) / 1024:.0f} KiB hot-linked, "
+                f"{args.covers * thumbnail_bytes / 1024:.0f} KiB as thumbnails "
+                f"(then none: served with Cache-Control immutable)"
+            )
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Worker time spent per attachment download, by FILE_DELIVERY mode.
+
+    python -m benchmarks.downloads --size 50
+
+Times the review_attachment view from request to the last byte the
+worker has to produce: the whole file when Django streams it, a single
+block for a resumed (Range) request, and just the headers when the
+transfer is handed to the front server or a signed URL.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import percentile, test_database
+
+MB = 1024 * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=50, help="Attachment size in MB")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        with test_database():
+            from django.contrib.auth.models import User
+            from django.core.files.base import ContentFile
+            from django.test import RequestFactory, override_settings
+
+            from mysite.storage import SignedFileSystemStorage
+            from reviews import views
+            from reviews.blobs import BlobStorage
+            from reviews.models import BookReview, BookReviewMembership
+
+            field = BookReview._meta.get_field("file_upload")
+            # Local signed storage stands in for private S3
+            field.storage = BlobStorage(SignedFileSystemStorage(location=tmp))
+            user = User.objects.create_user(username="reader")
+            name = field.storage.save("uploads/big.pdf", ContentFile(os.urandom(args.size * MB)))
+            # bulk_create sends no signals, so no preview/extraction jobs start
+            [review] = BookReview.objects.bulk_create([
+                BookReview(user=user, title="Big PDF", author="A", comment="", rating=3, file_upload=name)
+            ])
+            BookReviewMembership.objects.create(review=review, user=user)
+            factory = RequestFactory()
+
+            def download(**headers):
+                request = factory.get(f"/reviews/review/{review.id}/attachment/", **headers)
+                request.user = user
+                response = views.review_attachment(request, review.id)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+                response.close()
+                return response
+
+            cases = [
+                ("django, whole file", "django", {}),
+                ("django, Range 1 MB", "django", {"HTTP_RANGE": f"bytes={MB}-{2 * MB - 1}"}),
+                ("accel", "accel", {}),
+                ("redirect", "redirect", {}),
+            ]
+            for label, delivery, headers in cases:
+                with override_settings(FILE_DELIVERY=delivery):
+                    samples = []
+                    for _ in range(args.runs):
+                        started = time.perf_counter()
+                        download(**headers)
+                        samples.append((time.perf_counter() - started) * 1000)
+                print(f"{label}: p50 {percentile(samples, 50):.2f} ms, p95 {percentile(samples, 95):.2f} ms")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Import a generated catalog through the import_books command.
+
+    python -m benchmarks.import_books --rows 500000
+"""
+import argparse
+import csv
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+
+from benchmarks.common import test_database, timer
+
+GENRES = ["Fiction", "Dystopian", "Mystery", "Romance", "Fantasy", "Biography"]
+
+
+def write_catalog(path, rows, seed=0):
+    rng = random.Random(seed)
+    start = date(1900, 1, 1)
+    with open(path, "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(
+            ["title", "author", "genre", "description", "publisher",
+             "date_published", "img_url", "buy_link"]
+        )
+        for i in range(rows):
+            writer.writerow([
+                f"Generated Book {i}",
+                f"Author {i % 5000}",
+                rng.choice(GENRES),
+                f"Description of generated book {i}. " * 4,
+                f"Publisher {i % 300}",
+                (start + timedelta(days=rng.randrange(45000))).isoformat(),
+                f"https://covers.example.com/{i}.jpg",
+                f"https://shop.example.com/{i}",
+            ])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, test_database():
+        from books.importer import import_books
+        from books.models import Book
+
+        path = os.path.join(tmp, "catalog.csv")
+        with timer(f"generate {args.rows} rows"):
+            write_catalog(path, args.rows)
+
+        print("first import: ", import_books(path, batch_size=args.batch_size))
+        print("re-import:    ", import_books(path, batch_size=args.batch_size))
+        print("dry run:      ", import_books(path, batch_size=args.batch_size, dry_run=True))
+        print("books in DB:  ", Book.objects.count())
+
+
+if __name__ == "__main__":
+    main()
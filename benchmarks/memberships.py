@@ -0,0 +1,104 @@
+"""Membership checks for a page of review cards, for a user in many reviews.
+
+    python -m benchmarks.memberships --reviews 50000
+
+Compares loading every review id the user is a member of (what the list
+pages used to do) with the lookup scoped to the ids on the page, then times
+review_list pages for that user end to end.
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import percentile, test_database, timer
+
+
+def populate(count, rng):
+    from django.contrib.auth.models import User
+
+    from reviews.models import BookReview, BookReviewMembership
+
+    member = User.objects.create_user(username="member")
+    authors = User.objects.bulk_create([User(username=f"author{i}") for i in range(100)])
+    BookReview.objects.bulk_create(
+        [
+            BookReview(
+                user=rng.choice(authors),
+                title=f"Review {i}",
+                author=f"Author {i % 1000}",
+                genre="FICT",
+                comment="",
+                rating=rng.randint(1, 5),
+                average_rating=rng.randint(1, 5),
+            )
+            for i in range(count)
+        ],
+        batch_size=5000,
+    )
+    BookReviewMembership.objects.bulk_create(
+        [
+            BookReviewMembership(user=member, review_id=review_id)
+            for review_id in BookReview.objects.values_list("id", flat=True).iterator()
+        ],
+        batch_size=5000,
+    )
+    return member
+
+
+def sample(runs, fn):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return f"p50 {percentile(samples, 50):.2f} ms, p99 {percentile(samples, 99):.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reviews", type=int, default=50_000)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+
+    with test_database():
+        from django.db import connection
+        from django.test import Client
+        from django.urls import reverse
+
+        from reviews.models import BookReview, BookReviewMembership
+        from reviews.views import REVIEWS_PAGE_SIZE
+
+        with timer(f"populate {args.reviews} reviews and memberships"):
+            member = populate(args.reviews, rng)
+
+        page_ids = list(
+            BookReview.objects.order_by("-date", "-id").values_list("id", flat=True)[:REVIEWS_PAGE_SIZE]
+        )
+        print("all memberships:", sample(
+            args.runs, lambda: set(member.memberships.values_list("review_id", flat=True))
+        ))
+        print("page memberships:", sample(
+            args.runs, lambda: BookReviewMembership.objects.review_ids_for(member, page_ids)
+        ))
+
+        query = BookReviewMembership.objects.filter(
+            user=member, review_id__in=page_ids
+        ).values_list("review_id", flat=True).query
+        with connection.cursor() as cursor:
+            sql, params = query.sql_with_params()
+            explain = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+            cursor.execute(explain + sql, params)
+            for row in cursor.fetchall():
+                print("  ", row[-1])
+
+        client = Client()
+        client.force_login(member)
+        url = reverse("review_list")
+        client.get(url)
+        print("review_list page:", sample(args.runs, lambda: client.get(url)))
+
+
+if __name__ == "__main__":
+    main()
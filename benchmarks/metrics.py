@@ -0,0 +1,70 @@
+"""Cost of the metrics instrumentation.
+
+    python -m benchmarks.metrics --queries 20
+
+Times a view that runs --queries queries, called directly and through
+MetricsMiddleware, and how long a scrape takes to add up the files of
+--workers processes.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import percentile, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        with test_database():
+            from django.contrib.auth.models import User
+            from django.http import HttpResponse
+            from django.test import RequestFactory, override_settings
+            from django.urls import resolve
+
+            from mysite import metrics
+
+            def view(request):
+                for _ in range(args.queries):
+                    User.objects.filter(pk=1).exists()
+                return HttpResponse("ok")
+
+            middleware = metrics.MetricsMiddleware(view)
+            request = RequestFactory().get("/books/")
+            request.resolver_match = resolve("/books/")
+
+            with override_settings(METRICS_DIR=tmp):
+                for label, handler in [("bare view", view), ("with middleware", middleware)]:
+                    samples = []
+                    for _ in range(args.runs):
+                        started = time.perf_counter()
+                        handler(request)
+                        samples.append((time.perf_counter() - started) * 1e6)
+                    print(f"{label}: p50 {percentile(samples, 50):.0f} us, p95 {percentile(samples, 95):.0f} us")
+
+                snapshot = metrics.registry.snapshot()
+                for worker in range(args.workers):
+                    # Live pids, so the files stay put between scrapes
+                    with open(os.path.join(tmp, f"{os.getpid()}-worker{worker}.json"), "w") as f:
+                        json.dump(snapshot, f)
+                samples = []
+                for _ in range(100):
+                    started = time.perf_counter()
+                    metrics.render(metrics.collect())
+                    samples.append((time.perf_counter() - started) * 1000)
+                print(f"scrape of {args.workers} workers: p50 {percentile(samples, 50):.1f} ms")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
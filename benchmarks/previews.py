@@ -0,0 +1,51 @@
+"""Preview render time and the bytes a page of cards makes the browser fetch.
+
+    python -m benchmarks.previews --width 4000
+
+Renders previews of a photo-sized JPEG and a text file, and compares the
+size of each original (what the cards embedded before) with its preview.
+"""
+import argparse
+import os
+import time
+from io import BytesIO
+
+from benchmarks.common import percentile
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--cards", type=int, default=10)
+    args = parser.parse_args()
+
+    import django
+
+    django.setup()
+
+    from PIL import Image
+
+    from reviews.previews import render_preview
+
+    photo = BytesIO()
+    Image.effect_noise((args.width, args.width * 3 // 4), 64).convert("RGB").save(photo, "JPEG", quality=90)
+    text = ("A line of reading notes about the book.\n" * 20000).encode()
+
+    for name, data in [("photo.jpg", photo.getvalue()), ("notes.txt", text)]:
+        samples = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            preview = render_preview(BytesIO(data), name)
+            samples.append((time.perf_counter() - started) * 1000)
+        print(
+            f"{name}: render p50 {percentile(samples, 50):.1f} ms, p95 {percentile(samples, 95):.1f} ms; "
+            f"{args.cards} cards fetch {args.cards * len(data) / 1024:.0f} KiB as originals, "
+            f"{args.cards * len(preview) / 1024:.0f} KiB as previews"
+        )
+
+
+if __name__ == "__main__":
+    main()
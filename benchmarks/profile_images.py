@@ -0,0 +1,59 @@
+"""Profile image processing time and the bytes a profile page fetches for it.
+
+    python -m benchmarks.profile_images --width 4000
+
+Processes a phone-sized JPEG into its variants, once with reduced (draft)
+decoding and once decoding at full size, and compares the original (what
+the profile page embedded before) with the variant a 150px picture picks
+from its srcset at 1x and 2x.
+"""
+import argparse
+import os
+import time
+from io import BytesIO
+
+from benchmarks.common import percentile
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    import django
+
+    django.setup()
+
+    from unittest import mock
+
+    from PIL import Image, JpegImagePlugin
+
+    from users.images import render_variants
+
+    photo = BytesIO()
+    Image.effect_noise((args.width, args.width * 3 // 4), 32).convert("RGB").save(photo, "JPEG", quality=92)
+    data = photo.getvalue()
+
+    full_decode = mock.patch.object(JpegImagePlugin.JpegImageFile, "draft", return_value=None)
+    for label, patch in [("draft decode", None), ("full decode", full_decode)]:
+        samples = []
+        for _ in range(args.runs):
+            if patch:
+                patch.start()
+            started = time.perf_counter()
+            variants = render_variants(BytesIO(data))
+            samples.append((time.perf_counter() - started) * 1000)
+            if patch:
+                patch.stop()
+        print(f"{label}: p50 {percentile(samples, 50):.0f} ms, p95 {percentile(samples, 95):.0f} ms")
+
+    print(f"original: {len(data) / 1024:.0f} KiB")
+    for (variant, extension), rendered in sorted(variants.items()):
+        print(f"{variant}.{extension}: {len(rendered) / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
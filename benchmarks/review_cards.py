@@ -0,0 +1,99 @@
+"""Render time of a page of review cards, with and without cached fragments.
+
+    python -m benchmarks.review_cards --cards 200
+
+"uncached" renders with a dummy cache, which is what every render cost
+before the card fragments were cached; "cold" clears the cache first, so
+it also pays for storing every fragment; "warm" renders from cached
+fragments; "one changed" re-renders after one review on the page changes.
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import percentile, test_database, timer
+
+
+def populate(count, rng):
+    from django.contrib.auth.models import User
+
+    from reviews.models import BookReview
+
+    authors = User.objects.bulk_create(
+        [User(username=f"author{i}", first_name="Card", last_name=f"Writer {i}") for i in range(50)]
+    )
+    extensions = [".jpg", ".pdf", ".txt", ".docx"]
+    BookReview.objects.bulk_create([
+        BookReview(
+            user=rng.choice(authors),
+            title=f"Review {i}",
+            author=f"Author {i % 20}",
+            genre="FICT",
+            comment="A fair few words about the book. " * 10,
+            rating=rng.randint(1, 5),
+            average_rating=rng.randint(1, 5),
+            file_upload=f"uploads/attachment{i}{rng.choice(extensions)}" if i % 2 else None,
+            file_title=f"Attachment {i}",
+            file_keywords="notes, quotes",
+            file_description="Reading notes.",
+        )
+        for i in range(count)
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cards", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+
+    with test_database():
+        from django.contrib.auth.models import AnonymousUser
+        from django.core.cache import cache
+        from django.template.loader import render_to_string
+        from django.test import RequestFactory, override_settings
+
+        from reviews.models import BookReview
+
+        with timer(f"populate {args.cards} reviews"):
+            populate(args.cards, rng)
+
+        request = RequestFactory().get("/reviews/")
+        request.user = AnonymousUser()
+        reviews = list(BookReview.objects.for_cards().order_by("-date", "-id"))
+        context = {"reviews": reviews, "membership_ids": {review.id for review in reviews}}
+
+        def render():
+            return render_to_string("reviews/review_cards.html", context, request)
+
+        def sample(label, before=None):
+            samples = []
+            for _ in range(args.runs):
+                if before:
+                    before()
+                started = time.perf_counter()
+                render()
+                samples.append((time.perf_counter() - started) * 1000)
+            print(
+                f"{label}: p50 {percentile(samples, 50):.2f} ms, "
+                f"p95 {percentile(samples, 95):.2f} ms"
+            )
+
+        def change_one():
+            review = rng.choice(reviews)
+            review.rating = rng.randint(1, 5)
+            review.save(update_fields=["rating", "updated_at"])
+
+        dummy = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        with override_settings(CACHES=dummy):
+            sample("uncached")
+        sample("cold", cache.clear)
+        render()
+        sample("warm")
+        sample("one changed", change_one)
+
+
+if __name__ == "__main__":
+    main()
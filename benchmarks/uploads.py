@@ -0,0 +1,126 @@
+"""Peak memory and throughput of a chunked attachment upload.
+
+    python -m benchmarks.uploads --sizes 10 100
+
+Each file is uploaded through the upload views in Upload-Length sized
+chunks read from a file-backed request stream, as a WSGI server would hand
+them over. "peak" is the largest tracemalloc peak over any one request; it
+should stay near reviews.uploads.BLOCK_SIZE whatever the file size.
+"buffered" reads the same chunk in one go, as request.body would (were it
+under DATA_UPLOAD_MAX_MEMORY_SIZE).
+"""
+import argparse
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.common import test_database, timer
+
+MB = 1024 * 1024
+
+
+def make_file(path, size):
+    digest = hashlib.sha256()
+    with open(path, "wb") as f:
+        for _ in range(size // MB):
+            block = os.urandom(MB)
+            f.write(block)
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100], help="File sizes in MB")
+    parser.add_argument("--chunk", type=int, default=8, help="Chunk size in MB")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        with test_database():
+            from django.contrib.auth.models import User
+            from django.core.files.storage import FileSystemStorage
+            from django.core.handlers.wsgi import WSGIRequest
+            from django.test import RequestFactory, override_settings
+
+            from reviews import views
+            from reviews.models import BookReview
+
+            user = User.objects.create_user(username="uploader")
+            factory = RequestFactory()
+            field = BookReview._meta.get_field("file_upload")
+            # Local files rather than whatever STORAGES points at
+            field.storage = FileSystemStorage(location=os.path.join(tmp, "media"))
+
+            def patch_request(location, source, offset, length, checksum):
+                environ = factory._base_environ(
+                    PATH_INFO=location,
+                    REQUEST_METHOD="PATCH",
+                    CONTENT_TYPE="application/offset+octet-stream",
+                    CONTENT_LENGTH=str(length),
+                    HTTP_UPLOAD_OFFSET=str(offset),
+                    HTTP_UPLOAD_CHECKSUM="sha256 " + base64.b64encode(checksum).decode(),
+                )
+                environ["wsgi.input"] = source
+                request = WSGIRequest(environ)
+                request.user = user
+                return request
+
+            with override_settings(
+                UPLOAD_STAGING_DIR=os.path.join(tmp, "staging"),
+                UPLOAD_MAX_SIZE=max(args.sizes) * MB,
+                UPLOAD_MAX_CHUNK_SIZE=args.chunk * MB,
+            ):
+                for size_mb in args.sizes:
+                    size = size_mb * MB
+                    path = os.path.join(tmp, f"upload{size_mb}.pdf")
+                    with timer(f"write {size_mb} MB test file"):
+                        file_hash = make_file(path, size)
+
+                    metadata = "filename " + base64.b64encode(b"upload.pdf").decode()
+                    metadata += ",sha256 " + base64.b64encode(file_hash.encode()).decode()
+                    request = factory.post(
+                        "/reviews/uploads/", HTTP_UPLOAD_LENGTH=str(size), HTTP_UPLOAD_METADATA=metadata
+                    )
+                    request.user = user
+                    location = views.upload_create(request)["Location"]
+                    upload_id = location.rstrip("/").split("/")[-1]
+
+                    peak = buffered_peak = 0
+                    started = time.perf_counter()
+                    with open(path, "rb") as source:
+                        for offset in range(0, size, args.chunk * MB):
+                            length = min(args.chunk * MB, size - offset)
+                            source.seek(offset)
+                            checksum = hashlib.sha256(source.read(length)).digest()
+                            source.seek(offset)
+
+                            tracemalloc.start()
+                            response = views.upload_detail(
+                                patch_request(location, source, offset, length, checksum), upload_id
+                            )
+                            peak = max(peak, tracemalloc.get_traced_memory()[1])
+                            tracemalloc.stop()
+                            assert response.status_code == 200, response.content
+
+                            source.seek(offset)
+                            tracemalloc.start()
+                            patch_request(location, source, offset, length, checksum).read()
+                            buffered_peak = max(buffered_peak, tracemalloc.get_traced_memory()[1])
+                            tracemalloc.stop()
+                    elapsed = time.perf_counter() - started
+                    assert response["Upload-Offset"] == str(size)
+                    print(
+                        f"{size_mb} MB in {args.chunk} MB chunks: peak {peak / 1024:.0f} KiB "
+                        f"(buffered {buffered_peak / 1024:.0f} KiB), {size / MB / elapsed:.0f} MB/s"
+                    )
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""A local cache of book covers.
+
+Catalog cards used to hot-link Book.img_url at full size from third-party
+hosts. Now they point at the book_cover view, which serves a WebP
+thumbnail kept in our storage under a name derived from the URL
+(models.cover_key), so responses can be cached by browsers for good.
+
+The first request for a cover fetches it through COVER_FETCHER, a dotted
+path to a callable taking a URL and returning its bytes (fetch_url by
+default; tests use a local stand-in). A cover that can't be fetched is
+retried after COVER_RETRY_AFTER seconds, with the view redirecting to the
+source meanwhile. Once the thumbnails add up to more than
+COVER_CACHE_MAX_BYTES the least recently used are evicted.
+``manage.py cache_covers`` fetches the covers of the whole catalog ahead
+of time.
+"""
+import logging
+from datetime import timedelta
+from io import BytesIO
+
+import requests
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from PIL import Image, ImageOps
+
+from .models import CoverImage, cover_key
+
+logger = logging.getLogger(__name__)
+
+# Twice the widest card in the three-column catalog grid
+COVER_WIDTH = 400
+COVER_QUALITY = 80
+# Don't rewrite last_used_at on every hit
+TOUCH_INTERVAL = timedelta(hours=1)
+
+
+class CoverFetchError(Exception):
+    pass
+
+
+def fetch_url(url):
+    """The bytes at ``url``, up to COVER_MAX_SOURCE_BYTES."""
+    if not url.startswith(("http://", "https://")):
+        raise CoverFetchError(f"Not an http(s) URL: {url}")
+    with requests.get(url, stream=True, timeout=settings.COVER_FETCH_TIMEOUT) as response:
+        response.raise_for_status()
+        data = BytesIO()
+        for chunk in response.iter_content(64 * 1024):
+            data.write(chunk)
+            if data.tell() > settings.COVER_MAX_SOURCE_BYTES:
+                raise CoverFetchError(f"Cover larger than {settings.COVER_MAX_SOURCE_BYTES} bytes: {url}")
+    return data.getvalue()
+
+
+def render_cover(data):
+    """WebP bytes of the image in ``data``, no wider than COVER_WIDTH."""
+    image = Image.open(BytesIO(data))
+    image.draft("RGB", (COVER_WIDTH, COVER_WIDTH * 2))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    if image.width > COVER_WIDTH:
+        image = image.resize((COVER_WIDTH, round(image.height * COVER_WIDTH / image.width)), Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, "WEBP", quality=COVER_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def cached_cover(img_url):
+    """The CoverImage for ``img_url``, fetching and storing it first unless
+    it is cached or failed less than COVER_RETRY_AFTER seconds ago."""
+    key = cover_key(img_url)
+    now = timezone.now()
+    cover = CoverImage.objects.filter(key=key).first()
+    if cover is not None:
+        if cover.name or now - cover.fetched_at < timedelta(seconds=settings.COVER_RETRY_AFTER):
+            touch(cover)
+            return cover
+
+    name, size = "", 0
+    try:
+        data = render_cover(import_string(settings.COVER_FETCHER)(img_url))
+    except Exception as e:
+        logger.warning("Could not cache the cover at %s: %s", img_url, e)
+    else:
+        name = default_storage.save(f"covers/{key}.webp", ContentFile(data))
+        size = len(data)
+
+    cover, created = CoverImage.objects.update_or_create(
+        key=key,
+        defaults={"source_url": img_url, "name": name, "size": size, "fetched_at": now, "last_used_at": now},
+    )
+    if name:
+        evict()
+    return cover
+
+
+def touch(cover):
+    """Mark ``cover`` as recently used, for eviction."""
+    now = timezone.now()
+    if now - cover.last_used_at > TOUCH_INTERVAL:
+        CoverImage.objects.filter(key=cover.key).update(last_used_at=now)
+
+
+def evict(max_bytes=None):
+    """Delete least recently used covers until the rest fit in
+    ``max_bytes`` (COVER_CACHE_MAX_BYTES). Returns how many went."""
+    if max_bytes is None:
+        max_bytes = settings.COVER_CACHE_MAX_BYTES
+    excess = (CoverImage.objects.aggregate(total=Sum("size"))["total"] or 0) - max_bytes
+    evicted = 0
+    if excess <= 0:
+        return evicted
+    for cover in CoverImage.objects.exclude(name="").order_by("last_used_at").iterator():
+        if excess <= 0:
+            break
+        # Conditional, so a cover another request just used or refetched stays
+        if CoverImage.objects.filter(key=cover.key, last_used_at=cover.last_used_at).delete()[0]:
+            default_storage.delete(cover.name)
+            excess -= cover.size
+            evicted += 1
+    return evicted
@@ -0,0 +1,122 @@
+import csv
+import time
+from datetime import date
+from itertools import islice
+
+from django.db import transaction
+
+from .models import Book
+
+CSV_FIELDS = [
+    "title",
+    "author",
+    "genre",
+    "description",
+    "publisher",
+    "date_published",
+    "img_url",
+    "buy_link",
+]
+
+
+class ImportStats:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.skipped = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.rows} rows in {self.elapsed:.2f}s ({self.rows_per_second:,.0f} rows/s): "
+            f"{self.created} created, {self.updated} updated, "
+            f"{self.unchanged} unchanged, {self.skipped} skipped"
+        )
+
+
+def read_rows(path):
+    with open(path, "r", newline="", encoding="utf-8") as csv_file:
+        yield from csv.DictReader(csv_file)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def build_book(row):
+    return Book(
+        title=row["title"].strip(),
+        author=row["author"].strip(),
+        genre=row["genre"].strip(),
+        description=row["description"],
+        publisher=row["publisher"].strip(),
+        date_published=date.fromisoformat(row["date_published"].strip()),
+        img_url=row["img_url"].strip() or None,
+        buy_link=row["buy_link"].strip() or None,
+    )
+
+
+def import_books(path, batch_size=1000, dry_run=False, progress=None):
+    """Stream a books CSV into the DB in batches of ``batch_size`` rows.
+
+    Each batch is deduplicated in memory by catalog key, matched against the
+    DB with one probe of the catalog_key unique index and written with a
+    single upsert in its own transaction.
+    """
+    stats = ImportStats()
+    # Dry runs write nothing, so remember created keys to dedupe later batches
+    dry_run_keys = set()
+
+    for chunk in chunked(read_rows(path), batch_size):
+        books = {}
+        for row in chunk:
+            stats.rows += 1
+            try:
+                book = build_book(row)
+            except (KeyError, ValueError, AttributeError):
+                stats.skipped += 1
+                continue
+            # Later duplicates in the same batch win
+            books[book.make_catalog_key()] = book
+
+        existing = Book.objects.filter(catalog_key__in=list(books)).in_bulk(
+            field_name="catalog_key"
+        )
+        changed = []
+        for key, book in books.items():
+            current = existing.get(key)
+            if current is None:
+                if key in dry_run_keys:
+                    stats.updated += 1
+                else:
+                    stats.created += 1
+                    if dry_run:
+                        dry_run_keys.add(key)
+                changed.append(book)
+            elif any(getattr(current, field) != getattr(book, field) for field in CSV_FIELDS):
+                stats.updated += 1
+                changed.append(book)
+            else:
+                stats.unchanged += 1
+
+        if changed and not dry_run:
+            with transaction.atomic():
+                Book.objects.upsert(changed, batch_size=batch_size)
+
+        if progress:
+            progress(stats)
+
+    return stats
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from books.covers import cached_cover
+from books.models import Book, CoverImage, cover_key
+
+
+class Command(BaseCommand):
+    help = "Fetch the covers of catalog books that aren't cached yet."
+
+    def handle(self, *args, **options):
+        cached = set(CoverImage.objects.values_list("key", flat=True))
+        urls = Book.objects.exclude(img_url__isnull=True).exclude(img_url="").values_list("img_url", flat=True)
+        fetched = failed = 0
+        for url in urls.distinct().iterator():
+            if cover_key(url) in cached:
+                continue
+            if cached_cover(url).name:
+                fetched += 1
+            else:
+                failed += 1
+            if options["verbosity"] >= 2:
+                self.stdout.write(f"{fetched} covers cached, {failed} failed")
+        self.stdout.write(self.style.SUCCESS(f"Cached {fetched} covers ({failed} could not be fetched)"))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from books.importer import import_books
+
+
+class Command(BaseCommand):
+    help = "Import books from a CSV file (same columns as books/books.csv) in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="books/books.csv")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Parse and match rows without writing anything to the DB.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        progress = None
+        if options["verbosity"] >= 2:
+            progress = lambda stats: self.stdout.write(str(stats))
+
+        try:
+            stats = import_books(
+                options["path"],
+                batch_size=options["batch_size"],
+                dry_run=options["dry_run"],
+                progress=progress,
+            )
+        except FileNotFoundError:
+            raise CommandError(f"No such file: {options['path']}")
+
+        prefix = "[dry run] " if options["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(f"{prefix}{stats}"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import autodiscover_modules
+
+from mysite.search import registry
+
+
+class Command(BaseCommand):
+    help = "Drop and rebuild full-text search indexes and their sync triggers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", help="Index names (default: all).")
+
+    def handle(self, *args, **options):
+        autodiscover_modules("search")
+        names = options["names"] or sorted(registry)
+        for name in names:
+            if name not in registry:
+                raise CommandError(f"Unknown search index {name!r}")
+            registry[name].rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {name}"))
@@ -0,0 +1,56 @@
+from django.db import migrations, models
+
+
+def make_catalog_key(title, author, date_published):
+    # Frozen copy of books.models.make_catalog_key
+    year = str(date_published)[:4]
+    return "\t".join(
+        [" ".join(title.split()).casefold(), " ".join(author.split()).casefold(), year]
+    )
+
+
+def populate_catalog_keys(apps, schema_editor):
+    Book = apps.get_model("books", "Book")
+    UserBook = apps.get_model("users", "UserBook")
+
+    kept = {}
+    for book in Book.objects.order_by("id").iterator():
+        key = make_catalog_key(book.title, book.author, book.date_published)
+        if key not in kept:
+            kept[key] = book.id
+            Book.objects.filter(id=book.id).update(catalog_key=key)
+            continue
+
+        # Duplicate of an earlier book: move shelf entries over, then drop it
+        keeper_id = kept[key]
+        for userbook in UserBook.objects.filter(book_id=book.id):
+            if UserBook.objects.filter(
+                user_id=userbook.user_id, book_id=keeper_id, status=userbook.status
+            ).exists():
+                userbook.delete()
+            else:
+                userbook.book_id = keeper_id
+                userbook.save(update_fields=["book"])
+        book.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0003_alter_book_description"),
+        ("users", "0007_userbook"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="catalog_key",
+            field=models.CharField(editable=False, max_length=400, null=True),
+        ),
+        migrations.RunPython(populate_catalog_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="book",
+            name="catalog_key",
+            field=models.CharField(editable=False, max_length=400, unique=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0004_book_catalog_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'author', 'date_published', 'id'], name='book_browse_idx'),
+        ),
+    ]
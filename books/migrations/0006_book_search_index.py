@@ -0,0 +1,73 @@
+from django.db import migrations
+
+from mysite.search import execute_frozen
+
+
+# SQL generated by mysite.search when this migration was written, frozen so
+# later changes to the index can't change what it does
+INSTALL_SQL = {
+    "sqlite": [
+        'DROP TRIGGER IF EXISTS books_book_search_ai',
+        'DROP TRIGGER IF EXISTS books_book_search_ad',
+        'DROP TRIGGER IF EXISTS books_book_search_au',
+        'DROP TABLE IF EXISTS books_book_search',
+        "CREATE VIRTUAL TABLE books_book_search USING fts5(title, author, publisher, description, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        'CREATE TRIGGER books_book_search_ai AFTER INSERT ON books_book BEGIN INSERT INTO books_book_search(rowid, title, author, publisher, description) VALUES (new.id, new.title, new.author, new.publisher, new.description); END',
+        'CREATE TRIGGER books_book_search_ad AFTER DELETE ON books_book BEGIN DELETE FROM books_book_search WHERE rowid = old.id; END',
+        'CREATE TRIGGER books_book_search_au AFTER UPDATE OF title, author, publisher, description ON books_book BEGIN DELETE FROM books_book_search WHERE rowid = old.id; INSERT INTO books_book_search(rowid, title, author, publisher, description) VALUES (new.id, new.title, new.author, new.publisher, new.description); END',
+        'INSERT INTO books_book_search(rowid, title, author, publisher, description) SELECT id, title, author, publisher, description FROM books_book',
+    ],
+    "postgresql": [
+        'DROP TRIGGER IF EXISTS books_book_search_sync ON books_book',
+        'DROP FUNCTION IF EXISTS books_book_search_sync()',
+        'DROP TABLE IF EXISTS books_book_search',
+        'CREATE TABLE books_book_search (rowid bigint PRIMARY KEY, document tsvector NOT NULL)',
+        'CREATE INDEX books_book_search_document_idx ON books_book_search USING GIN (document)',
+        """CREATE FUNCTION books_book_search_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM books_book_search WHERE rowid = OLD.id;
+            RETURN OLD;
+        END IF;
+        INSERT INTO books_book_search (rowid, document) VALUES (NEW.id, setweight(to_tsvector('english', coalesce(NEW.title::text, '')), 'A') || setweight(to_tsvector('english', coalesce(NEW.author::text, '')), 'A') || setweight(to_tsvector('english', coalesce(NEW.publisher::text, '')), 'C') || setweight(to_tsvector('english', coalesce(NEW.description::text, '')), 'D'))
+        ON CONFLICT (rowid) DO UPDATE SET document = EXCLUDED.document;
+        RETURN NEW;
+    END
+    $$""",
+        'CREATE TRIGGER books_book_search_sync AFTER INSERT OR DELETE OR UPDATE OF title, author, publisher, description ON books_book FOR EACH ROW EXECUTE FUNCTION books_book_search_sync()',
+        "INSERT INTO books_book_search (rowid, document) SELECT id, setweight(to_tsvector('english', coalesce(books_book.title::text, '')), 'A') || setweight(to_tsvector('english', coalesce(books_book.author::text, '')), 'A') || setweight(to_tsvector('english', coalesce(books_book.publisher::text, '')), 'C') || setweight(to_tsvector('english', coalesce(books_book.description::text, '')), 'D') FROM books_book",
+    ],
+}
+
+UNINSTALL_SQL = {
+    "sqlite": [
+        'DROP TRIGGER IF EXISTS books_book_search_ai',
+        'DROP TRIGGER IF EXISTS books_book_search_ad',
+        'DROP TRIGGER IF EXISTS books_book_search_au',
+        'DROP TABLE IF EXISTS books_book_search',
+    ],
+    "postgresql": [
+        'DROP TRIGGER IF EXISTS books_book_search_sync ON books_book',
+        'DROP FUNCTION IF EXISTS books_book_search_sync()',
+        'DROP TABLE IF EXISTS books_book_search',
+    ],
+}
+
+
+def install(apps, schema_editor):
+    execute_frozen(schema_editor, INSTALL_SQL)
+
+
+def uninstall(apps, schema_editor):
+    execute_frozen(schema_editor, UNINSTALL_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0005_book_browse_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -1,4 +1,56 @@
+import hashlib
+
 from django.db import models
+from django.urls import reverse
+
+# Bump to re-render every cached cover (books.covers), e.g. at a new size
+COVER_VERSION = 1
+
+
+def make_catalog_key(title, author, date_published):
+    # Case-folded, whitespace-collapsed title + author + publication year.
+    # Collapsing whitespace guarantees the tab separator can't appear inside a part.
+    year = str(date_published)[:4]
+    return "\t".join(
+        [" ".join(title.split()).casefold(), " ".join(author.split()).casefold(), year]
+    )
+
+
+def cover_key(img_url):
+    """Names the cached thumbnail of the cover at ``img_url``; a new URL or
+    COVER_VERSION gives a new key, so served covers never change."""
+    return hashlib.sha256(f"{COVER_VERSION}:{img_url}".encode()).hexdigest()[:32]
+
+
+class BookQuerySet(models.QuerySet):
+    UPSERT_FIELDS = [
+        "title",
+        "author",
+        "genre",
+        "description",
+        "publisher",
+        "date_published",
+        "img_url",
+        "buy_link",
+    ]
+
+    def upsert(self, books, batch_size=None, update_fields=None):
+        """Insert ``books``, updating rows that already exist by catalog key.
+
+        Runs as INSERT ... ON CONFLICT (catalog_key) DO UPDATE on both Postgres
+        and SQLite, so re-imports are idempotent. Returned objects don't get
+        their pk set on SQLite.
+        """
+        books = list(books)
+        for book in books:
+            book.catalog_key = book.make_catalog_key()
+        return self.bulk_create(
+            books,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["catalog_key"],
+            update_fields=update_fields or self.UPSERT_FIELDS,
+        )
 
 
 class Book(models.Model):
@@ -10,6 +62,49 @@ class Book(models.Model):
     date_published = models.DateField()
     img_url = models.URLField(max_length=500, null=True)
     buy_link = models.URLField(max_length=500, null=True)
+    catalog_key = models.CharField(max_length=400, unique=True, editable=False)
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order used by books_view
+            models.Index(
+                fields=["title", "author", "date_published", "id"], name="book_browse_idx"
+            ),
+        ]
+
+    def make_catalog_key(self):
+        return make_catalog_key(self.title, self.author, self.date_published)
+
+    def save(self, *args, **kwargs):
+        self.catalog_key = self.make_catalog_key()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "catalog_key" not in update_fields:
+            kwargs["update_fields"] = {*update_fields, "catalog_key"}
+        super().save(*args, **kwargs)
+
+    @property
+    def cover_url(self):
+        if not self.img_url:
+            return None
+        return reverse("book_cover", args=[self.pk, cover_key(self.img_url)])
 
     def __str__(self):
         return f"{self.title} by {self.author}"
+
+
+class CoverImage(models.Model):
+    """A cover thumbnail cached in our storage (see books.covers). ``name``
+    is empty while the source couldn't be fetched."""
+
+    key = models.CharField(max_length=32, primary_key=True)
+    source_url = models.URLField(max_length=500)
+    name = models.CharField(max_length=255, blank=True)
+    size = models.PositiveIntegerField(default=0)
+    fetched_at = models.DateTimeField()
+    # Least recently used covers are evicted first once over COVER_CACHE_MAX_BYTES
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.source_url
@@ -0,0 +1,9 @@
+from mysite.search import FullTextIndex
+
+from .models import Book
+
+book_index = FullTextIndex(
+    "books_book_search",
+    Book,
+    {"title": "A", "author": "A", "publisher": "C", "description": "D"},
+)
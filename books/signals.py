@@ -0,0 +1,5 @@
+from mysite.cache import register_tags
+
+from .models import Book
+
+register_tags(Book, lambda book: [f"book:{book.pk}", "book:all"])
@@ -1,3 +1,359 @@
-from django.test import TestCase
+import csv
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from books import covers
+from books.importer import CSV_FIELDS, import_books
+from books.models import Book, CoverImage
+from books.search import book_index
+from books.views import BOOK_ORDERING
+from mysite.pagination import InvalidCursor, keyset_paginate
+
+
+def book_row(title, author="Harper Lee", published="1960-07-11", **overrides):
+    row = {
+        "title": title,
+        "author": author,
+        "genre": "Fiction",
+        "description": f"About {title}.",
+        "publisher": "J.B. Lippincott & Co.",
+        "date_published": published,
+        "img_url": "https://example.com/cover.jpg",
+        "buy_link": "https://example.com/buy",
+    }
+    row.update(overrides)
+    return row
+
+
+class ImportBooksTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write_csv(self, rows):
+        path = os.path.join(self.tmp.name, "books.csv")
+        with open(path, "w", newline="", encoding="utf-8") as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def test_import_creates_books_in_batches(self):
+        path = self.write_csv([book_row(f"Book {i}") for i in range(7)])
+        stats = import_books(path, batch_size=3)
+        self.assertEqual(stats.created, 7)
+        self.assertEqual(Book.objects.count(), 7)
+
+    def test_import_dedupes_on_natural_key(self):
+        path = self.write_csv([
+            book_row("To Kill a Mockingbird"),
+            book_row("  to kill a   MOCKINGBIRD ", description="Newer description."),
+        ])
+        stats = import_books(path)
+        self.assertEqual(stats.created, 1)
+        self.assertEqual(Book.objects.get().description, "Newer description.")
+
+    def test_reimport_is_idempotent_and_updates_changes(self):
+        path = self.write_csv([book_row("1984", author="George Orwell", published="1949-06-08")])
+        import_books(path)
+        stats = import_books(path)
+        self.assertEqual((stats.created, stats.updated, stats.unchanged), (0, 0, 1))
+
+        path = self.write_csv([
+            book_row("1984", author="George Orwell", published="1949-06-08", genre="Dystopian")
+        ])
+        stats = import_books(path)
+        self.assertEqual(stats.updated, 1)
+        self.assertEqual(Book.objects.get().genre, "Dystopian")
+
+    def test_invalid_rows_are_skipped(self):
+        path = self.write_csv([book_row("Good"), book_row("Bad", published="not a date")])
+        stats = import_books(path)
+        self.assertEqual((stats.created, stats.skipped), (1, 1))
+
+    def test_dry_run_writes_nothing(self):
+        path = self.write_csv([book_row("Book A"), book_row("Book B")])
+        out = StringIO()
+        call_command("import_books", path, "--dry-run", stdout=out)
+        self.assertFalse(Book.objects.exists())
+        self.assertIn("2 created", out.getvalue())
+        self.assertIn("rows/s", out.getvalue())
+
+
+class BookCatalogKeyTests(TestCase):
+
+    def make_book(self, title="1984", author="George Orwell", **fields):
+        fields.setdefault("date_published", "1949-06-08")
+        fields.setdefault("description", "Big Brother is watching.")
+        return Book(
+            title=title,
+            author=author,
+            genre="Dystopian",
+            publisher="Secker & Warburg",
+            **fields,
+        )
+
+    def test_save_sets_normalized_catalog_key(self):
+        book = self.make_book(title="  Nineteen   Eighty-Four ")
+        book.save()
+        self.assertEqual(book.catalog_key, "nineteen eighty-four\tgeorge orwell\t1949")
+
+    def test_catalog_key_is_unique(self):
+        from django.db import IntegrityError
+
+        self.make_book().save()
+        with self.assertRaises(IntegrityError):
+            self.make_book(title="1984 ", author="GEORGE ORWELL", date_published="1949-01-01").save()
+
+    def test_upsert_inserts_then_updates(self):
+        Book.objects.upsert([self.make_book(), self.make_book(title="Animal Farm")])
+        Book.objects.upsert([self.make_book(description="Updated.")])
+        self.assertEqual(Book.objects.count(), 2)
+        self.assertEqual(Book.objects.get(title="1984").description, "Updated.")
+
+
+class BooksPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Duplicate titles/authors make the id tie-breaker matter
+        Book.objects.bulk_create([
+            Book(
+                title=f"Book {i // 3}",
+                author="Same Author",
+                genre="Fiction",
+                description="",
+                publisher="Publisher",
+                date_published=f"{1900 + i}-01-01",
+                catalog_key=str(i),
+            )
+            for i in range(50)
+        ])
+
+    def test_cursor_pages_cover_catalog_once_in_order(self):
+        seen = []
+        cursor = None
+        while True:
+            page = keyset_paginate(Book.objects.all(), BOOK_ORDERING, cursor, page_size=7)
+            seen.extend(book.id for book in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        expected = list(Book.objects.order_by(*BOOK_ORDERING).values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_descending_ordering(self):
+        ordering = ["-date_published", "-id"]
+        first = keyset_paginate(Book.objects.all(), ordering, page_size=10)
+        second = keyset_paginate(Book.objects.all(), ordering, first.next_cursor, page_size=10)
+        dates = [book.date_published for book in [*first, *second]]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+        self.assertEqual(len(set(dates)), 20)
+
+    def test_cursor_is_bound_to_ordering(self):
+        page = keyset_paginate(Book.objects.all(), BOOK_ORDERING, page_size=5)
+        with self.assertRaises(InvalidCursor):
+            keyset_paginate(Book.objects.all(), ["-id"], page.next_cursor)
+        with self.assertRaises(InvalidCursor):
+            keyset_paginate(Book.objects.all(), BOOK_ORDERING, "garbage")
+
+    def test_books_view_renders_one_page(self):
+        response = self.client.get(reverse("books_view"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["books"]), 24)
+        self.assertIsNotNone(response.context["next_cursor"])
+
+    def test_anonymous_catalog_doesnt_look_up_the_social_app_per_card(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("books_view"))
+        self.assertContains(response, f'action="{reverse("google_login")}"')
+        self.assertFalse([q for q in queries if "socialaccount_socialapp" in q["sql"]])
+
+    def test_books_page_fragment_continues_from_cursor(self):
+        first = self.client.get(reverse("books_view")).context
+        response = self.client.get(reverse("books_page"), {"cursor": first["next_cursor"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "<html")
+        first_ids = {book.id for book in first["books"]}
+        self.assertFalse(first_ids & {book.id for book in response.context["books"]})
+
+    def test_books_page_rejects_bad_cursor(self):
+        response = self.client.get(reverse("books_page"), {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 400)
+
+
+class BookSearchTests(TestCase):
+
+    def setUp(self):
+        self.mockingbird = Book.objects.create(
+            title="To Kill a Mockingbird",
+            author="Harper Lee",
+            genre="Fiction",
+            description="A lawyer in Alabama defends a Black man <accused> of a crime.",
+            publisher="J.B. Lippincott & Co.",
+            date_published="1960-07-11",
+        )
+        self.orwell = Book.objects.create(
+            title="Homage to Catalonia",
+            author="George Orwell",
+            genre="Memoir",
+            description="Orwell recalls fighting in Spain; mentions a mockingbird once.",
+            publisher="Secker & Warburg",
+            date_published="1938-04-25",
+        )
+
+    def test_title_match_outranks_description_match(self):
+        hits = book_index.search("mockingbird")
+        self.assertEqual([hit.pk for hit in hits], [self.mockingbird.pk, self.orwell.pk])
+
+    def test_prefix_and_multi_term_queries(self):
+        self.assertEqual([h.pk for h in book_index.search("lee harp")], [self.mockingbird.pk])
+        self.assertEqual([h.pk for h in book_index.search("the mockingbird")][0], self.mockingbird.pk)
+        self.assertEqual(book_index.search("harper orwell"), [])
+        self.assertEqual(book_index.search("   "), [])
+
+    def test_broad_queries_are_narrowed_to_title_and_author(self):
+        with mock.patch("mysite.search.BROAD_QUERY_THRESHOLD", 1):
+            hits = book_index.search("mockingbird")
+        self.assertEqual([hit.pk for hit in hits], [self.mockingbird.pk])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.orwell.title = "Animal Farm"
+        self.orwell.save()
+        self.assertEqual([h.pk for h in book_index.search("animal")], [self.orwell.pk])
+        self.assertEqual(book_index.search("catalonia"), [])
+        self.orwell.delete()
+        self.assertEqual(book_index.search("animal"), [])
+
+    def test_upserted_books_are_indexed(self):
+        Book.objects.upsert([
+            Book(title="Brave New World", author="Aldous Huxley", genre="Dystopian",
+                 description="", publisher="Chatto & Windus", date_published="1932-01-01")
+        ])
+        self.assertEqual(len(book_index.search("huxley")), 1)
+
+    def test_snippets_are_escaped_and_highlighted(self):
+        book = book_index.results("alabama")[0]
+        self.assertIn("<mark>Alabama</mark>", book.search_snippet)
+        self.assertIn("&lt;accused&gt;", book.search_snippet)
+
+    def test_books_view_search(self):
+        response = self.client.get(reverse("books_view"), {"q": "orwell"})
+        self.assertEqual(list(response.context["books"]), [self.orwell])
+        self.assertContains(response, "<mark>Orwell</mark>")
+        self.assertIsNone(response.context["next_cursor"])
+
+
+fetched_covers = []
+
+
+def fake_fetch(url):
+    # Stands in for COVER_FETCHER: a tall image per URL, or a failure
+    from PIL import Image
+
+    fetched_covers.append(url)
+    if "missing" in url:
+        raise covers.CoverFetchError("404")
+    buffer = BytesIO()
+    Image.new("RGB", (1200, 1800), "maroon").save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+class CoverCacheTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        overrides = override_settings(
+            STORAGES={
+                "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+                "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+            },
+            MEDIA_ROOT=self.tmp, COVER_FETCHER="books.tests.fake_fetch", FILE_DELIVERY="django",
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        fetched_covers.clear()
+
+    def book(self, img_url):
+        return Book.objects.create(
+            title=f"Covered {Book.objects.count()}", author="Someone", genre="Fiction", description="",
+            publisher="Publisher", date_published="2000-01-01", img_url=img_url,
+        )
+
+    def get_cover(self, book):
+        response = self.client.get(book.cover_url)
+        if response.status_code == 200:
+            response.body = b"".join(response.streaming_content)
+        return response
+
+    def test_cover_is_fetched_once_and_served_as_a_cacheable_thumbnail(self):
+        from PIL import Image
+
+        book = self.book("https://covers.example.com/1.jpg")
+        response = self.get_cover(book)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("immutable", response["Cache-Control"])
+        image = Image.open(BytesIO(response.body))
+        self.assertEqual((image.format, image.size), ("WEBP", (covers.COVER_WIDTH, 600)))
+
+        # Another book with the same cover shares it
+        other = self.book("https://covers.example.com/1.jpg")
+        self.assertEqual(self.get_cover(other).status_code, 200)
+        self.assertEqual(fetched_covers, ["https://covers.example.com/1.jpg"])
+
+        response = self.client.get(book.cover_url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_catalog_links_cached_covers_not_the_source(self):
+        book = self.book("https://covers.example.com/2.jpg")
+        response = self.client.get(reverse("books_view"))
+        self.assertContains(response, book.cover_url)
+        self.assertNotContains(response, book.img_url)
+        # A stale key (the book's URL changed since the page was rendered) fetches nothing
+        stale = book.cover_url
+        book.img_url = "https://covers.example.com/3.jpg"
+        book.save()
+        self.assertEqual(self.client.get(stale).status_code, 404)
+        self.assertEqual(fetched_covers, [])
+
+    def test_failed_fetches_redirect_to_the_source_until_retried(self):
+        book = self.book("https://covers.example.com/missing.jpg")
+        with self.assertLogs("books.covers", "WARNING"):
+            response = self.get_cover(book)
+        self.assertRedirects(response, book.img_url, fetch_redirect_response=False)
+        self.get_cover(book)
+        self.assertEqual(len(fetched_covers), 1)
+
+        CoverImage.objects.update(fetched_at=timezone.now() - timedelta(hours=2))
+        with self.assertLogs("books.covers", "WARNING"):
+            self.get_cover(book)
+        self.assertEqual(len(fetched_covers), 2)
+
+    def test_least_recently_used_covers_are_evicted_over_the_cap(self):
+        first, second, third = (self.book(f"https://covers.example.com/{i}.jpg") for i in range(3))
+        self.get_cover(first)
+        size = CoverImage.objects.get().size
+        self.get_cover(second)
+        # second has gone unused longest, so it is the one evicted
+        CoverImage.objects.filter(source_url=second.img_url).update(last_used_at=timezone.now() - timedelta(days=1))
+        with override_settings(COVER_CACHE_MAX_BYTES=2 * size):
+            self.get_cover(third)
+        cached = set(CoverImage.objects.values_list("source_url", flat=True))
+        self.assertEqual(cached, {first.img_url, third.img_url})
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp, "covers"))), 2)
+
+        self.assertEqual(self.get_cover(second).status_code, 200)
+        self.assertEqual(len(fetched_covers), 4)
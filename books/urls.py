@@ -4,6 +4,8 @@ from django.urls import path
 
 urlpatterns = [
     path("", views.books_view, name="books_view"),
+    path("page/", views.books_page, name="books_page"),
+    path("<int:book_id>/cover/<slug:key>.webp", views.book_cover, name="book_cover"),
     path("add_to_shelf/<int:book_id>/<str:status>/", views.add_to_shelf, name="add_to_shelf"),
     path("remove_from_shelf/<int:book_id>/<str:status>/", views.remove_from_shelf, name="remove_from_shelf"),
 ]
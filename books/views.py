@@ -1,22 +1,79 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Book
+from .models import Book, CoverImage, cover_key
 from users.models import UserBook
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponseBadRequest, HttpResponseRedirect
+from django.utils.http import quote_etag
+from mysite.files import serve_file, stream_file
+from mysite.pagination import InvalidCursor, keyset_paginate
+from .covers import cached_cover, touch
+from .search import book_index
+
+BOOKS_PAGE_SIZE = 24
+SEARCH_RESULTS_LIMIT = 20
+COVER_MAX_AGE = 365 * 24 * 60 * 60
+# Matches the book_browse_idx index; id breaks ties so cursors are stable
+BOOK_ORDERING = ["title", "author", "date_published", "id"]
+
+
+def get_books_page(cursor=None):
+    return keyset_paginate(Book.objects.all(), BOOK_ORDERING, cursor, BOOKS_PAGE_SIZE)
 
 
 def books_view(request):
-    books = Book.objects.all()
-    context = {"books": books, 
-               
-               "pma_flag": (
-                request.user.groups.filter(name="PMA").exists()
-                if request.user.is_authenticated
-                else False
-                ),
+    query = request.GET.get("q", "").strip()
+    if query:
+        # Ranked search hits replace the browse order; no further pages
+        books, next_cursor = book_index.results(query, limit=SEARCH_RESULTS_LIMIT), None
+    else:
+        try:
+            page = get_books_page(request.GET.get("cursor"))
+        except InvalidCursor:
+            page = get_books_page()
+        books, next_cursor = page.object_list, page.next_cursor
+    context = {"books": books,
+               "next_cursor": next_cursor,
+               "query": query,
                }
     return render(request, "books/books_view.html", context)
 
+
+def books_page(request):
+    # Infinite-scroll fragment: the next page of cards plus the next sentinel
+    try:
+        page = get_books_page(request.GET.get("cursor"))
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor")
+    context = {"books": page.object_list, "next_cursor": page.next_cursor}
+    return render(request, "books/book_cards.html", context)
+
+
+def book_cover(request, book_id, key):
+    # Cached covers are looked up by key alone; the book is only needed to fetch one
+    cover = CoverImage.objects.filter(key=key).exclude(name="").first()
+    if cover is None:
+        book = get_object_or_404(Book.objects.only("img_url"), pk=book_id)
+        if not book.img_url or cover_key(book.img_url) != key:
+            raise Http404("No such cover")
+        cover = cached_cover(book.img_url)
+        if not cover.name:
+            response = HttpResponseRedirect(book.img_url)
+            response["Cache-Control"] = f"public, max-age={settings.COVER_RETRY_AFTER}"
+            return response
+    else:
+        touch(cover)
+
+    if settings.FILE_DELIVERY in ("accel", "sendfile"):
+        response = serve_file(request, default_storage, cover.name)
+    else:
+        response = stream_file(request, default_storage, cover.name, etag=quote_etag(cover.key))
+    # The key changes with the source URL, so this URL always serves the same image
+    response["Cache-Control"] = f"public, max-age={COVER_MAX_AGE}, immutable"
+    return response
+
 @login_required
 def add_to_shelf(request, book_id, status):
     book = get_object_or_404(Book, id=book_id)
@@ -1,28 +1,11 @@
-import csv
+from django.core.management import call_command
 from books.models import Book
 
 
-def load_books():
-    csv_path = "books/books.csv"
-    with open(csv_path, "r") as csv_file:
-        reader = csv.reader(csv_file)
-        next(reader)
-        for row in reader:
-            book, created = Book.objects.get_or_create(
-                title=row[0],
-                author=row[1],
-                genre=row[2],
-                description=row[3],
-                publisher=row[4],
-                date_published=row[5],
-                img_url=row[6],
-                buy_link=row[7],
-            )
-            if created:
-                book.save()
-                print(f"{book.title} has been added to the DB.")
-            else:
-                print(f"{book.title} already exists in the DB. Skipping.")
+def load_books(csv_path="books/books.csv"):
+    # Kept for the shell workflow in the README; the import itself lives in
+    # the import_books management command.
+    call_command("import_books", csv_path)
 
 
 def delete_books():
@@ -0,0 +1,240 @@
+"""Two-tier cache backend and tag-based invalidation.
+
+TieredCache keeps a bounded in-process LRU in front of a shared cache
+(Redis when REDIS_URL is set, otherwise a file-based stand-in on the local
+host). Local copies live at most LOCAL_TIMEOUT seconds, which bounds how
+long one process can keep serving a value another process has replaced.
+
+Tagged entries remember the version each of their tags had when they were
+computed. invalidate_tags() gives tags new versions, so every entry that
+carries one of them misses from then on. Tags look like "review:12" or
+"genre:FICT"; the part before the colon is the tag family, and hits and
+misses are counted per family (see tag_stats()).
+"""
+import pickle
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+MISSING = object()
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._shared_alias = options.get("SHARED", "shared")
+        self._local_max_entries = options.get("LOCAL_MAX_ENTRIES", 5000)
+        self._local_timeout = options.get("LOCAL_TIMEOUT", 5)
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _timeout(self, timeout):
+        # Seconds (or None for no expiry); both tiers apply it themselves
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    # Local tier. Values are pickled, like LocMemCache, so callers can't
+    # mutate each other's copies.
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return MISSING
+            expires, pickled = entry
+            if expires <= time.monotonic():
+                del self._local[key]
+                return MISSING
+            self._local.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def _local_set(self, key, value, timeout):
+        ttl = self._local_timeout if timeout is None else min(timeout, self._local_timeout)
+        if ttl <= 0:
+            self._local_delete(key)
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[key] = (time.monotonic() + ttl, pickled)
+            self._local.move_to_end(key)
+            while len(self._local) > self._local_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, key):
+        with self._lock:
+            self._local.pop(key, None)
+
+    # BaseCache API
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version)
+        value = self._local_get(local_key)
+        if value is not MISSING:
+            return value
+        value = self.shared.get(key, MISSING, version)
+        if value is MISSING:
+            return default
+        self._local_set(local_key, value, self._local_timeout)
+        return value
+
+    def get_many(self, keys, version=None):
+        found, misses = {}, []
+        for key in keys:
+            value = self._local_get(self.make_and_validate_key(key, version))
+            if value is MISSING:
+                misses.append(key)
+            else:
+                found[key] = value
+        if misses:
+            shared = self.shared.get_many(misses, version)
+            for key, value in shared.items():
+                self._local_set(self.make_key(key, version), value, self._local_timeout)
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version)
+        timeout = self._timeout(timeout)
+        self.shared.set(key, value, timeout, version)
+        self._local_set(local_key, value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        failed = self.shared.set_many(data, timeout, version)
+        for key, value in data.items():
+            if key not in failed:
+                self._local_set(self.make_and_validate_key(key, version), value, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        added = self.shared.add(key, value, timeout, version)
+        if added:
+            self._local_set(self.make_and_validate_key(key, version), value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local_delete(self.make_and_validate_key(key, version))
+        return self.shared.touch(key, self._timeout(timeout), version)
+
+    def delete(self, key, version=None):
+        self._local_delete(self.make_and_validate_key(key, version))
+        return self.shared.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            self._local_delete(self.make_and_validate_key(key, version))
+        self.shared.delete_many(keys, version)
+
+    def has_key(self, key, version=None):
+        local_key = self.make_and_validate_key(key, version)
+        return self._local_get(local_key) is not MISSING or self.shared.has_key(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        self._local_delete(self.make_and_validate_key(key, version))
+        return self.shared.incr(key, delta, version)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
+
+
+# Tags
+
+_stats = defaultdict(Counter)
+_stats_lock = threading.Lock()
+
+
+def tag_family(tag):
+    return tag.split(":", 1)[0]
+
+
+def _count(tags, event):
+    with _stats_lock:
+        for family in {tag_family(tag) for tag in tags}:
+            _stats[family][event] += 1
+
+
+def tag_stats():
+    """Hit/miss/invalidation counts per tag family for this process."""
+    with _stats_lock:
+        return {family: dict(counts) for family, counts in _stats.items()}
+
+
+def _tag_key(tag):
+    return f"tag:{tag}"
+
+
+def tag_versions(tags):
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = cache.get_many(keys)
+    new = {key: uuid.uuid4().hex for key in keys if key not in found}
+    if new:
+        cache.set_many(new, None)
+        found.update(new)
+    return {tag: found[key] for key, tag in keys.items()}
+
+
+def get_tagged(key, tags, default=None):
+    entry = cache.get(key)
+    if entry is not None:
+        value, versions = entry
+        if tag_versions(versions) == versions:
+            _count(tags, "hits")
+            return value
+    _count(tags, "misses")
+    return default
+
+
+def get_or_set_tagged(key, tags, compute, timeout=DEFAULT_TIMEOUT):
+    """Return the cached value of ``key``, or store and return ``compute()``."""
+    value = get_tagged(key, tags, MISSING)
+    if value is MISSING:
+        # Versions are read before computing, so an invalidation that lands
+        # while compute() runs leaves the stored entry already stale
+        versions = tag_versions(tags)
+        value = compute()
+        set_tagged(key, value, versions, timeout)
+    return value
+
+
+def set_tagged(key, value, versions, timeout=DEFAULT_TIMEOUT):
+    """Store ``value`` under ``key``. ``versions`` come from tag_versions(),
+    called before ``value`` was computed."""
+    cache.set(key, (value, versions), timeout)
+
+
+def invalidate_tags(*tags):
+    if not tags:
+        return
+
+    def bump():
+        cache.set_many({_tag_key(tag): uuid.uuid4().hex for tag in tags}, None)
+
+    bump()
+    # Again after commit, in case a request cached data from before the write
+    transaction.on_commit(bump)
+    _count(tags, "invalidations")
+
+
+def register_tags(model, tags_for):
+    """Invalidate ``tags_for(instance)`` whenever ``model`` rows are saved or deleted."""
+
+    def receiver(sender, instance, **kwargs):
+        invalidate_tags(*tags_for(instance))
+
+    uid = f"cache-tags:{model._meta.label}"
+    post_save.connect(receiver, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(receiver, sender=model, weak=False, dispatch_uid=uid)
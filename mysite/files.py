@@ -0,0 +1,161 @@
+"""Serving stored files without tying up a worker for the transfer.
+
+serve_file() answers with whichever FILE_DELIVERY the deployment supports:
+
+* "redirect": a redirect to a signed URL that expires after
+  FILE_REDIRECT_LIFETIME seconds (S3 querystring auth, or
+  SignedFileSystemStorage). A storage that can't sign, such as a public
+  bucket, falls back to "django" with a warning rather than hand out a
+  permanent URL.
+* "accel": an empty response with X-Accel-Redirect for nginx, which serves
+  FILE_ACCEL_PREFIX + name from an ``internal`` location.
+* "sendfile": X-Sendfile with the file's path, for Apache/lighttpd.
+* "django": streamed by Django itself, with Range and ETag support.
+
+Front servers and S3 handle Range and conditional requests themselves in
+the other modes.
+"""
+import logging
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
+
+from .storage import url_lifetime
+
+BLOCK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+logger = logging.getLogger(__name__)
+
+
+def file_etag(storage, name):
+    """A strong ETag: the content hash for content-addressed (blob) names,
+    otherwise size and modification time."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    if name.startswith("blobs/") and re.fullmatch(r"[0-9a-f]{64}", stem):
+        return quote_etag(stem)
+    modified = storage.get_modified_time(name)
+    return quote_etag(f"{storage.size(name):x}-{int(modified.timestamp()):x}")
+
+
+def _requested_range(request, size, etag):
+    """(start, end) of a satisfiable single Range, None to send the whole
+    file, or False if the range can't be satisfied."""
+    header = request.headers.get("Range")
+    if not header:
+        return None
+    if_range = request.headers.get("If-Range")
+    if if_range and if_range != etag:
+        return None
+    # Multiple ranges are allowed to be answered with the whole file
+    match = RANGE_RE.match(header.replace(" ", ""))
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            block = file.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        file.close()
+
+
+def stream_file(request, storage, name, filename=None, etag=None):
+    """Stream ``name`` from ``storage``, honouring Range, If-Range and If-None-Match."""
+    if not storage.exists(name):
+        raise Http404("File not found")
+    etag = etag or file_etag(storage, name)
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponse(status=304)
+        response["ETag"] = etag
+        return response
+
+    size = storage.size(name)
+    requested = _requested_range(request, size, etag)
+    if requested is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+    elif requested is None:
+        response = FileResponse(storage.open(name, "rb"), content_type=content_type)
+        response["Content-Length"] = size
+    else:
+        start, end = requested
+        response = StreamingHttpResponse(
+            _read(storage.open(name, "rb"), start, end - start + 1),
+            status=206, content_type=content_type,
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = end - start + 1
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    if filename:
+        response["Content-Disposition"] = _disposition(filename)
+    return response
+
+
+def _disposition(filename):
+    return f"inline; filename*=UTF-8''{quote(filename)}"
+
+
+def serve_file(request, storage, name, filename=None):
+    """Hand the transfer of ``name`` off as FILE_DELIVERY says (see above).
+    Callers check access first; every mode keeps the file's address private
+    or short-lived."""
+    delivery = settings.FILE_DELIVERY
+    if delivery == "redirect":
+        if url_lifetime(storage) is not None:
+            response = HttpResponseRedirect(storage.url(name, expire=settings.FILE_REDIRECT_LIFETIME))
+            # The redirect must not outlive the URL it points to
+            response["Cache-Control"] = "private, no-store"
+            return response
+        logger.warning(
+            "FILE_DELIVERY is 'redirect' but %s doesn't sign URLs; streaming %s instead",
+            type(storage).__name__, name,
+        )
+    if delivery == "accel":
+        response = HttpResponse(content_type=mimetypes.guess_type(name)[0] or "application/octet-stream")
+        response["X-Accel-Redirect"] = settings.FILE_ACCEL_PREFIX + quote(name)
+    elif delivery == "sendfile":
+        response = HttpResponse(content_type=mimetypes.guess_type(name)[0] or "application/octet-stream")
+        response["X-Sendfile"] = storage.path(name)
+    else:
+        return stream_file(request, storage, name, filename)
+    if filename:
+        response["Content-Disposition"] = _disposition(filename)
+    return response
+
+
+def serve_media(request, path):
+    """MEDIA_URL for local storage: signed URLs are checked and served by
+    Django (range-capable), and unsigned ones only when DEBUG is on."""
+    storage = default_storage
+    verify = getattr(storage, "verify", None)
+    if verify is not None:
+        if not verify(path, request.GET.get("expires"), request.GET.get("signature", "")):
+            raise Http404("File not found")
+    elif not settings.DEBUG:
+        raise Http404("File not found")
+    return stream_file(request, storage, path)
@@ -0,0 +1,303 @@
+"""Request, database, template and cache metrics in Prometheus format.
+
+MetricsMiddleware records, per URL name, a latency histogram and the
+number and total time of database queries (through
+connection.execute_wrapper). InstrumentedTemplates times each template
+rendered through the template backend, and the tagged cache's hit, miss
+and invalidation counts (mysite.cache.tag_stats) are exported as well.
+
+Each process keeps its own cumulative counts and writes them to
+METRICS_DIR/<pid>-<token>.json at most every METRICS_FLUSH_INTERVAL
+seconds. The metrics view adds up the files of all processes on the host,
+so the gunicorn workers report as one. Files left by processes that have
+exited are folded into archive.json, so their counts aren't lost when a
+worker is recycled.
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, HttpResponse
+from django.template.backends.django import DjangoTemplates
+from django.utils.crypto import constant_time_compare
+
+from .cache import tag_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# name: (type, help, buckets)
+METRICS = {
+    "http_request_duration_seconds": (
+        "histogram", "Time from request to response, by view.", LATENCY_BUCKETS,
+    ),
+    "db_queries_per_request": (
+        "histogram", "Database queries run while handling a request, by view.", QUERY_BUCKETS,
+    ),
+    "db_query_duration_seconds_total": (
+        "counter", "Time spent in database queries, by view.", None,
+    ),
+    "template_render_duration_seconds": (
+        "histogram", "Time to render a template, including what it includes, by template.", LATENCY_BUCKETS,
+    ),
+    "cache_tag_events_total": (
+        "counter", "Tagged cache hits, misses and invalidations, by tag family.", None,
+    ),
+}
+
+ARCHIVE = "archive.json"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _key(labels):
+    return json.dumps(sorted(labels.items()))
+
+
+class Registry:
+    """This process's cumulative counts: for counters a value per label
+    set, for histograms per-bucket counts (the last one +Inf) and a sum."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(dict)
+        self._token = uuid.uuid4().hex[:8]
+        self._flushed_at = 0.0
+
+    def increment(self, name, amount=1, **labels):
+        key = _key(labels)
+        with self._lock:
+            samples = self._samples[name]
+            samples[key] = samples.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = _key(labels)
+        index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+        with self._lock:
+            samples = self._samples[name]
+            counts = samples.get(key)
+            if counts is None:
+                counts = samples[key] = [0] * (len(buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            data = {name: {key: list(value) if isinstance(value, list) else value
+                           for key, value in samples.items()}
+                    for name, samples in self._samples.items()}
+        data["cache_tag_events_total"] = {
+            _key({"family": family, "event": event}): count
+            for family, counts in tag_stats().items()
+            for event, count in counts.items()
+        }
+        return data
+
+    @property
+    def path(self):
+        return os.path.join(settings.METRICS_DIR, f"{os.getpid()}-{self._token}.json")
+
+    def flush(self, force=False):
+        """Write this process's counts for the metrics view to collect."""
+        now = time.monotonic()
+        if not force and now - self._flushed_at < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self._flushed_at = now
+        _write(self.path, self.snapshot())
+
+
+registry = Registry()
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = f"{path}.{threading.get_ident()}.tmp"
+    with open(temp, "w") as f:
+        json.dump(data, f)
+    os.replace(temp, path)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _merge(total, data):
+    for name, samples in data.items():
+        merged = total.setdefault(name, {})
+        for key, value in samples.items():
+            if isinstance(value, list):
+                current = merged.get(key) or [0] * len(value)
+                merged[key] = [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return total
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def _locked(directory):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def collect():
+    """The counts of every process on this host, added up."""
+    registry.flush(force=True)
+    directory = settings.METRICS_DIR
+    with _locked(directory):
+        archive = _read(os.path.join(directory, ARCHIVE))
+        total = _merge({}, archive)
+        archived = False
+        for filename in os.listdir(directory):
+            if not filename.endswith(".json") or filename == ARCHIVE:
+                continue
+            path = os.path.join(directory, filename)
+            data = _read(path)
+            _merge(total, data)
+            pid = int(filename.split("-", 1)[0])
+            if not _alive(pid):
+                _merge(archive, data)
+                os.remove(path)
+                archived = True
+        if archived:
+            _write(os.path.join(directory, ARCHIVE), archive)
+    return total
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(key, **extra):
+    pairs = json.loads(key) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def render(samples):
+    """Prometheus text exposition of ``samples`` as collect() returns them."""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, value in sorted(samples.get(name, {}).items()):
+            if kind == "counter":
+                lines.append(f"{name}{_labels(key)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, "+Inf"), value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(key, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(key)} {value[-1]}")
+            lines.append(f"{name}_count{_labels(key)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    # Internal: needs the METRICS_TOKEN bearer token, unless the deployment
+    # opted its scraper's address into METRICS_ALLOWED_IPS. Behind a reverse
+    # proxy every request comes from the proxy's address, so that is off by
+    # default.
+    token = settings.METRICS_TOKEN
+    authorized = request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS or (
+        token and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}")
+    )
+    if not authorized:
+        raise Http404()
+    return HttpResponse(render(collect()), content_type=CONTENT_TYPE)
+
+
+class QueryTimer:
+    """An execute_wrapper that counts queries and the time they take."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Records latency and database use per URL name. Goes first in
+    MIDDLEWARE so the time spent in the other middleware counts too."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        registry.observe(
+            "http_request_duration_seconds", elapsed,
+            view=view, method=request.method, status=response.status_code,
+        )
+        registry.observe("db_queries_per_request", queries.count, view=view)
+        registry.increment("db_query_duration_seconds_total", queries.duration, view=view)
+        registry.flush()
+        return response
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            registry.observe(
+                "template_render_duration_seconds", time.perf_counter() - started,
+                template=self.template.origin.template_name or "<string>",
+            )
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """DjangoTemplates whose templates report their render time."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,445 @@
+"""Full-text search indexes kept in sync by database triggers.
+
+Each FullTextIndex mirrors some text columns of a model into a side table:
+an FTS5 virtual table on SQLite, or a table of GIN-indexed tsvectors on
+Postgres. Triggers on the source table keep the side table current, so
+every write path -- save(), bulk_create(), upserts, raw SQL -- is indexed
+without signal handlers. Apps declare their indexes in a ``search`` module;
+``manage.py rebuild_search_index`` reinstalls all of them.
+"""
+import re
+from collections import namedtuple
+
+from django.core.exceptions import EmptyResultSet
+from django.db import NotSupportedError, connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+# Column weight classes, as in Postgres setweight(); mapped to bm25 weights on SQLite
+BM25_WEIGHTS = {"A": 10.0, "B": 4.0, "C": 2.0, "D": 1.0}
+MAX_QUERY_TERMS = 10
+# Queries matching more rows than this skip bm25 ranking (see SQLiteBackend.plan)
+BROAD_QUERY_THRESHOLD = 5000
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has he in is it its of on or she that the "
+    "their they this to was were will with".split()
+)
+
+# Control characters can't appear in the indexed text, so they are safe
+# highlight markers to swap for <mark> after escaping
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_STOP = "\x03"
+
+SearchHit = namedtuple("SearchHit", ["pk", "rank", "snippet"])
+
+registry = {}
+
+
+def query_terms(query):
+    # Letters/digits only: both FTS5 and to_tsquery treat everything else as syntax
+    terms = re.findall(r"[^\W_]+", (query or "").casefold())[:MAX_QUERY_TERMS]
+    # Stopwords match nearly every row and carry no ranking signal
+    return [term for term in terms if term not in STOPWORDS] or terms
+
+
+def highlight(raw):
+    html = escape(raw or "")
+    return mark_safe(
+        html.replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_STOP, "</mark>")
+    )
+
+
+class FullTextIndex:
+    def __init__(self, name, model, columns, config="english"):
+        """``columns`` maps source column names to weight classes A-D."""
+        self.name = name
+        self.model = model
+        self.columns = dict(columns)
+        self.config = config
+        registry[name] = self
+
+    @property
+    def source_table(self):
+        return self.model._meta.db_table
+
+    @property
+    def pk_column(self):
+        return self.model._meta.pk.column
+
+    def _backend(self, conn=None):
+        vendor = (conn or connection).vendor
+        if vendor == "sqlite":
+            return SQLiteBackend(self)
+        if vendor == "postgresql":
+            return PostgresBackend(self)
+        raise NotSupportedError(f"Full-text search is not supported on {vendor}")
+
+    # rebuild_search_index uses these; migrations run a frozen copy of the
+    # SQL instead (see execute_frozen)
+
+    def install(self, apps=None, schema_editor=None):
+        conn = schema_editor.connection if schema_editor else connection
+        backend = self._backend(conn)
+        with conn.cursor() as cursor:
+            for sql in backend.drop_sql() + backend.create_sql():
+                cursor.execute(sql)
+
+    def uninstall(self, apps=None, schema_editor=None):
+        conn = schema_editor.connection if schema_editor else connection
+        with conn.cursor() as cursor:
+            for sql in self._backend(conn).drop_sql():
+                cursor.execute(sql)
+
+    def rebuild(self):
+        self.install()
+
+    def missing_triggers(self, conn=None):
+        """Names of the sync triggers that aren't installed, e.g. because a
+        migration remade the source table without restoring them."""
+        conn = conn or connection
+        backend = self._backend(conn)
+        with conn.cursor() as cursor:
+            installed = backend.installed_triggers(cursor)
+        return sorted(set(backend.trigger_names()) - installed)
+
+    def restore_triggers(self, apps=None, schema_editor=None):
+        """Recreate the sync triggers, e.g. after ``manage.py migrate`` ran a
+        migration that rebuilt the source table without restoring them
+        (SQLite does this for most AddField/AlterField operations). New
+        migrations freeze trigger_sql() with execute_frozen() instead."""
+        conn = schema_editor.connection if schema_editor else connection
+        with conn.cursor() as cursor:
+            for sql in self._backend(conn).trigger_sql():
+                cursor.execute(sql)
+
+    @property
+    def top_columns(self):
+        best = min(self.columns.values())
+        return [column for column, weight in self.columns.items() if weight == best]
+
+    def search(self, query, limit=20, offset=0, within=None):
+        """Return SearchHits for ``query``, best first.
+
+        Every term must match; the last one also matches as a prefix. Results
+        are ranked by weighted relevance, except for very broad queries (more
+        than BROAD_QUERY_THRESHOLD matches) where ranking every match costs too
+        much: those return matches in the top-weighted columns, newest first,
+        with a rank of 0. Pass a queryset as ``within`` to only search the
+        rows whose primary key it selects; it runs as a subquery of the
+        search rather than as a list of keys.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        restrict = None
+        if within is not None:
+            try:
+                restrict = within.values("pk").query.sql_with_params()
+            except EmptyResultSet:
+                return []
+        return self._backend().search(terms, limit, offset, restrict)
+
+    def results(self, query, queryset=None, limit=20, offset=0):
+        """Return model instances for the hits, with ``search_rank`` and
+        ``search_snippet`` attributes, in rank order."""
+        if queryset is None:
+            queryset = self.model._default_manager.all()
+        return hit_objects(self.search(query, limit, offset), queryset)
+
+
+def execute_frozen(schema_editor, statements):
+    """Run SQL that a migration has frozen per database vendor.
+
+    Migrations keep a copy of the statements an index generated when they
+    were written (``statements`` maps a vendor to a list), so later changes
+    to the index definitions or to this module can't rewrite history. Any
+    migration that makes SQLite remake an indexed table has to restore the
+    triggers this way; SearchTriggerTests fails when one doesn't.
+    """
+    conn = schema_editor.connection
+    if conn.vendor not in statements:
+        raise NotSupportedError(f"Full-text search is not supported on {conn.vendor}")
+    with conn.cursor() as cursor:
+        for sql in statements[conn.vendor]:
+            cursor.execute(sql)
+
+
+def hit_objects(hits, queryset):
+    """The rows of ``queryset`` for ``hits``, in hit order, with
+    ``search_rank`` and ``search_snippet`` attributes."""
+    objects = queryset.in_bulk([hit.pk for hit in hits])
+    results = []
+    for hit in hits:
+        obj = objects.get(hit.pk)
+        if obj is None:
+            continue
+        obj.search_rank = hit.rank
+        obj.search_snippet = highlight(hit.snippet)
+        results.append(obj)
+    return results
+
+
+def search_all(indexes, query, limit=20, offset=0, within=None):
+    """SearchHits for ``query`` across ``indexes`` whose rows share primary
+    keys (say a model's index and one over a one-to-one side table).
+
+    Each index is searched on its own, so all terms must match within one
+    of them. A key found by several indexes keeps its best rank and the
+    snippet of the first index listed that found it. ``within`` maps an
+    index to a queryset of the keys it may return (see
+    FullTextIndex.search); the others
+    search every row. Every index has to return ``offset + limit`` hits to
+    merge a page, so keep pages shallow.
+    """
+    within = within or {}
+    best = {}
+    for index in indexes:
+        for hit in index.search(query, limit + offset, within=within.get(index)):
+            current = best.get(hit.pk)
+            if current is None:
+                best[hit.pk] = hit
+            elif hit.rank > current.rank:
+                best[hit.pk] = hit._replace(snippet=current.snippet)
+    # A stable sort keeps each index's own order among equal ranks, so pages
+    # of a single-index result line up with that index's pages
+    hits = sorted(best.values(), key=lambda hit: -hit.rank)
+    return hits[offset:offset + limit]
+
+
+class SQLiteBackend:
+    def __init__(self, index):
+        self.index = index
+
+    def _row(self, alias):
+        return ", ".join(f"{alias}.{column}" for column in self.index.columns)
+
+    def drop_sql(self):
+        name = self.index.name
+        return [
+            f"DROP TRIGGER IF EXISTS {name}_ai",
+            f"DROP TRIGGER IF EXISTS {name}_ad",
+            f"DROP TRIGGER IF EXISTS {name}_au",
+            f"DROP TABLE IF EXISTS {name}",
+        ]
+
+    def _create_triggers_sql(self):
+        name, source, pk = self.index.name, self.index.source_table, self.index.pk_column
+        columns = ", ".join(self.index.columns)
+        insert_new = f"INSERT INTO {name}(rowid, {columns}) VALUES (new.{pk}, {self._row('new')});"
+        delete_old = f"DELETE FROM {name} WHERE rowid = old.{pk};"
+        return [
+            f"CREATE TRIGGER {name}_ai AFTER INSERT ON {source} BEGIN {insert_new} END",
+            f"CREATE TRIGGER {name}_ad AFTER DELETE ON {source} BEGIN {delete_old} END",
+            # Only reindex when an indexed column changes
+            f"CREATE TRIGGER {name}_au AFTER UPDATE OF {columns} ON {source} "
+            f"BEGIN {delete_old} {insert_new} END",
+        ]
+
+    def create_sql(self):
+        name, source, pk = self.index.name, self.index.source_table, self.index.pk_column
+        columns = ", ".join(self.index.columns)
+        return [
+            # Prefix indexes keep short "term*" queries from merging many doclists
+            f"CREATE VIRTUAL TABLE {name} USING fts5({columns}, "
+            f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+            *self._create_triggers_sql(),
+            f"INSERT INTO {name}(rowid, {columns}) SELECT {pk}, {columns} FROM {source}",
+        ]
+
+    def trigger_sql(self):
+        # Table remakes keep the rowids, so the FTS rows are still valid
+        return self.drop_sql()[:3] + self._create_triggers_sql()
+
+    def trigger_names(self):
+        return [f"{self.index.name}_{suffix}" for suffix in ("ai", "ad", "au")]
+
+    def installed_triggers(self, cursor):
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+            [self.index.source_table],
+        )
+        return {name for name, in cursor.fetchall()}
+
+    def _match(self, terms, prefix):
+        match = " ".join(f'"{term}"' for term in terms)
+        return match + "*" if prefix else match
+
+    def _is_broad(self, cursor, match):
+        name = self.index.name
+        cursor.execute(
+            f"SELECT count(*) FROM (SELECT rowid FROM {name} WHERE {name} MATCH %s LIMIT %s)",
+            [match, BROAD_QUERY_THRESHOLD + 1],
+        )
+        return cursor.fetchone()[0] > BROAD_QUERY_THRESHOLD
+
+    def plan(self, cursor, terms):
+        """Return (match expression, ranked) for ``terms``.
+
+        bm25 needs every matching row's term statistics, so its cost grows
+        with the number of matches. Probing with a LIMIT is cheap, so broad
+        queries are detected first and narrowed to the top-weighted columns
+        instead of ranked. The exact-term probe runs before the prefix one
+        because a prefix of a common word merges many large doclists.
+        """
+        name = self.index.name
+        for prefix in (False, True):
+            match = self._match(terms, prefix)
+            if self._is_broad(cursor, match):
+                narrowed = "{%s}: (%s)" % (" ".join(self.index.top_columns), match)
+                cursor.execute(f"SELECT 1 FROM {name} WHERE {name} MATCH %s LIMIT 1", [narrowed])
+                return (narrowed if cursor.fetchone() else match), False
+        return match, True
+
+    def search(self, terms, limit, offset, restrict=None):
+        """``restrict``, if given, is the (sql, params) of a subquery
+        selecting the rowids that may match."""
+        name = self.index.name
+        weights = ", ".join(str(BM25_WEIGHTS[w]) for w in self.index.columns.values())
+        restrict_sql, restrict_params = "", []
+        if restrict is not None:
+            restrict_sql, restrict_params = f" AND rowid IN ({restrict[0]})", list(restrict[1])
+        with connection.cursor() as cursor:
+            match, ranked = self.plan(cursor, terms)
+            if ranked:
+                sql = (
+                    f"SELECT rowid, bm25({name}, {weights}) AS rank FROM {name} "
+                    f"WHERE {name} MATCH %s{restrict_sql} ORDER BY rank LIMIT %s OFFSET %s"
+                )
+            else:
+                sql = (
+                    f"SELECT rowid, 0.0 FROM {name} WHERE {name} MATCH %s{restrict_sql} "
+                    f"ORDER BY rowid DESC LIMIT %s OFFSET %s"
+                )
+            cursor.execute(sql, [match, *restrict_params, limit, offset])
+            page = cursor.fetchall()
+            if not page:
+                return []
+            # SQLite computes result columns before sorting, so snippets are
+            # fetched for the page only rather than for every match
+            placeholders = ", ".join(["%s"] * len(page))
+            cursor.execute(
+                f"SELECT rowid, snippet({name}, -1, %s, %s, '…', 16) FROM {name} "
+                f"WHERE {name} MATCH %s AND rowid IN ({placeholders})",
+                [HIGHLIGHT_START, HIGHLIGHT_STOP, match, *(pk for pk, _ in page)],
+            )
+            snippets = dict(cursor.fetchall())
+        # bm25 is "lower is better"; flip it so higher rank is better on both backends
+        return [SearchHit(pk, -rank, snippets.get(pk, "")) for pk, rank in page]
+
+
+class PostgresBackend:
+    def __init__(self, index):
+        self.index = index
+
+    def _vector(self, alias):
+        config = self.index.config
+        return " || ".join(
+            f"setweight(to_tsvector('{config}', coalesce({alias}.{column}::text, '')), '{weight}')"
+            for column, weight in self.index.columns.items()
+        )
+
+    def drop_sql(self):
+        name, source = self.index.name, self.index.source_table
+        return [
+            f"DROP TRIGGER IF EXISTS {name}_sync ON {source}",
+            f"DROP FUNCTION IF EXISTS {name}_sync()",
+            f"DROP TABLE IF EXISTS {name}",
+        ]
+
+    def create_sql(self):
+        name, source, pk = self.index.name, self.index.source_table, self.index.pk_column
+        columns = ", ".join(self.index.columns)
+        return [
+            f"CREATE TABLE {name} (rowid bigint PRIMARY KEY, document tsvector NOT NULL)",
+            f"CREATE INDEX {name}_document_idx ON {name} USING GIN (document)",
+            f"""CREATE FUNCTION {name}_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    DELETE FROM {name} WHERE rowid = OLD.{pk};
+                    RETURN OLD;
+                END IF;
+                INSERT INTO {name} (rowid, document) VALUES (NEW.{pk}, {self._vector('NEW')})
+                ON CONFLICT (rowid) DO UPDATE SET document = EXCLUDED.document;
+                RETURN NEW;
+            END
+            $$""",
+            f"CREATE TRIGGER {name}_sync AFTER INSERT OR DELETE OR UPDATE OF {columns} "
+            f"ON {source} FOR EACH ROW EXECUTE FUNCTION {name}_sync()",
+            f"INSERT INTO {name} (rowid, document) SELECT {pk}, {self._vector(source)} FROM {source}",
+        ]
+
+    def trigger_sql(self):
+        # ALTER TABLE keeps triggers on Postgres
+        return []
+
+    def trigger_names(self):
+        return [f"{self.index.name}_sync"]
+
+    def installed_triggers(self, cursor):
+        cursor.execute(
+            "SELECT tgname FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal",
+            [self.index.source_table],
+        )
+        return {name for name, in cursor.fetchall()}
+
+    def _tsquery(self, terms, prefix, weights=""):
+        labels = [weights] * len(terms)
+        if prefix:
+            labels[-1] = "*" + weights
+        return " & ".join(
+            f"{term}:{label}" if label else term for term, label in zip(terms, labels)
+        )
+
+    def _is_broad(self, cursor, tsquery):
+        cursor.execute(
+            f"SELECT count(*) FROM (SELECT 1 FROM {self.index.name} "
+            f"WHERE document @@ to_tsquery('{self.index.config}', %s) LIMIT %s) probe",
+            [tsquery, BROAD_QUERY_THRESHOLD + 1],
+        )
+        return cursor.fetchone()[0] > BROAD_QUERY_THRESHOLD
+
+    def plan(self, cursor, terms):
+        # Same strategy as SQLiteBackend.plan, narrowing with tsquery weight labels
+        top_weight = min(self.index.columns.values())
+        for prefix in (False, True):
+            tsquery = self._tsquery(terms, prefix)
+            if self._is_broad(cursor, tsquery):
+                narrowed = self._tsquery(terms, prefix, top_weight)
+                cursor.execute(
+                    f"SELECT 1 FROM {self.index.name} "
+                    f"WHERE document @@ to_tsquery('{self.index.config}', %s) LIMIT 1",
+                    [narrowed],
+                )
+                return (narrowed if cursor.fetchone() else tsquery), False
+        return tsquery, True
+
+    def search(self, terms, limit, offset, restrict=None):
+        # restrict as for SQLiteBackend.search
+        name, source, pk = self.index.name, self.index.source_table, self.index.pk_column
+        config = self.index.config
+        text = " || ' · ' || ".join(
+            f"coalesce({source}.{column}::text, '')" for column in self.index.columns
+        )
+        options = (
+            f'StartSel="{HIGHLIGHT_START}", StopSel="{HIGHLIGHT_STOP}", '
+            f'MaxWords=24, MinWords=8, MaxFragments=1, FragmentDelimiter=" … "'
+        )
+        with connection.cursor() as cursor:
+            tsquery, ranked = self.plan(cursor, terms)
+            rank = "ts_rank_cd(s.document, q)" if ranked else "0.0"
+            order = "rank DESC, s.rowid" if ranked else "s.rowid DESC"
+            restrict_sql, restrict_params = "", []
+            if restrict is not None:
+                restrict_sql, restrict_params = f" AND s.rowid IN ({restrict[0]})", list(restrict[1])
+            # Rank inside the subquery so ts_headline only runs on the returned page
+            cursor.execute(
+                f"SELECT hits.rowid, hits.rank, ts_headline('{config}', {text}, hits.query, %s) "
+                f"FROM (SELECT s.rowid, {rank} AS rank, q AS query "
+                f"      FROM {name} s, to_tsquery('{config}', %s) q "
+                f"      WHERE s.document @@ q{restrict_sql} ORDER BY {order} LIMIT %s OFFSET %s) hits "
+                f"JOIN {source} ON {source}.{pk} = hits.rowid "
+                f"ORDER BY hits.rank DESC, hits.rowid{'' if ranked else ' DESC'}",
+                [options, tsquery, *restrict_params, limit, offset],
+            )
+            return [SearchHit(*row) for row in cursor.fetchall()]
@@ -11,9 +11,10 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import dj_database_url
 import os, socket
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -88,6 +89,7 @@ SOCIALACCOUNT_PROVIDERS = {
 #         }
 
 MIDDLEWARE = [
+    "mysite.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -103,7 +105,8 @@ ROOT_URLCONF = "mysite.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates, timed for the metrics
+        "BACKEND": "mysite.metrics.InstrumentedTemplates",
         "DIRS": [],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -112,6 +115,8 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "users.context_processors.user_roles",
+                "users.context_processors.login_url",
             ],
         },
     },
@@ -142,6 +147,34 @@ if "DATABASE_URL" in os.environ:
     DATABASES["default"] = dj_database_url.config(conn_max_age=600, ssl_require=True)
 
 
+# Cache
+# An in-process LRU (mysite.cache.TieredCache) in front of a shared tier:
+# Redis when REDIS_URL is set, otherwise files shared by the workers on this host.
+
+REDIS_URL = config("REDIS_URL", default="")
+
+CACHES = {
+    "default": {
+        "BACKEND": "mysite.cache.TieredCache",
+        "TIMEOUT": 15 * 60,
+        "OPTIONS": {"SHARED": "shared", "LOCAL_MAX_ENTRIES": 5000, "LOCAL_TIMEOUT": 5},
+    },
+    "shared": (
+        {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL}
+        if REDIS_URL
+        else {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": config(
+                "CACHE_DIR", default=os.path.join(tempfile.gettempdir(), "bookinit-cache")
+            ),
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    ),
+}
+
+TEST_RUNNER = "mysite.test_runner.TestRunner"
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -208,14 +241,84 @@ AWS_S3_FILE_OVERWRITE = False
 # Static files are for CSS and JS file management
 
 STORAGES = {
+    # Media is private: attachments and their previews are only for members
+    # of a review, so objects aren't public-read and every URL is signed and
+    # expires (mysite.storage.url_lifetime). The custom domain is left out
+    # because S3 can't sign URLs on it without CloudFront.
     "default": {
-        "BACKEND": "storages.backends.s3boto3.S3StaticStorage",
+        "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
+        "OPTIONS": {
+            "default_acl": "private",
+            "querystring_auth": True,
+            "querystring_expire": 60 * 60,
+            "custom_domain": None,
+        },
     },
     "staticfiles": {
         "BACKEND": "storages.backends.s3boto3.S3StaticStorage",
     },
 }
 
+# MEDIA_STORAGE=local keeps media under MEDIA_ROOT, with signed, expiring
+# URLs like private S3 (see mysite/storage.py)
+if config("MEDIA_STORAGE", default="s3") == "local":
+    STORAGES["default"] = {"BACKEND": "mysite.storage.SignedFileSystemStorage"}
+
+# Resumable attachment uploads (reviews.uploads): chunks are staged on local
+# disk, and sessions left unfinished are removed by clear_stale_uploads
+UPLOAD_STAGING_DIR = config(
+    "UPLOAD_STAGING_DIR", default=os.path.join(tempfile.gettempdir(), "bookinit-uploads")
+)
+UPLOAD_MAX_SIZE = 100 * 1024 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_SESSION_MAX_AGE = 24 * 60 * 60
+
+# Attachments and profile images are stored once per distinct content
+# (reviews.blobs), hashed as they are uploaded. An unreferenced blob is kept
+# for BLOB_GC_GRACE seconds after an upload last used it
+FILE_UPLOAD_HANDLERS = [
+    "reviews.blobs.HashingMemoryFileUploadHandler",
+    "reviews.blobs.HashingTemporaryFileUploadHandler",
+]
+BLOB_GC_GRACE = 10 * 60
+
+# Threads per process for attachment previews and text extraction
+# (reviews.background); 0 runs them inline, right after the review is saved
+ATTACHMENT_WORKERS = config("ATTACHMENT_WORKERS", default=2, cast=int)
+# Characters of attachment text kept for search (reviews.extraction)
+ATTACHMENT_TEXT_MAX_CHARS = 200_000
+
+# How attachment downloads are handed off once access is checked
+# (mysite.files): "redirect" to a signed URL valid for FILE_REDIRECT_LIFETIME
+# seconds, "accel" (nginx X-Accel-Redirect to FILE_ACCEL_PREFIX + name),
+# "sendfile" (X-Sendfile), or "django" to stream it from the app
+FILE_DELIVERY = config("FILE_DELIVERY", default="redirect")
+FILE_REDIRECT_LIFETIME = 60
+FILE_ACCEL_PREFIX = config("FILE_ACCEL_PREFIX", default="/protected-media/")
+
+# Cached attachment URLs are served with at least this long left before they
+# expire; keep it above the review card cache timeout (10 minutes)
+ATTACHMENT_URL_MIN_LIFETIME = 20 * 60
+
+# Book covers are fetched once through COVER_FETCHER and served as
+# thumbnails from our storage (books.covers), least recently used ones
+# evicted beyond COVER_CACHE_MAX_BYTES
+COVER_FETCHER = "books.covers.fetch_url"
+COVER_CACHE_MAX_BYTES = config("COVER_CACHE_MAX_BYTES", default=500 * 1024 * 1024, cast=int)
+COVER_FETCH_TIMEOUT = 10
+COVER_MAX_SOURCE_BYTES = 10 * 1024 * 1024
+COVER_RETRY_AFTER = 60 * 60
+
+# Prometheus metrics (mysite.metrics) at /metrics, for requests bearing
+# METRICS_TOKEN; with no token set it is closed. METRICS_ALLOWED_IPS lets
+# addresses in without the token, so leave it empty behind a reverse proxy
+# on the same host. Workers on a host share counts through files in
+# METRICS_DIR, written at most every METRICS_FLUSH_INTERVAL seconds.
+METRICS_DIR = config("METRICS_DIR", default=os.path.join(tempfile.gettempdir(), "bookinit-metrics"))
+METRICS_FLUSH_INTERVAL = 5
+METRICS_ALLOWED_IPS = config("METRICS_ALLOWED_IPS", default="", cast=Csv())
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+
 # Tools for Google OAUTH 2.0
 
 AUTHENTICATION_BACKENDS = (
@@ -223,6 +326,10 @@ AUTHENTICATION_BACKENDS = (
     "allauth.account.auth_backends.AuthenticationBackend",
 )
 
+# In-memory "did you mean" and autocomplete indexes are rebuilt this often per process
+SUGGESTIONS_REBUILD_SECONDS = config("SUGGESTIONS_REBUILD_SECONDS", default=15 * 60, cast=int)
+AUTOCOMPLETE_REBUILD_SECONDS = config("AUTOCOMPLETE_REBUILD_SECONDS", default=15 * 60, cast=int)
+
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
 
@@ -0,0 +1,51 @@
+"""Test runner that keeps cached data from leaking between tests.
+
+The run gets its own shared cache and metrics directories, and every
+cache is cleared before each test: database changes are rolled back
+between tests, but cache entries computed from them would otherwise
+survive.
+"""
+import shutil
+import tempfile
+import unittest
+
+from django.core.cache import caches
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class CacheClearingResult:
+    """Mixed into whichever result class the run uses (--debug-sql and
+    --pdb pick their own)."""
+
+    def startTest(self, test):
+        for cache in caches.all():
+            cache.clear()
+        super().startTest(test)
+
+
+class TestRunner(DiscoverRunner):
+    def get_resultclass(self):
+        base = super().get_resultclass() or unittest.TextTestResult
+        return type(f"CacheClearing{base.__name__}", (CacheClearingResult, base), {})
+
+    def setup_test_environment(self, **kwargs):
+        from django.conf import settings
+
+        super().setup_test_environment(**kwargs)
+        self.cache_dir = tempfile.mkdtemp(prefix="bookinit-test-cache-")
+        shared = {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": self.cache_dir,
+        }
+        self.metrics_dir = tempfile.mkdtemp(prefix="bookinit-test-metrics-")
+        self.cache_settings = override_settings(
+            CACHES={**settings.CACHES, "shared": shared}, METRICS_DIR=self.metrics_dir
+        )
+        self.cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_settings.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        shutil.rmtree(self.metrics_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -15,10 +15,14 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from django.urls import path
 
+from mysite.files import serve_media
+from mysite.metrics import metrics_view
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -26,4 +30,7 @@ urlpatterns = [
     path("", include("users.urls")),
     path("reviews/", include("reviews.urls")),
     path("books/", include("books.urls")),
+    path("metrics", metrics_view, name="metrics"),
+    # Local media storage only; S3 serves its own URLs
+    path(settings.MEDIA_URL.lstrip("/") + "<path:path>", serve_media, name="media"),
 ]
@@ -0,0 +1,89 @@
+"""Cached URLs for review attachments.
+
+Storages that hand out expiring (querystring auth) URLs sign every one
+of them. Signed URLs are cached per file name until ATTACHMENT_URL_MIN_LIFETIME
+before they expire, so any URL served from the cache, or baked into a
+cached review card, still has at least that long to live. Plain URLs are
+just built, once per review per request.
+
+prefetch_attachment_urls() groups a page of reviews so that the first
+card to need its URL resolves the whole page in one cache round trip
+(and one more to store whatever had to be generated).
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from mysite.storage import url_lifetime
+
+
+def _cache_key(name):
+    return "attachment-url:" + hashlib.md5(name.encode()).hexdigest()
+
+
+def attachment_urls(files):
+    """Map the name of each FieldFile in ``files`` to its URL."""
+    files = {file.name: file for file in files if file}
+    if not files:
+        return {}
+    storage = next(iter(files.values())).storage
+    lifetime = url_lifetime(storage)
+    if lifetime is None:
+        # Plain URLs cost less to build than to fetch from the cache
+        return {name: storage.url(name) for name in files}
+
+    keys = {_cache_key(name): name for name in files}
+    urls = {keys[key]: url for key, url in cache.get_many(keys).items()}
+    generated = {name: storage.url(name) for name in files if name not in urls}
+    timeout = lifetime - settings.ATTACHMENT_URL_MIN_LIFETIME
+    if generated and timeout > 0:
+        cache.set_many({_cache_key(name): url for name, url in generated.items()}, timeout)
+    urls.update(generated)
+    return urls
+
+
+# The file fields of BookReview that cards link to
+ATTACHMENT_FIELDS = ("file_upload", "preview")
+
+
+def _files(review):
+    # Fields deferred by the queryset are left out rather than loaded
+    deferred = review.get_deferred_fields()
+    return [
+        getattr(review, field) for field in ATTACHMENT_FIELDS
+        if field not in deferred and getattr(review, field)
+    ]
+
+
+class AttachmentBatch:
+    def __init__(self, reviews):
+        self.reviews = reviews
+        self.urls = None
+
+    def url(self, review, field):
+        if self.urls is None:
+            self.urls = attachment_urls(file for review in self.reviews for file in _files(review))
+        file = getattr(review, field)
+        if file.name not in self.urls:
+            self.urls.update(attachment_urls([file]))
+        return self.urls[file.name]
+
+
+def prefetch_attachment_urls(reviews):
+    """Resolve the attachment (and preview) URLs of ``reviews`` together, the
+    first time any of them is used. Returns the reviews as a list."""
+    reviews = list(reviews)
+    batch = AttachmentBatch([review for review in reviews if review.file_upload])
+    for review in batch.reviews:
+        review._attachment_batch = batch
+    return reviews
+
+
+def attachment_url(review, field="file_upload"):
+    if not getattr(review, field):
+        return ""
+    batch = getattr(review, "_attachment_batch", None)
+    if batch is None:
+        batch = review._attachment_batch = AttachmentBatch([review])
+    return batch.url(review, field)
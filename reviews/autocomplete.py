@@ -0,0 +1,99 @@
+"""Prefix autocomplete over book titles, authors and review titles.
+
+Entries live in one sorted list of ``(key, label, kind)`` tuples, where the
+keys are the case-folded label and every suffix of it that starts a word
+("the hobbit" and "hobbit"), so "hob" completes "The Hobbit". A lookup is a
+bisect to the first key >= the prefix followed by a short forward scan, with
+no database access. The index is process-local and kept fresh as described
+in reviews.vocabulary, with a full rebuild every AUTOCOMPLETE_REBUILD_SECONDS.
+"""
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+
+from .vocabulary import ProcessIndex, catalog_entries
+
+MAX_PREFIX_LENGTH = 100
+# Bounds the work per lookup when many keys share a short prefix
+MAX_SCAN = 500
+
+
+def normalize(text):
+    return " ".join((text or "").split()).casefold()
+
+
+def label_keys(label):
+    key = normalize(label)
+    return [key[match.start():] for match in re.finditer(r"(?<![^\W_])[^\W_]", key)] or [key]
+
+
+class PrefixIndex:
+    def __init__(self, entries=()):
+        self.counts = Counter()
+        for label, kind in entries:
+            label = " ".join(label.split())
+            if label:
+                self.counts[label, kind] += 1
+        self.keys = sorted(
+            (key, label, kind) for label, kind in self.counts for key in label_keys(label)
+        )
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, label, kind):
+        label = " ".join((label or "").split())
+        if not label:
+            return
+        with self.lock:
+            self.counts[label, kind] += 1
+            if self.counts[label, kind] == 1:
+                for key in label_keys(label):
+                    insort(self.keys, (key, label, kind))
+
+    def discard(self, label, kind):
+        label = " ".join((label or "").split())
+        with self.lock:
+            if self.counts.get((label, kind), 0) > 1:
+                self.counts[label, kind] -= 1
+                return
+            if self.counts.pop((label, kind), None) is None:
+                return
+            for key in label_keys(label):
+                i = bisect_left(self.keys, (key, label, kind))
+                if i < len(self.keys) and self.keys[i] == (key, label, kind):
+                    del self.keys[i]
+
+    def complete(self, prefix, limit=10):
+        """Return up to ``limit`` (label, kind) pairs with a word starting with
+        ``prefix``; labels that themselves start with it come first."""
+        prefix = normalize(prefix)[:MAX_PREFIX_LENGTH]
+        if not prefix:
+            return []
+        keys = self.keys
+        i = bisect_left(keys, (prefix,))
+        seen = set()
+        leading, inner = [], []
+        for key, label, kind in keys[i:i + MAX_SCAN]:
+            if not key.startswith(prefix):
+                break
+            if (label, kind) in seen:
+                continue
+            seen.add((label, kind))
+            (leading if normalize(label).startswith(prefix) else inner).append((label, kind))
+            if len(leading) >= limit:
+                break
+        return (leading + inner)[:limit]
+
+
+def build_index():
+    return PrefixIndex(catalog_entries())
+
+
+prefix_index = ProcessIndex(build_index, "AUTOCOMPLETE_REBUILD_SECONDS")
+
+
+def complete(prefix, limit=10):
+    return prefix_index.get().complete(prefix, limit)
@@ -0,0 +1,48 @@
+"""A small per-process thread pool for attachment processing.
+
+Previews (reviews.previews), text extraction (reviews.extraction) and
+profile image variants (users.images) are too slow for the request cycle
+but too light to justify a task queue, so they run here once the
+transaction that saved the file commits.
+With ATTACHMENT_WORKERS = 0 they run inline instead (tests, management
+commands).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ATTACHMENT_WORKERS, thread_name_prefix="attachments"
+            )
+        return _executor
+
+
+def _run(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("%s%r failed", func.__name__, args)
+    finally:
+        # Worker threads hold their own connections
+        close_old_connections()
+
+
+def run_after_commit(func, *args):
+    """Call ``func(*args)`` once the current transaction commits."""
+    if settings.ATTACHMENT_WORKERS:
+        transaction.on_commit(lambda: executor().submit(_run, func, *args))
+    else:
+        transaction.on_commit(lambda: func(*args))
@@ -0,0 +1,231 @@
+"""Content-addressed storage for uploaded files.
+
+BlobStorage wraps the default storage. Each upload is hashed (SHA-256) and
+stored once, as blobs/<2 hex>/<hash><ext>. An upload whose content is
+already stored skips the transfer and gets the existing name. Each blob
+has a Blob row that counts the references to it.
+
+Fields opt in with ``storage=get_blob_storage`` plus track(model, field),
+which keeps the counts in step with saves and deletes. A blob whose
+count drops to zero is deleted once the transaction commits, unless an
+upload touched it within BLOB_GC_GRACE seconds: that upload may be about
+to reference it. ``manage.py gc_blobs`` sweeps up those.
+
+Names that aren't blobs (files stored before this existed) pass straight
+through to the wrapped storage.
+"""
+import hashlib
+import os
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import Storage, default_storage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.utils import timezone
+
+BLOB_PREFIX = "blobs/"
+
+
+def _blobs():
+    # Blob lives in reviews.models, which uses this module for its fields
+    return apps.get_model("reviews", "Blob")
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX)
+
+
+def content_hash(content):
+    """SHA-256 of a File, from the upload handler when it already has one."""
+    digest = getattr(content, "sha256", None)
+    if digest:
+        return digest
+    sha = hashlib.sha256()
+    if hasattr(content, "seek"):
+        content.seek(0)
+    for chunk in content.chunks():
+        sha.update(chunk)
+    content.seek(0)
+    return sha.hexdigest()
+
+
+class BlobStorage(Storage):
+    def __init__(self, storage=None):
+        self._storage = storage
+
+    @property
+    def base(self):
+        return self._storage or default_storage
+
+    def __getattr__(self, name):
+        # querystring_auth, signature() and the like, for attachment URLs
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.base, name)
+
+    def _open(self, name, mode="rb"):
+        return self.base.open(name, mode)
+
+    def _save(self, name, content):
+        digest = content_hash(content)
+        Blob = _blobs()
+        blob = Blob.objects.filter(hash=digest).first()
+        if blob is not None and self.base.exists(blob.name):
+            Blob.objects.filter(pk=blob.pk).update(touched_at=timezone.now())
+            return blob.name
+
+        extension = os.path.splitext(name)[1].lower()
+        blob_name = f"{BLOB_PREFIX}{digest[:2]}/{digest}{extension}"
+        if not self.base.exists(blob_name):
+            blob_name = self.base.save(blob_name, content)
+        blob, created = Blob.objects.get_or_create(
+            hash=digest, defaults={"name": blob_name, "size": content.size}
+        )
+        if not created:
+            # Raced another upload of the same content, or the file had gone missing
+            if blob.name != blob_name and not self.base.exists(blob.name):
+                Blob.objects.filter(pk=blob.pk).update(name=blob_name, touched_at=timezone.now())
+                return blob_name
+            Blob.objects.filter(pk=blob.pk).update(touched_at=timezone.now())
+        return blob.name
+
+    def get_available_name(self, name, max_length=None):
+        # _save picks the real name from the content
+        return name
+
+    def delete(self, name):
+        if not is_blob(name):
+            self.base.delete(name)
+            return
+        # Referenced blobs stay; unreferenced ones go (see collect)
+        transaction.on_commit(lambda: collect(name))
+
+    def exists(self, name):
+        return self.base.exists(name)
+
+    def size(self, name):
+        return self.base.size(name)
+
+    def url(self, name, expire=None):
+        if expire is None:
+            return self.base.url(name)
+        return self.base.url(name, expire=expire)
+
+    def path(self, name):
+        return self.base.path(name)
+
+    def listdir(self, path):
+        return self.base.listdir(path)
+
+    def get_modified_time(self, name):
+        return self.base.get_modified_time(name)
+
+
+blob_storage = BlobStorage()
+
+
+def get_blob_storage():
+    # A callable, so migrations record a reference rather than the instance
+    return blob_storage
+
+
+def collect(name, grace=None):
+    """Delete the blob ``name`` if nothing references it and no upload has
+    used it within ``grace`` seconds. Returns whether it was deleted."""
+    if grace is None:
+        grace = settings.BLOB_GC_GRACE
+    Blob = _blobs()
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(
+            name=name, refcount=0, touched_at__lte=timezone.now() - timedelta(seconds=grace)
+        ).first()
+        if blob is None:
+            return False
+        blob.delete()
+        blob_storage.base.delete(name)
+    return True
+
+
+def add_reference(name):
+    if is_blob(name):
+        _blobs().objects.filter(name=name).update(refcount=F("refcount") + 1)
+
+
+def drop_reference(name):
+    if is_blob(name):
+        _blobs().objects.filter(name=name, refcount__gt=0).update(refcount=F("refcount") - 1)
+        transaction.on_commit(lambda: collect(name))
+
+
+def _name(file):
+    return getattr(file, "name", file) or None
+
+
+def track(model, field):
+    """Count the references that ``model.field`` holds to blobs."""
+    attname = model._meta.get_field(field).attname
+    key = f"_blob_{attname}"
+
+    def remember(sender, instance, **kwargs):
+        # Deferred fields aren't in __dict__; saved() looks those up if needed
+        if attname in instance.__dict__:
+            instance.__dict__[key] = _name(instance.__dict__[attname])
+
+    def saving(sender, instance, raw=False, update_fields=None, **kwargs):
+        if raw or instance._state.adding or key in instance.__dict__:
+            return
+        if update_fields is None or field in update_fields:
+            instance.__dict__[key] = model._base_manager.filter(pk=instance.pk).values_list(
+                attname, flat=True
+            ).first() or None
+
+    def saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+        if raw or (update_fields is not None and field not in update_fields):
+            return
+        old = None if created else instance.__dict__.get(key)
+        new = _name(getattr(instance, attname))
+        if old != new:
+            add_reference(new)
+            drop_reference(old)
+        instance.__dict__[key] = new
+
+    def deleted(sender, instance, **kwargs):
+        drop_reference(_name(getattr(instance, attname)))
+
+    uid = f"blobs:{model._meta.label}.{field}"
+    post_init.connect(remember, sender=model, weak=False, dispatch_uid=uid)
+    pre_save.connect(saving, sender=model, weak=False, dispatch_uid=uid)
+    post_save.connect(saved, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=uid)
+
+
+class HashingUploadHandlerMixin:
+    """Hash uploaded files as they stream in, so BlobStorage doesn't have
+    to read them again."""
+
+    def new_file(self, *args, **kwargs):
+        # Before super(): the memory handler raises StopFutureHandlers from it
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadHandlerMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadHandlerMixin, TemporaryFileUploadHandler):
+    pass
@@ -0,0 +1,76 @@
+"""Files derived from an upload: attachment previews (reviews.previews) and
+profile image variants (users.images).
+
+regenerate() is the shared body of the jobs that render them. It replaces
+a row's derived files with ones rendered from its current upload, or with
+none once the upload is gone, and deletes the files it replaced.
+track() deletes them along with the row.
+"""
+import logging
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete
+
+from mysite.cache import invalidate_tags
+
+logger = logging.getLogger(__name__)
+
+
+def regenerate(instance, source_field, storage, render, record, old_names, tag):
+    """Render the files derived from ``instance.<source_field>`` and store
+    them in ``storage``.
+
+    ``render(file)`` returns {key: (name, bytes)} for the files to store;
+    ``record({key: stored name})`` returns the field values that record
+    them. ``old_names`` are the files the row has now, deleted once they
+    are replaced, and ``tag`` is invalidated. Returns whether files were
+    stored.
+    """
+    model = type(instance)
+    source = getattr(instance, source_field)
+    rendered = {}
+    if source:
+        try:
+            with source.open("rb") as file:
+                rendered = render(file)
+        except Exception:
+            # Recorded as done either way, so a broken file isn't retried on every save
+            logger.exception("Could not render the files derived from %s", source.name)
+            rendered = {}
+    stored = {key: storage.save(name, ContentFile(data)) for key, (name, data) in rendered.items()}
+
+    if source.name:
+        unchanged = Q(**{source_field: source.name})
+    else:
+        unchanged = Q(**{source_field: ""}) | Q(**{f"{source_field}__isnull": True})
+    # A plain update: saving the row would send post_save and queue this again
+    updated = model._base_manager.filter(unchanged, pk=instance.pk).update(**record(stored))
+    if not updated:
+        # The upload changed while this one rendered; its own job takes over
+        for name in stored.values():
+            storage.delete(name)
+        return False
+    for name in set(old_names) - set(stored.values()):
+        if name:
+            storage.delete(name)
+    invalidate_tags(tag)
+    return bool(stored)
+
+
+def track(model, storage, names):
+    """Delete the files ``names(instance)`` lists from ``storage`` when a
+    ``model`` row is deleted, cascades included."""
+
+    def deleted(sender, instance, **kwargs):
+        files = [name for name in names(instance) if name]
+
+        def delete():
+            for name in files:
+                storage.delete(name)
+
+        if files:
+            transaction.on_commit(delete)
+
+    post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=f"derived:{model._meta.label}")
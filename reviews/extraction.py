@@ -0,0 +1,127 @@
+"""Searchable text from review attachments.
+
+extract_attachment_text() streams a review's attachment twice at most:
+once to hash it, and, only if the hash differs from the one stored in
+AttachmentText, once more to pull out its text. Text files are decoded
+block by block and PDFs read page by page (with pypdf, in requirements.txt),
+stopping at ATTACHMENT_TEXT_MAX_CHARS, so memory stays bounded whatever
+the file size. The text is indexed by attachment_index (reviews.search).
+
+Extraction runs on the attachment worker pool (reviews.background) after
+the review commits.
+"""
+import codecs
+import hashlib
+import logging
+
+from django.conf import settings
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+from .background import run_after_commit
+from .models import AttachmentText, BookReview
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 64 * 1024
+
+
+def file_hash(file):
+    digest = hashlib.sha256()
+    for block in iter(lambda: file.read(BLOCK_SIZE), b""):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def _clip(parts, max_chars):
+    """Join text ``parts`` up to ``max_chars``, consuming no more of them than needed."""
+    text, length = [], 0
+    for part in parts:
+        text.append(part[:max_chars - length])
+        length += len(text[-1])
+        if length >= max_chars:
+            break
+    return "".join(text)
+
+
+def text_parts(file):
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for block in iter(lambda: file.read(BLOCK_SIZE), b""):
+        yield decoder.decode(block)
+    yield decoder.decode(b"", final=True)
+
+
+def pdf_parts(file):
+    # PdfReader seeks around the file for each page rather than loading it
+    for page in PdfReader(file).pages:
+        yield page.extract_text() + "\n"
+
+
+EXTRACTORS = {"txt": text_parts}
+if PdfReader is not None:
+    EXTRACTORS["pdf"] = pdf_parts
+
+
+def extractor_for(name):
+    return EXTRACTORS.get((name or "").rsplit(".", 1)[-1].lower())
+
+
+def extract_text(file, name, max_chars=None):
+    """The text of ``file`` (up to ``max_chars``), or None for unsupported types."""
+    extractor = extractor_for(name)
+    if extractor is None:
+        return None
+    if max_chars is None:
+        max_chars = settings.ATTACHMENT_TEXT_MAX_CHARS
+    # NUL can't be stored in Postgres text columns
+    return _clip(extractor(file), max_chars).replace("\x00", "")
+
+
+def extract_attachment_text(review_id):
+    """Bring the AttachmentText of a review up to date with its attachment.
+    Returns whether any text was extracted."""
+    review = BookReview.objects.filter(pk=review_id).only("file_upload").first()
+    if review is None:
+        return False
+    if extractor_for(review.file_upload.name) is None:
+        AttachmentText.objects.filter(review_id=review_id).delete()
+        return False
+
+    name = review.file_upload.name
+    current = AttachmentText.objects.filter(review_id=review_id).first()
+    with review.file_upload.open("rb") as file:
+        content_hash = file_hash(file)
+        if current is not None and current.content_hash == content_hash:
+            if current.source != name:
+                # Same content under a new name (a re-upload): nothing to re-index
+                AttachmentText.objects.filter(review_id=review_id).update(source=name)
+            return False
+        file.seek(0)
+        try:
+            text = extract_text(file, name)
+        except Exception:
+            # Stored empty, so the file isn't re-read until its content changes
+            logger.exception("Could not extract text from %s", name)
+            text = ""
+
+    AttachmentText.objects.update_or_create(
+        review_id=review_id,
+        defaults={"source": name, "content_hash": content_hash, "text": text},
+    )
+    return bool(text)
+
+
+def schedule_extraction(review_id):
+    """Extract the text of ``review_id``'s attachment once the current transaction commits."""
+    run_after_commit(extract_attachment_text, review_id)
+
+
+def needs_extraction(review):
+    """Whether the review's attachment changed since its text was extracted."""
+    texts = AttachmentText.objects.filter(review_id=review.pk)
+    if extractor_for(review.file_upload.name) is None:
+        return texts.exists()
+    return not texts.filter(source=review.file_upload.name).exists()
@@ -0,0 +1,50 @@
+"""The cached "Recent Reviews" block of the home page.
+
+The feed is the latest reviews, each with its full card pre-rendered for
+members. It is stored tagged with "review:all" plus the tags of every
+review and author it shows, and rebuilt write-through once a review
+write commits. Only the per-user overlay (which cards the viewer may open,
+and their buttons) is worked out per request.
+"""
+from django.template.loader import render_to_string
+
+from mysite.cache import get_tagged, set_tagged, tag_versions
+
+from .attachments import prefetch_attachment_urls
+from .models import BookReview
+
+HOME_FEED_SIZE = 10
+# Kept well under the lifetime of signed S3 URLs in the rendered HTML
+HOME_FEED_TIMEOUT = 10 * 60
+HOME_FEED_KEY = "home:feed"
+HOME_FEED_TAGS = ["review:all"]
+
+
+def refresh_home_feed():
+    versions = tag_versions(HOME_FEED_TAGS)
+    reviews = prefetch_attachment_urls(
+        BookReview.objects.for_cards().order_by("-date")[:HOME_FEED_SIZE]
+    )
+    feed = [
+        {
+            "id": review.id,
+            "user_id": review.user_id,
+            "title": review.title,
+            "html": render_to_string("reviews/review_card_body.html", {"review": review}),
+        }
+        for review in reviews
+    ]
+    # Comments change a card's rating; profile edits change its author line
+    versions.update(tag_versions(
+        [f"review:{review.id}" for review in reviews]
+        + [f"user:{review.user_id}" for review in reviews]
+    ))
+    set_tagged(HOME_FEED_KEY, feed, versions, HOME_FEED_TIMEOUT)
+    return feed
+
+
+def home_feed():
+    feed = get_tagged(HOME_FEED_KEY, HOME_FEED_TAGS)
+    if feed is None:
+        feed = refresh_home_feed()
+    return feed
@@ -1,4 +1,5 @@
 from django import forms
+from django.urls import reverse_lazy
 from .models import BookReview, Comment
 
 class BookReviewForm(forms.ModelForm):
@@ -80,9 +81,19 @@ class CommentForm(forms.ModelForm):
         fields = ['text', 'rating']
 
 class ReviewForm(forms.ModelForm):
+    # Set by the resumable uploader (reviews.uploads) in place of file_upload
+    upload_id = forms.UUIDField(required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = BookReview
         fields = [
             'title', 'author', 'genre', 'comment', 'rating',
             'file_upload', 'file_title', 'file_keywords', 'file_description'
         ]
+        widgets = {
+            # Picked up by reviews/js/resumable_upload.js
+            'file_upload': forms.ClearableFileInput(attrs={
+                'data-resumable-upload': reverse_lazy('upload_create'),
+                'data-progress': 'upload-progress',
+            }),
+        }
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from reviews import uploads
+from reviews.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = "Delete upload sessions, and their staged data, older than UPLOAD_SESSION_MAX_AGE."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age", type=int, default=settings.UPLOAD_SESSION_MAX_AGE,
+            help="Age in seconds after which a session is stale.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options["max_age"])
+        cleared = 0
+        for session in UploadSession.objects.filter(created_at__lt=cutoff).iterator():
+            uploads.discard(session)
+            cleared += 1
+        self.stdout.write(self.style.SUCCESS(f"Cleared {cleared} stale uploads"))
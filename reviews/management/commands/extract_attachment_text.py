@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from reviews.extraction import extract_attachment_text
+from reviews.models import BookReview
+
+
+class Command(BaseCommand):
+    help = (
+        "Extract searchable text from review attachments. Files whose content "
+        "hash hasn't changed since the last extraction are skipped."
+    )
+
+    def handle(self, *args, **options):
+        review_ids = BookReview.objects.exclude(file_upload="").exclude(
+            file_upload__isnull=True
+        ).values_list("id", flat=True)
+        extracted = 0
+        for review_id in review_ids.iterator():
+            extracted += extract_attachment_text(review_id)
+            if options["verbosity"] >= 2:
+                self.stdout.write(f"{extracted} attachments extracted")
+        self.stdout.write(self.style.SUCCESS(f"Extracted text from {extracted} attachments"))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from reviews import blobs
+from reviews.models import Blob, BookReview, UploadSession
+from users.models import Profile
+
+# Every field tracked with blobs.track()
+BLOB_FIELDS = [(BookReview, "file_upload"), (Profile, "profile_image"), (UploadSession, "stored_name")]
+
+
+class Command(BaseCommand):
+    help = "Delete stored blobs that nothing references any more."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--recount", action="store_true",
+            help="Recompute every reference count from the referencing rows first.",
+        )
+        parser.add_argument(
+            "--grace", type=int, default=None,
+            help="Seconds since an upload last used a blob before it may go (default BLOB_GC_GRACE).",
+        )
+
+    def handle(self, *args, **options):
+        if options["recount"]:
+            counts = {}
+            for model, field in BLOB_FIELDS:
+                rows = (
+                    model.objects.filter(**{f"{field}__startswith": blobs.BLOB_PREFIX})
+                    .values(field).annotate(references=Count("pk")).order_by()
+                )
+                for row in rows:
+                    counts[row[field]] = counts.get(row[field], 0) + row["references"]
+            for blob in Blob.objects.iterator():
+                if blob.refcount != counts.get(blob.name, 0):
+                    Blob.objects.filter(pk=blob.pk).update(refcount=counts.get(blob.name, 0))
+
+        collected = 0
+        for name in Blob.objects.filter(refcount=0).values_list("name", flat=True).iterator():
+            collected += blobs.collect(name, options["grace"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {collected} unreferenced blobs"))
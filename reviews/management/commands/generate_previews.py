@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from reviews.models import BookReview
+from reviews.previews import generate_preview
+
+
+class Command(BaseCommand):
+    help = "Generate missing or outdated attachment previews, e.g. for reviews saved before previews existed."
+
+    def handle(self, *args, **options):
+        review_ids = (
+            BookReview.objects.exclude(file_upload="").exclude(file_upload__isnull=True)
+            .exclude(preview_of=F("file_upload")).values_list("id", flat=True)
+        )
+        generated = 0
+        for review_id in review_ids.iterator():
+            generated += generate_preview(review_id)
+            if options["verbosity"] >= 2:
+                self.stdout.write(f"{generated} previews generated")
+        self.stdout.write(self.style.SUCCESS(f"Generated {generated} previews"))
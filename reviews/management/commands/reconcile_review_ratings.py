@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from mysite.cache import invalidate_tags
+from reviews.models import BookReview
+
+
+class Command(BaseCommand):
+    help = "Rebuild the comment/rating counters and average rating of every review from its comments."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        # Id ranges keep each UPDATE (and the locks it holds) short
+        last_id = BookReview.objects.aggregate(Max("id"))["id__max"] or 0
+        updated = 0
+        for start in range(0, last_id + 1, batch_size):
+            updated += BookReview.objects.filter(
+                id__gte=start, id__lt=start + batch_size
+            ).rebuild_rating_aggregates()
+            if options["verbosity"] >= 2:
+                self.stdout.write(f"{updated} reviews reconciled")
+        # Bulk updates send no signals
+        invalidate_tags("review:all")
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {updated} reviews"))
@@ -0,0 +1,73 @@
+from django.db import migrations
+
+from mysite.search import execute_frozen
+
+
+# SQL generated by mysite.search when this migration was written, frozen so
+# later changes to the index can't change what it does
+INSTALL_SQL = {
+    "sqlite": [
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_ai',
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_ad',
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_au',
+        'DROP TABLE IF EXISTS reviews_bookreview_search',
+        "CREATE VIRTUAL TABLE reviews_bookreview_search USING fts5(title, author, genre, file_title, file_keywords, comment, file_description, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        'CREATE TRIGGER reviews_bookreview_search_ai AFTER INSERT ON reviews_bookreview BEGIN INSERT INTO reviews_bookreview_search(rowid, title, author, genre, file_title, file_keywords, comment, file_description) VALUES (new.id, new.title, new.author, new.genre, new.file_title, new.file_keywords, new.comment, new.file_description); END',
+        'CREATE TRIGGER reviews_bookreview_search_ad AFTER DELETE ON reviews_bookreview BEGIN DELETE FROM reviews_bookreview_search WHERE rowid = old.id; END',
+        'CREATE TRIGGER reviews_bookreview_search_au AFTER UPDATE OF title, author, genre, file_title, file_keywords, comment, file_description ON reviews_bookreview BEGIN DELETE FROM reviews_bookreview_search WHERE rowid = old.id; INSERT INTO reviews_bookreview_search(rowid, title, author, genre, file_title, file_keywords, comment, file_description) VALUES (new.id, new.title, new.author, new.genre, new.file_title, new.file_keywords, new.comment, new.file_description); END',
+        'INSERT INTO reviews_bookreview_search(rowid, title, author, genre, file_title, file_keywords, comment, file_description) SELECT id, title, author, genre, file_title, file_keywords, comment, file_description FROM reviews_bookreview',
+    ],
+    "postgresql": [
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_sync ON reviews_bookreview',
+        'DROP FUNCTION IF EXISTS reviews_bookreview_search_sync()',
+        'DROP TABLE IF EXISTS reviews_bookreview_search',
+        'CREATE TABLE reviews_bookreview_search (rowid bigint PRIMARY KEY, document tsvector NOT NULL)',
+        'CREATE INDEX reviews_bookreview_search_document_idx ON reviews_bookreview_search USING GIN (document)',
+        """CREATE FUNCTION reviews_bookreview_search_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM reviews_bookreview_search WHERE rowid = OLD.id;
+            RETURN OLD;
+        END IF;
+        INSERT INTO reviews_bookreview_search (rowid, document) VALUES (NEW.id, setweight(to_tsvector('english', coalesce(NEW.title::text, '')), 'A') || setweight(to_tsvector('english', coalesce(NEW.author::text, '')), 'A') || setweight(to_tsvector('english', coalesce(NEW.genre::text, '')), 'B') || setweight(to_tsvector('english', coalesce(NEW.file_title::text, '')), 'B') || setweight(to_tsvector('english', coalesce(NEW.file_keywords::text, '')), 'B') || setweight(to_tsvector('english', coalesce(NEW.comment::text, '')), 'C') || setweight(to_tsvector('english', coalesce(NEW.file_description::text, '')), 'D'))
+        ON CONFLICT (rowid) DO UPDATE SET document = EXCLUDED.document;
+        RETURN NEW;
+    END
+    $$""",
+        'CREATE TRIGGER reviews_bookreview_search_sync AFTER INSERT OR DELETE OR UPDATE OF title, author, genre, file_title, file_keywords, comment, file_description ON reviews_bookreview FOR EACH ROW EXECUTE FUNCTION reviews_bookreview_search_sync()',
+        "INSERT INTO reviews_bookreview_search (rowid, document) SELECT id, setweight(to_tsvector('english', coalesce(reviews_bookreview.title::text, '')), 'A') || setweight(to_tsvector('english', coalesce(reviews_bookreview.author::text, '')), 'A') || setweight(to_tsvector('english', coalesce(reviews_bookreview.genre::text, '')), 'B') || setweight(to_tsvector('english', coalesce(reviews_bookreview.file_title::text, '')), 'B') || setweight(to_tsvector('english', coalesce(reviews_bookreview.file_keywords::text, '')), 'B') || setweight(to_tsvector('english', coalesce(reviews_bookreview.comment::text, '')), 'C') || setweight(to_tsvector('english', coalesce(reviews_bookreview.file_description::text, '')), 'D') FROM reviews_bookreview",
+    ],
+}
+
+UNINSTALL_SQL = {
+    "sqlite": [
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_ai',
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_ad',
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_au',
+        'DROP TABLE IF EXISTS reviews_bookreview_search',
+    ],
+    "postgresql": [
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_sync ON reviews_bookreview',
+        'DROP FUNCTION IF EXISTS reviews_bookreview_search_sync()',
+        'DROP TABLE IF EXISTS reviews_bookreview_search',
+    ],
+}
+
+
+def install(apps, schema_editor):
+    execute_frozen(schema_editor, INSTALL_SQL)
+
+
+def uninstall(apps, schema_editor):
+    execute_frozen(schema_editor, UNINSTALL_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reviews", "0025_alter_bookreviewmembership_joined_date"),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
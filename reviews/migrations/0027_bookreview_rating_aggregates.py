@@ -0,0 +1,88 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:12
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, Greatest, Least
+
+from mysite.search import execute_frozen
+
+
+def populate_rating_aggregates(apps, schema_editor):
+    # Frozen copy of BookReviewQuerySet.rebuild_rating_aggregates, plus a
+    # step for the old comment handler, which overwrote BookReview.rating
+    # with the average of it and the comment ratings. Counting those again
+    # would weigh every comment twice, so the author's rating is solved back
+    # out of that average, which is then what average_rating recomputes to.
+    BookReview = apps.get_model("reviews", "BookReview")
+    Comment = apps.get_model("reviews", "Comment")
+    comments = Comment.objects.filter(review=OuterRef("pk")).order_by().values("review")
+
+    def aggregate(expression):
+        return Coalesce(Subquery(comments.annotate(value=expression).values("value")), 0)
+
+    BookReview.objects.update(
+        comment_count=aggregate(Count("pk")),
+        rating_sum=aggregate(Sum("rating")),
+        rating_count=aggregate(Count("rating")),
+    )
+    BookReview.objects.filter(rating_count__gt=0).update(
+        rating=Greatest(Least(F("rating") * (F("rating_count") + 1) - F("rating_sum"), 5), 1)
+    )
+    BookReview.objects.update(
+        average_rating=Cast(F("rating") + F("rating_sum"), models.FloatField())
+        / (F("rating_count") + 1)
+    )
+
+
+# SQL generated by mysite.search when this migration was written, frozen so
+# later changes to the index can't change what it does
+SEARCH_TRIGGERS_SQL = {
+    "sqlite": [
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_ai',
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_ad',
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_au',
+        'CREATE TRIGGER reviews_bookreview_search_ai AFTER INSERT ON reviews_bookreview BEGIN INSERT INTO reviews_bookreview_search(rowid, title, author, genre, file_title, file_keywords, comment, file_description) VALUES (new.id, new.title, new.author, new.genre, new.file_title, new.file_keywords, new.comment, new.file_description); END',
+        'CREATE TRIGGER reviews_bookreview_search_ad AFTER DELETE ON reviews_bookreview BEGIN DELETE FROM reviews_bookreview_search WHERE rowid = old.id; END',
+        'CREATE TRIGGER reviews_bookreview_search_au AFTER UPDATE OF title, author, genre, file_title, file_keywords, comment, file_description ON reviews_bookreview BEGIN DELETE FROM reviews_bookreview_search WHERE rowid = old.id; INSERT INTO reviews_bookreview_search(rowid, title, author, genre, file_title, file_keywords, comment, file_description) VALUES (new.id, new.title, new.author, new.genre, new.file_title, new.file_keywords, new.comment, new.file_description); END',
+    ],
+    "postgresql": [],
+}
+
+
+def restore_search_triggers(apps, schema_editor):
+    execute_frozen(schema_editor, SEARCH_TRIGGERS_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0026_bookreview_search_index'),
+    ]
+
+    # SQLite remakes the table for these AddFields, dropping the search
+    # triggers; restore them afterwards in both directions.
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='bookreview',
+            name='average_rating',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bookreview',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bookreview',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bookreview',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.RunPython(populate_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0028_bookreview_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookreviewmembership',
+            index=models.Index(fields=['user', 'review'], name='membership_user_review_idx'),
+        ),
+    ]
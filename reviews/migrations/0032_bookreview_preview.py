@@ -0,0 +1,48 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:57
+
+from django.db import migrations, models
+
+from mysite.search import execute_frozen
+
+
+# SQL generated by mysite.search when this migration was written, frozen so
+# later changes to the index can't change what it does
+SEARCH_TRIGGERS_SQL = {
+    "sqlite": [
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_ai',
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_ad',
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_au',
+        'CREATE TRIGGER reviews_bookreview_search_ai AFTER INSERT ON reviews_bookreview BEGIN INSERT INTO reviews_bookreview_search(rowid, title, author, genre, file_title, file_keywords, comment, file_description) VALUES (new.id, new.title, new.author, new.genre, new.file_title, new.file_keywords, new.comment, new.file_description); END',
+        'CREATE TRIGGER reviews_bookreview_search_ad AFTER DELETE ON reviews_bookreview BEGIN DELETE FROM reviews_bookreview_search WHERE rowid = old.id; END',
+        'CREATE TRIGGER reviews_bookreview_search_au AFTER UPDATE OF title, author, genre, file_title, file_keywords, comment, file_description ON reviews_bookreview BEGIN DELETE FROM reviews_bookreview_search WHERE rowid = old.id; INSERT INTO reviews_bookreview_search(rowid, title, author, genre, file_title, file_keywords, comment, file_description) VALUES (new.id, new.title, new.author, new.genre, new.file_title, new.file_keywords, new.comment, new.file_description); END',
+    ],
+    "postgresql": [],
+}
+
+
+def restore_search_triggers(apps, schema_editor):
+    execute_frozen(schema_editor, SEARCH_TRIGGERS_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0031_uploadsession'),
+    ]
+
+    # SQLite remakes the table for these AddFields, dropping the search
+    # triggers; restore them afterwards in both directions.
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='bookreview',
+            name='preview',
+            field=models.FileField(blank=True, editable=False, upload_to='previews/'),
+        ),
+        migrations.AddField(
+            model_name='bookreview',
+            name='preview_of',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from mysite.search import execute_frozen
+
+
+# SQL generated by mysite.search when this migration was written, frozen so
+# later changes to the index can't change what it does
+INSTALL_SQL = {
+    "sqlite": [
+        'DROP TRIGGER IF EXISTS reviews_attachmenttext_search_ai',
+        'DROP TRIGGER IF EXISTS reviews_attachmenttext_search_ad',
+        'DROP TRIGGER IF EXISTS reviews_attachmenttext_search_au',
+        'DROP TABLE IF EXISTS reviews_attachmenttext_search',
+        "CREATE VIRTUAL TABLE reviews_attachmenttext_search USING fts5(text, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        'CREATE TRIGGER reviews_attachmenttext_search_ai AFTER INSERT ON reviews_attachmenttext BEGIN INSERT INTO reviews_attachmenttext_search(rowid, text) VALUES (new.review_id, new.text); END',
+        'CREATE TRIGGER reviews_attachmenttext_search_ad AFTER DELETE ON reviews_attachmenttext BEGIN DELETE FROM reviews_attachmenttext_search WHERE rowid = old.review_id; END',
+        'CREATE TRIGGER reviews_attachmenttext_search_au AFTER UPDATE OF text ON reviews_attachmenttext BEGIN DELETE FROM reviews_attachmenttext_search WHERE rowid = old.review_id; INSERT INTO reviews_attachmenttext_search(rowid, text) VALUES (new.review_id, new.text); END',
+        'INSERT INTO reviews_attachmenttext_search(rowid, text) SELECT review_id, text FROM reviews_attachmenttext',
+    ],
+    "postgresql": [
+        'DROP TRIGGER IF EXISTS reviews_attachmenttext_search_sync ON reviews_attachmenttext',
+        'DROP FUNCTION IF EXISTS reviews_attachmenttext_search_sync()',
+        'DROP TABLE IF EXISTS reviews_attachmenttext_search',
+        'CREATE TABLE reviews_attachmenttext_search (rowid bigint PRIMARY KEY, document tsvector NOT NULL)',
+        'CREATE INDEX reviews_attachmenttext_search_document_idx ON reviews_attachmenttext_search USING GIN (document)',
+        """CREATE FUNCTION reviews_attachmenttext_search_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM reviews_attachmenttext_search WHERE rowid = OLD.review_id;
+            RETURN OLD;
+        END IF;
+        INSERT INTO reviews_attachmenttext_search (rowid, document) VALUES (NEW.review_id, setweight(to_tsvector('english', coalesce(NEW.text::text, '')), 'D'))
+        ON CONFLICT (rowid) DO UPDATE SET document = EXCLUDED.document;
+        RETURN NEW;
+    END
+    $$""",
+        'CREATE TRIGGER reviews_attachmenttext_search_sync AFTER INSERT OR DELETE OR UPDATE OF text ON reviews_attachmenttext FOR EACH ROW EXECUTE FUNCTION reviews_attachmenttext_search_sync()',
+        "INSERT INTO reviews_attachmenttext_search (rowid, document) SELECT review_id, setweight(to_tsvector('english', coalesce(reviews_attachmenttext.text::text, '')), 'D') FROM reviews_attachmenttext",
+    ],
+}
+
+UNINSTALL_SQL = {
+    "sqlite": [
+        'DROP TRIGGER IF EXISTS reviews_attachmenttext_search_ai',
+        'DROP TRIGGER IF EXISTS reviews_attachmenttext_search_ad',
+        'DROP TRIGGER IF EXISTS reviews_attachmenttext_search_au',
+        'DROP TABLE IF EXISTS reviews_attachmenttext_search',
+    ],
+    "postgresql": [
+        'DROP TRIGGER IF EXISTS reviews_attachmenttext_search_sync ON reviews_attachmenttext',
+        'DROP FUNCTION IF EXISTS reviews_attachmenttext_search_sync()',
+        'DROP TABLE IF EXISTS reviews_attachmenttext_search',
+    ],
+}
+
+
+def install(apps, schema_editor):
+    execute_frozen(schema_editor, INSTALL_SQL)
+
+
+def uninstall(apps, schema_editor):
+    execute_frozen(schema_editor, UNINSTALL_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0032_bookreview_preview'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttachmentText',
+            fields=[
+                ('review', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='attachment_text', serialize=False, to='reviews.bookreview')),
+                ('source', models.CharField(max_length=255)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('text', models.TextField(blank=True)),
+                ('extracted_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(install, uninstall),
+    ]
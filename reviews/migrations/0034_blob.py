@@ -0,0 +1,57 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:04
+
+from django.db import migrations, models
+import django.utils.timezone
+import reviews.blobs
+import reviews.models
+
+from mysite.search import execute_frozen
+
+
+# SQL generated by mysite.search when this migration was written, frozen so
+# later changes to the index can't change what it does
+SEARCH_TRIGGERS_SQL = {
+    "sqlite": [
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_ai',
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_ad',
+        'DROP TRIGGER IF EXISTS reviews_bookreview_search_au',
+        'CREATE TRIGGER reviews_bookreview_search_ai AFTER INSERT ON reviews_bookreview BEGIN INSERT INTO reviews_bookreview_search(rowid, title, author, genre, file_title, file_keywords, comment, file_description) VALUES (new.id, new.title, new.author, new.genre, new.file_title, new.file_keywords, new.comment, new.file_description); END',
+        'CREATE TRIGGER reviews_bookreview_search_ad AFTER DELETE ON reviews_bookreview BEGIN DELETE FROM reviews_bookreview_search WHERE rowid = old.id; END',
+        'CREATE TRIGGER reviews_bookreview_search_au AFTER UPDATE OF title, author, genre, file_title, file_keywords, comment, file_description ON reviews_bookreview BEGIN DELETE FROM reviews_bookreview_search WHERE rowid = old.id; INSERT INTO reviews_bookreview_search(rowid, title, author, genre, file_title, file_keywords, comment, file_description) VALUES (new.id, new.title, new.author, new.genre, new.file_title, new.file_keywords, new.comment, new.file_description); END',
+    ],
+    "postgresql": [],
+}
+
+
+def restore_search_triggers(apps, schema_editor):
+    execute_frozen(schema_editor, SEARCH_TRIGGERS_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0033_attachmenttext'),
+    ]
+
+    # SQLite may remake the table for the AlterField, dropping the search
+    # triggers; restore them afterwards in both directions.
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('touched_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='bookreview',
+            name='file_upload',
+            field=models.FileField(blank=True, null=True, storage=reviews.blobs.get_blob_storage, upload_to='uploads/', validators=[reviews.models.validate_review_file]),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -1,19 +1,81 @@
 # models.py
-from django.db import models
+import os
+import uuid
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, Greatest
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from reviews import admin
+from reviews.attachments import attachment_url
+from reviews.blobs import get_blob_storage
 from django.utils import timezone
 
 
+REVIEW_FILE_EXTENSIONS = ["pdf", "txt", "jpg"]
+
+
+def validate_review_file_name(name):
+    extension = name.split(".")[-1].lower()
+    if extension not in REVIEW_FILE_EXTENSIONS:
+        raise ValidationError("File must be of type .pdf, .txt, or .jpg, other file types are not supported")
+
+
 def validate_review_file(value):
-    extension = value.name.split(".")[-1].lower()
-    allowed_extensions = ["pdf", "txt", "jpg"]
-    
+    # Larger files go through the resumable upload endpoints (UploadSession)
     if value.file.size > 1024*1024:
         raise ValidationError("File too large ( > 1mb )")
-    if extension not in allowed_extensions:
-        raise ValidationError("File must be of type .pdf, .txt, or .jpg, other file types are not supported")
+    validate_review_file_name(value.name)
+
+def average_rating_expression():
+    # The author's rating counts as one more vote alongside the comment ratings
+    return Cast(F("rating") + F("rating_sum"), models.FloatField()) / (F("rating_count") + 1)
+
+
+class BookReviewQuerySet(models.QuerySet):
+    # Everything the review cards render, so a page of cards is one query
+    CARD_FIELDS = [
+        "id",
+        "title",
+        "author",
+        "genre",
+        "comment",
+        "date",
+        "updated_at",
+        "average_rating",
+        "file_upload",
+        "file_title",
+        "file_keywords",
+        "file_description",
+        "preview",
+        "user__id",
+        "user__username",
+        "user__first_name",
+        "user__last_name",
+    ]
+
+    def for_cards(self):
+        return self.select_related("user").only(*self.CARD_FIELDS)
+
+    def rebuild_rating_aggregates(self):
+        """Recompute the comment counters and average of every review in this
+        queryset from the comments table, in two UPDATE statements."""
+        comments = Comment.objects.filter(review=OuterRef("pk")).order_by().values("review")
+
+        def aggregate(expression):
+            return Coalesce(Subquery(comments.annotate(value=expression).values("value")), 0)
+
+        with transaction.atomic():
+            updated = self.update(
+                comment_count=aggregate(Count("pk")),
+                rating_sum=aggregate(Sum("rating")),
+                rating_count=aggregate(Count("rating")),
+            )
+            self.update(average_rating=average_rating_expression(), updated_at=timezone.now())
+        return updated
+
 
 class BookReview(models.Model):
     GENRE_CHOICES = [
@@ -36,11 +98,19 @@ class BookReview(models.Model):
     genre = models.CharField(max_length=10, choices=GENRE_CHOICES, default='OTHER') # 10
     comment = models.TextField()
     date = models.DateTimeField(auto_now_add=True)
+    # Version of the cached review card; bumped by every change it shows
+    updated_at = models.DateTimeField(auto_now=True)
+    # The author's own rating; comment ratings are kept in the counters below
     rating = models.IntegerField(choices=[(i, i) for i in range(1, 6)])
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    average_rating = models.FloatField(default=0, editable=False)
 
     # File upload field with metadata
     file_upload = models.FileField(
         upload_to="uploads/", 
+        storage=get_blob_storage,
         validators=[validate_review_file], 
         blank=True, 
         null=True
@@ -60,20 +130,130 @@ class BookReview(models.Model):
         blank=True, 
         null=True,
     )
+    # Thumbnail shown on the review cards, generated in the background
+    # (reviews.previews) for the attachment named in preview_of
+    preview = models.FileField(upload_to="previews/", blank=True, editable=False)
+    preview_of = models.CharField(max_length=255, blank=True, editable=False)
+
+    objects = BookReviewQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.title} - reviewed by {self.user.username}"
 
+    @property
+    def attachment_url(self):
+        # file_upload.url, through the attachment URL cache
+        return attachment_url(self)
+
+    @property
+    def preview_url(self):
+        return attachment_url(self, "preview")
+
+    @property
+    def attachment_on_s3(self):
+        # Asked of the storage, so the card needn't sign a URL to tell
+        return getattr(self.file_upload.storage, "bucket_name", None) is not None
+
+    @property
+    def card_version(self):
+        # Changes whenever anything the review card shows does
+        user = self.user
+        return f"{self.updated_at.timestamp()}:{user.username}:{user.first_name}:{user.last_name}"
+
     class Meta:
         ordering = ['-date']  # Most recent reviews first
+        indexes = [
+            # Keyset pagination orders used by review_list (either direction)
+            models.Index(fields=['average_rating', 'id'], name='review_rating_idx'),
+            models.Index(fields=['date', 'id'], name='review_date_idx'),
+            models.Index(fields=['author', 'id'], name='review_author_idx'),
+            models.Index(fields=['title', 'id'], name='review_title_idx'),
+        ]
+
+    # Kept by add_comment() and comment_deleted() with in-place updates
+    COUNTER_FIELDS = ("rating_sum", "rating_count", "comment_count", "average_rating")
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.average_rating = (self.rating + self.rating_sum) / (self.rating_count + 1)
+            super().save(*args, **kwargs)
+            return
+
+        # Writing this instance's copy of the counters back could undo a vote
+        # cast since it was loaded, so an edit leaves them to the database
+        if kwargs.get("update_fields") is None:
+            skipped = self.get_deferred_fields().union(self.COUNTER_FIELDS)
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if "rating" in kwargs["update_fields"]:
+                reviews = BookReview.objects.filter(pk=self.pk)
+                reviews.update(average_rating=average_rating_expression())
+                self.average_rating = reviews.values_list("average_rating", flat=True).get()
+
+    def add_comment(self, comment):
+        """Save ``comment`` on this review and bump the counters in the same
+        transaction. The counters are updated with F() expressions, so
+        concurrent commenters can't overwrite each other's votes."""
+        comment.review = self
+        counters = {"comment_count": F("comment_count") + 1}
+        if comment.rating is not None:
+            counters["rating_sum"] = F("rating_sum") + comment.rating
+            counters["rating_count"] = F("rating_count") + 1
+
+        reviews = BookReview.objects.filter(pk=self.pk)
+        with transaction.atomic():
+            comment.save()
+            reviews.update(**counters)
+            if comment.rating is not None:
+                # A second statement sees the incremented counters (and holds the row lock)
+                reviews.update(average_rating=average_rating_expression(), updated_at=timezone.now())
+
+    @staticmethod
+    def comment_deleted(comment):
+        """Take a deleted ``comment`` back out of its review's counters (see
+        the post_delete receiver in reviews.signals). Clamped at zero, so
+        counters that had already drifted don't fail the delete; the
+        reconcile_review_ratings command rebuilds them exactly."""
+        counters = {"comment_count": Greatest(F("comment_count") - 1, 0)}
+        if comment.rating is not None:
+            counters["rating_sum"] = Greatest(F("rating_sum") - comment.rating, 0)
+            counters["rating_count"] = Greatest(F("rating_count") - 1, 0)
+
+        reviews = BookReview.objects.filter(pk=comment.review_id)
+        with transaction.atomic():
+            reviews.update(**counters)
+            if comment.rating is not None:
+                reviews.update(average_rating=average_rating_expression(), updated_at=timezone.now())
+
+class BookReviewMembershipQuerySet(models.QuerySet):
+    def review_ids_for(self, user, review_ids):
+        """The ids among ``review_ids`` that ``user`` is a member of, in one
+        IN query, rather than every review the user has ever joined."""
+        review_ids = list(review_ids)
+        if not user.is_authenticated or not review_ids:
+            return set()
+        return set(
+            self.filter(user=user, review_id__in=review_ids).values_list("review_id", flat=True)
+        )
+
 
 class BookReviewMembership(models.Model):
     review = models.ForeignKey(BookReview, on_delete=models.CASCADE, related_name='memberships')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='memberships')
     joined_date = models.DateTimeField(default=timezone.now)
 
+    objects = BookReviewMembershipQuerySet.as_manager()
+
     class Meta:
         unique_together = ('review', 'user')
+        indexes = [
+            # Membership checks for the cards on a page filter by user first
+            models.Index(fields=['user', 'review'], name='membership_user_review_idx'),
+        ]
         
     def __str__(self):
         return f"{self.user.username} is a member of {self.review.title}"
@@ -113,4 +293,63 @@ class JoinRequest(models.Model):
     
     # Ensures that a user can only request to join a review once
     # class Meta:
-    #     unique_together = ('user', 'review')
\ No newline at end of file
+    #     unique_together = ('user', 'review')
+
+
+class UploadSession(models.Model):
+    """A resumable attachment upload. Chunks are appended to a staging file
+    on local disk (see reviews.uploads); once all ``size`` bytes are there
+    the file is moved to storage and ``stored_name`` is set, ready to be
+    attached to a review."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    # Optional SHA-256 (hex) of the whole file, checked once it is assembled
+    checksum = models.CharField(max_length=64, blank=True)
+    stored_name = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size}) by {self.user.username}"
+
+    @property
+    def staging_path(self):
+        return os.path.join(settings.UPLOAD_STAGING_DIR, f"{self.id.hex}.part")
+
+    @property
+    def is_complete(self):
+        return bool(self.stored_name)
+
+
+class AttachmentText(models.Model):
+    """Text extracted from a review's attachment for full-text search (see
+    reviews.extraction). Kept out of BookReview so the review rows, and
+    every card query, stay small."""
+    review = models.OneToOneField(
+        BookReview, on_delete=models.CASCADE, primary_key=True, related_name='attachment_text'
+    )
+    # The file_upload name the text came from, and the SHA-256 of its content
+    source = models.CharField(max_length=255)
+    content_hash = models.CharField(max_length=64)
+    text = models.TextField(blank=True)
+    extracted_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Text of {self.source}"
+
+
+class Blob(models.Model):
+    """One stored copy of some file content (see reviews.blobs), shared by
+    every review attachment and profile image with that content."""
+    hash = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last upload that stored or reused it; collection waits BLOB_GC_GRACE after
+    touched_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
@@ -0,0 +1,126 @@
+"""Thumbnails of review attachments for the review cards.
+
+Once a review with a new attachment commits, generate_preview() renders a
+small JPEG of it (a resized image, the first page of a PDF, the first
+lines of a text file) and stores it next to the original as
+BookReview.preview. It runs on the attachment worker pool
+(reviews.background), off the request cycle.
+
+Once the attachment is removed the preview is deleted, and so it is with
+the review (see reviews.signals). First PDF pages are rendered with
+pypdfium2 (in requirements.txt); where it isn't installed, PDFs get a plain
+document placeholder.
+"""
+import hashlib
+import logging
+import textwrap
+from io import BytesIO
+
+from django.utils import timezone
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+from . import derived
+from .background import run_after_commit
+from .models import BookReview
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_SIZE = (320, 320)
+PREVIEW_QUALITY = 80
+# Enough of a text file for the lines that fit on a preview
+TEXT_PREVIEW_BYTES = 4096
+TEXT_PREVIEW_LINES = 14
+
+
+def render_image(file):
+    image = Image.open(file)
+    # Let the JPEG decoder downscale while decoding rather than after
+    image.draft("RGB", PREVIEW_SIZE)
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    image.thumbnail(PREVIEW_SIZE)
+    return image
+
+
+def render_text(file):
+    text = file.read(TEXT_PREVIEW_BYTES).decode("utf-8", errors="replace")
+    lines = []
+    for line in text.splitlines():
+        lines.extend(textwrap.wrap(line, 44) or [""])
+    image = Image.new("RGB", PREVIEW_SIZE, "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+    for i, line in enumerate(lines[:TEXT_PREVIEW_LINES]):
+        draw.text((12, 12 + i * 20), line, fill="#333", font=font)
+    return image
+
+
+def render_placeholder(label):
+    image = Image.new("RGB", PREVIEW_SIZE, "#f1f3f5")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((110, 70, 210, 210), fill="white", outline="#adb5bd", width=3)
+    draw.text((160, 140), label, fill="#495057", font=ImageFont.load_default(), anchor="mm")
+    return image
+
+
+def render_pdf(file):
+    try:
+        import pypdfium2
+    except ImportError:
+        return render_placeholder("PDF")
+    document = pypdfium2.PdfDocument(file.read())
+    try:
+        page = document[0]
+        scale = min(PREVIEW_SIZE[0] / page.get_width(), PREVIEW_SIZE[1] / page.get_height())
+        return page.render(scale=scale).to_pil().convert("RGB")
+    finally:
+        document.close()
+
+
+RENDERERS = {
+    "jpg": render_image,
+    "pdf": render_pdf,
+    "txt": render_text,
+}
+
+
+def render_preview(file, name):
+    """JPEG bytes of a preview of ``file``, or None for unsupported types."""
+    renderer = RENDERERS.get(name.rsplit(".", 1)[-1].lower())
+    if renderer is None:
+        return None
+    buffer = BytesIO()
+    renderer(file).save(buffer, "JPEG", quality=PREVIEW_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def generate_preview(review_id):
+    """Render and store the preview of a review's current attachment, or
+    drop the preview of a removed one, unless that's done. Returns whether a
+    preview was stored."""
+    review = BookReview.objects.filter(pk=review_id).only("file_upload", "preview", "preview_of").first()
+    if review is None or not needs_preview(review):
+        return False
+
+    source = review.file_upload.name or ""
+    digest = hashlib.md5(source.encode()).hexdigest()[:12]
+
+    def render(file):
+        data = render_preview(file, source)
+        return {} if data is None else {"preview": (f"previews/{review_id}-{digest}.jpg", data)}
+
+    def record(stored):
+        return {"preview": stored.get("preview", ""), "preview_of": source, "updated_at": timezone.now()}
+
+    return derived.regenerate(
+        review, "file_upload", review.preview.storage, render, record, [review.preview.name], f"review:{review_id}"
+    )
+
+
+def schedule_preview(review_id):
+    """Generate the preview of ``review_id`` once the current transaction commits."""
+    run_after_commit(generate_preview, review_id)
+
+
+def needs_preview(review):
+    # Also once the attachment is removed, to delete its preview
+    return review.preview_of != (review.file_upload.name or "")
@@ -0,0 +1,53 @@
+from django.db.models import Exists, OuterRef, Q
+
+from mysite.search import FullTextIndex, hit_objects, search_all
+from users import roles
+
+from .models import AttachmentText, BookReview, BookReviewMembership
+
+review_index = FullTextIndex(
+    "reviews_bookreview_search",
+    BookReview,
+    {
+        "title": "A",
+        "author": "A",
+        "genre": "B",
+        "file_title": "B",
+        "file_keywords": "B",
+        "comment": "C",
+        "file_description": "D",
+    },
+)
+
+# Keyed by review id (AttachmentText's primary key), like review_index
+attachment_index = FullTextIndex(
+    "reviews_attachmenttext_search",
+    AttachmentText,
+    {"text": "D"},
+)
+
+
+def attachment_reviews(user):
+    """The reviews whose attachments ``user`` may open, or None for all of
+    them: the review_attachment view's rule (members, the owner and PMA
+    admins). A lazy queryset, so searches run it as a subquery."""
+    if user is None or not user.is_authenticated:
+        return BookReview.objects.none()
+    if roles.is_pma(user):
+        return None
+    is_member = BookReviewMembership.objects.filter(review=OuterRef("pk"), user=user)
+    return BookReview.objects.filter(Q(user=user) | Exists(is_member))
+
+
+def search_reviews(query, queryset=None, limit=20, offset=0, user=None):
+    """Reviews matching ``query`` in their own fields or their attachment's
+    text, best first (see mysite.search.search_all).
+
+    Attachment text is only searched, and only shows up in snippets, for
+    reviews whose attachment ``user`` may open; without a user, for none.
+    """
+    if queryset is None:
+        queryset = BookReview.objects.all()
+    within = {attachment_index: attachment_reviews(user)}
+    hits = search_all([review_index, attachment_index], query, limit, offset, within=within)
+    return hit_objects(hits, queryset)
@@ -0,0 +1,116 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from books.models import Book
+from mysite.cache import register_tags
+
+from . import autocomplete, blobs, derived, suggestions
+from .feed import refresh_home_feed
+from .models import BookReview, BookReviewMembership, Comment, JoinRequest, UploadSession
+from .extraction import needs_extraction, schedule_extraction
+from .previews import needs_preview, schedule_preview
+from .vocabulary import entries_for
+
+
+def update_vocabulary(add=(), discard=()):
+    spelling = suggestions.spelling_index.loaded()
+    prefixes = autocomplete.prefix_index.loaded()
+    for text, kind in discard:
+        if spelling is not None:
+            spelling.discard_text(text)
+        if prefixes is not None:
+            prefixes.discard(text, kind)
+    for text, kind in add:
+        if spelling is not None:
+            spelling.add_text(text)
+        if prefixes is not None:
+            prefixes.add(text, kind)
+
+
+@receiver(pre_save, sender=Book)
+@receiver(pre_save, sender=BookReview)
+def note_replaced_vocabulary(sender, instance, update_fields=None, **kwargs):
+    # The stored title/author, for add_to_vocabulary to swap out; None when
+    # they aren't changing, so a save that keeps them doesn't count them again
+    instance._replaced_vocabulary = None
+    if suggestions.spelling_index.loaded() is None and autocomplete.prefix_index.loaded() is None:
+        return
+    if update_fields is not None and not {"title", "author"} & set(update_fields):
+        return
+    if instance._state.adding:
+        instance._replaced_vocabulary = []
+        return
+    stored = sender._base_manager.filter(pk=instance.pk).values("title", "author").first()
+    replaced = entries_for(sender(**stored)) if stored else []
+    if replaced != entries_for(instance):
+        instance._replaced_vocabulary = replaced
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=BookReview)
+def add_to_vocabulary(sender, instance, **kwargs):
+    replaced = getattr(instance, "_replaced_vocabulary", None)
+    if replaced is not None:
+        update_vocabulary(add=entries_for(instance), discard=replaced)
+        instance._replaced_vocabulary = None
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=BookReview)
+def remove_from_vocabulary(sender, instance, **kwargs):
+    update_vocabulary(discard=entries_for(instance))
+
+
+register_tags(
+    BookReview,
+    lambda review: [
+        f"review:{review.pk}", "review:all", f"user:{review.user_id}", f"genre:{review.genre}"
+    ],
+)
+for model in (Comment, BookReviewMembership, JoinRequest):
+    register_tags(model, lambda row: [f"review:{row.review_id}", f"user:{row.user_id}"])
+
+
+@receiver(post_save, sender=BookReview)
+@receiver(post_delete, sender=BookReview)
+def rebuild_home_feed(sender, instance, **kwargs):
+    # Connected after the tag receivers above, so this runs after their
+    # on-commit invalidation
+    transaction.on_commit(refresh_home_feed)
+
+
+@receiver(post_delete, sender=Comment)
+def discount_comment(sender, instance, origin=None, **kwargs):
+    # Also covers comments deleted in bulk or by a cascade (a user's account),
+    # but not those deleted with their review: there's nothing left to count
+    if isinstance(origin, BookReview) and origin.pk == instance.review_id:
+        return
+    if isinstance(origin, QuerySet) and origin.model is BookReview:
+        return
+    BookReview.comment_deleted(instance)
+
+
+@receiver(post_save, sender=BookReview)
+def queue_preview(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and "file_upload" not in update_fields:
+        return
+    if needs_preview(instance):
+        schedule_preview(instance.pk)
+
+
+@receiver(post_save, sender=BookReview)
+def queue_text_extraction(sender, instance, created=False, update_fields=None, **kwargs):
+    if update_fields is not None and "file_upload" not in update_fields:
+        return
+    if created and not instance.file_upload:
+        return
+    if needs_extraction(instance):
+        schedule_extraction(instance.pk)
+
+
+blobs.track(BookReview, "file_upload")
+derived.track(BookReview, BookReview._meta.get_field("preview").storage, lambda review: [review.preview.name])
+# A finished upload holds its blob until it is attached or discarded
+blobs.track(UploadSession, "stored_name")
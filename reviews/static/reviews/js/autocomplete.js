@@ -0,0 +1,35 @@
+// Fills the <datalist> of every input[data-autocomplete-url] with completions
+// as the user types. Requests are debounced and stale responses are dropped.
+document.querySelectorAll("input[data-autocomplete-url]").forEach(function (input) {
+  var list = document.getElementById(input.getAttribute("list"));
+  var timer = null;
+  var latest = 0;
+
+  input.addEventListener("input", function () {
+    clearTimeout(timer);
+    var query = input.value.trim();
+    if (query.length < 2) {
+      list.replaceChildren();
+      return;
+    }
+    timer = setTimeout(function () {
+      var request = ++latest;
+      fetch(input.dataset.autocompleteUrl + "?q=" + encodeURIComponent(query))
+        .then(function (response) {
+          return response.json();
+        })
+        .then(function (data) {
+          if (request !== latest) return;
+          list.replaceChildren.apply(
+            list,
+            data.results.map(function (result) {
+              var option = document.createElement("option");
+              option.value = result.label;
+              return option;
+            })
+          );
+        })
+        .catch(function () {});
+    }, 80);
+  });
+});
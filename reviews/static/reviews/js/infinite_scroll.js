@@ -0,0 +1,34 @@
+// Infinite scroll for [data-infinite-scroll] containers: when a "Load more"
+// sentinel ([data-next-page]) scrolls into view, swap it for the next page of
+// cards (which carries its own sentinel). Without JS the link still works.
+(function () {
+  if (!("IntersectionObserver" in window)) return;
+
+  const observer = new IntersectionObserver(function (entries) {
+    entries.forEach(function (entry) {
+      if (!entry.isIntersecting) return;
+      const sentinel = entry.target;
+      observer.unobserve(sentinel);
+      fetch(sentinel.dataset.nextPage, { credentials: "same-origin" })
+        .then(function (response) {
+          if (!response.ok) throw new Error(response.statusText);
+          return response.text();
+        })
+        .then(function (html) {
+          sentinel.insertAdjacentHTML("afterend", html);
+          sentinel.remove();
+          watch();
+        })
+        .catch(function () {
+          observer.observe(sentinel);
+        });
+    });
+  }, { rootMargin: "600px" });
+
+  function watch() {
+    document.querySelectorAll("[data-infinite-scroll] [data-next-page]").forEach(function (el) {
+      observer.observe(el);
+    });
+  }
+  watch();
+})();
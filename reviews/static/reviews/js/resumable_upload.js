@@ -0,0 +1,142 @@
+// Resumable attachment uploads for forms with a file input marked
+// [data-resumable-upload]. On submit the file is sent in chunks to the
+// upload endpoints (see reviews/uploads.py) instead of inside the form; the
+// form then carries only the upload id. An interrupted upload resumes from
+// the server's offset, including after a page reload, since the upload URL
+// is remembered per file.
+(function () {
+  const CHUNK_SIZE = 4 * 1024 * 1024;
+  const MAX_RETRIES = 5;
+
+  function csrfToken(form) {
+    const input = form.querySelector("input[name=csrfmiddlewaretoken]");
+    return input ? input.value : "";
+  }
+
+  function encodeMetadata(values) {
+    return Object.keys(values).map(function (key) {
+      return key + " " + btoa(unescape(encodeURIComponent(values[key])));
+    }).join(",");
+  }
+
+  function toBase64(buffer) {
+    return btoa(String.fromCharCode.apply(null, new Uint8Array(buffer)));
+  }
+
+  function sha256(blob) {
+    if (!(window.crypto && crypto.subtle)) return Promise.resolve(null);
+    return blob.arrayBuffer().then(function (data) {
+      return crypto.subtle.digest("SHA-256", data);
+    });
+  }
+
+  function request(method, url, token, headers, body) {
+    return fetch(url, {
+      method: method,
+      credentials: "same-origin",
+      headers: Object.assign({ "X-CSRFToken": token }, headers),
+      body: body,
+    });
+  }
+
+  function serverOffset(url, token) {
+    return request("HEAD", url, token, {}).then(function (response) {
+      if (!response.ok) throw new Error("upload expired");
+      return parseInt(response.headers.get("Upload-Offset"), 10);
+    });
+  }
+
+  function createUpload(file, token, endpoint, storageKey) {
+    return request("POST", endpoint, token, {
+      "Upload-Length": String(file.size),
+      "Upload-Metadata": encodeMetadata({ filename: file.name }),
+    }).then(function (response) {
+      if (!response.ok) {
+        return response.text().then(function (message) { throw new Error(message); });
+      }
+      const url = response.headers.get("Location");
+      localStorage.setItem(storageKey, url);
+      return { url: url, offset: 0 };
+    });
+  }
+
+  function startOrResume(file, token, endpoint) {
+    const storageKey = "upload:" + [file.name, file.size, file.lastModified].join(":");
+    const saved = localStorage.getItem(storageKey);
+    const started = saved
+      ? serverOffset(saved, token).then(function (offset) {
+          return { url: saved, offset: offset };
+        }).catch(function () {
+          return createUpload(file, token, endpoint, storageKey);
+        })
+      : createUpload(file, token, endpoint, storageKey);
+    return started.then(function (upload) {
+      upload.storageKey = storageKey;
+      return upload;
+    });
+  }
+
+  function sendChunks(file, upload, token, onProgress, retries) {
+    if (upload.offset >= file.size) return Promise.resolve(upload);
+    const chunk = file.slice(upload.offset, upload.offset + CHUNK_SIZE);
+    return sha256(chunk).then(function (digest) {
+      const headers = {
+        "Content-Type": "application/offset+octet-stream",
+        "Upload-Offset": String(upload.offset),
+      };
+      if (digest) headers["Upload-Checksum"] = "sha256 " + toBase64(digest);
+      return request("PATCH", upload.url, token, headers, chunk);
+    }).then(function (response) {
+      if (response.ok) {
+        upload.offset = parseInt(response.headers.get("Upload-Offset"), 10);
+        onProgress(upload.offset / file.size);
+        return sendChunks(file, upload, token, onProgress, 0);
+      }
+      if (response.status < 500 && response.status !== 409 && response.status !== 460) {
+        return response.text().then(function (message) { throw new Error(message); });
+      }
+      throw new Error("retry");
+    }).catch(function (error) {
+      if (error.message !== "retry" && !(error instanceof TypeError)) throw error;
+      if (retries >= MAX_RETRIES) throw new Error("Upload failed, please try again.");
+      const delay = 500 * Math.pow(2, retries);
+      return new Promise(function (resolve) { setTimeout(resolve, delay); })
+        .then(function () { return serverOffset(upload.url, token); })
+        .then(function (offset) {
+          upload.offset = offset;
+          return sendChunks(file, upload, token, onProgress, retries + 1);
+        });
+    });
+  }
+
+  document.querySelectorAll("input[type=file][data-resumable-upload]").forEach(function (input) {
+    const form = input.form;
+    const progress = document.getElementById(input.dataset.progress);
+    const idInput = form.querySelector("input[name=upload_id]");
+
+    form.addEventListener("submit", function (event) {
+      const file = input.files[0];
+      if (!file || idInput.value) return;
+      event.preventDefault();
+      const token = csrfToken(form);
+      if (progress) progress.hidden = false;
+
+      startOrResume(file, token, input.dataset.resumableUpload)
+        .then(function (upload) {
+          return sendChunks(file, upload, token, function (fraction) {
+            if (progress) progress.value = fraction;
+          }, 0);
+        })
+        .then(function (upload) {
+          localStorage.removeItem(upload.storageKey);
+          idInput.value = upload.url.replace(/\/$/, "").split("/").pop();
+          input.value = "";
+          form.submit();
+        })
+        .catch(function (error) {
+          if (progress) progress.hidden = true;
+          alert(error.message);
+        });
+    });
+  });
+})();
@@ -0,0 +1,122 @@
+"""In-memory "did you mean" suggestions for the search page.
+
+The vocabulary is every word in Book and BookReview titles and authors.
+Lookups use a SymSpell-style deletion index: each word is stored under all
+the strings obtained by deleting up to ``max_distance`` characters from its
+prefix, so candidate corrections for a misspelling are found by generating
+the misspelling's own deletions -- a handful of dict probes rather than an
+edit-distance scan of the whole vocabulary.
+
+The index is process-local and kept fresh as described in reviews.vocabulary,
+with a full rebuild every SUGGESTIONS_REBUILD_SECONDS.
+"""
+import re
+import threading
+from collections import Counter, defaultdict
+from itertools import combinations
+
+from .vocabulary import ProcessIndex, catalog_entries
+
+MIN_WORD_LENGTH = 3
+
+
+def split_words(text):
+    return re.findall(r"[^\W_]+", (text or "").casefold())
+
+
+def edit_distance(a, b, max_distance):
+    """Optimal string alignment distance, or max_distance + 1 if larger."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class SpellingIndex:
+    def __init__(self, max_distance=2, prefix_length=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.words = Counter()
+        self.deletes = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def _deletes(self, word):
+        word = word[: self.prefix_length]
+        variants = {word}
+        for n in range(1, min(self.max_distance, len(word) - 1) + 1):
+            for positions in combinations(range(len(word)), n):
+                variants.add("".join(c for i, c in enumerate(word) if i not in positions))
+        return variants
+
+    def add_text(self, text):
+        for word in split_words(text):
+            if len(word) < MIN_WORD_LENGTH or word.isdigit():
+                continue
+            with self.lock:
+                if word not in self.words:
+                    for variant in self._deletes(word):
+                        self.deletes[variant].add(word)
+                self.words[word] += 1
+
+    def discard_text(self, text):
+        # Deletion entries are left behind; lookups skip words with no count
+        for word in split_words(text):
+            with self.lock:
+                if self.words.get(word, 0) > 1:
+                    self.words[word] -= 1
+                else:
+                    self.words.pop(word, None)
+
+    def lookup(self, word):
+        """Return the best known spelling of ``word``, or None."""
+        if word in self.words or len(word) < MIN_WORD_LENGTH or word.isdigit():
+            return word
+        # Two edits on a short word can turn it into almost anything
+        max_distance = 1 if len(word) <= 4 else self.max_distance
+        best = None
+        for variant in self._deletes(word):
+            for candidate in tuple(self.deletes.get(variant, ())):
+                count = self.words.get(candidate, 0)
+                if not count:
+                    continue
+                distance = edit_distance(word, candidate, max_distance)
+                if distance > max_distance:
+                    continue
+                key = (distance, -count, candidate)
+                if best is None or key < best:
+                    best = key
+        return best[2] if best else None
+
+    def suggest(self, query):
+        """Return ``query`` with misspelled words corrected, or None if
+        nothing needed (or could be) corrected."""
+        words = split_words(query)
+        corrected = [self.lookup(word) or word for word in words]
+        if corrected == words:
+            return None
+        return " ".join(corrected)
+
+
+def build_index():
+    index = SpellingIndex()
+    for text, _kind in catalog_entries():
+        index.add_text(text)
+    return index
+
+
+spelling_index = ProcessIndex(build_index, "SUGGESTIONS_REBUILD_SECONDS")
+
+
+def suggest(query):
+    return spelling_index.get().suggest(query)
@@ -1,8 +1,36 @@
-from django.test import TestCase
+import base64
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.apps import apps as django_apps
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
-from reviews.models import BookReview, BookReviewMembership, JoinRequest
+from reviews.models import (
+    AttachmentText, Blob, BookReview, BookReviewMembership, Comment, JoinRequest, UploadSession,
+)
+from django.utils.module_loading import autodiscover_modules, import_string
 from django.utils.timezone import now
+from books.models import Book
+from reviews import autocomplete, blobs, extraction, previews, suggestions
+from reviews.search import review_index
+from reviews.attachments import attachment_urls, prefetch_attachment_urls
+from reviews.views import REVIEW_SORTS
+from mysite import cache as tiered
+from mysite import metrics
+from mysite.search import registry as search_registry
+from mysite.storage import SignedFileSystemStorage, url_lifetime
 
 class ReviewViewTests(TestCase):
 
@@ -83,3 +111,1106 @@ class ReviewViewTests(TestCase):
         response = self.client.post(reverse('remove_book_review', args=[self.review1.id]))
         self.assertEqual(response.status_code, 302)
         self.assertFalse(BookReview.objects.filter(id=self.review1.id).exists())
+
+
+class ReviewListPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='pager', password='testpassword')
+        # Repeated authors, titles and ratings make the id tie-breaker matter
+        for i in range(45):
+            BookReview.objects.create(
+                user=cls.user, title=f"Title {i % 7}", author=f"Author {i % 4}",
+                comment="x", rating=i % 5 + 1,
+            )
+
+    def collect(self, params):
+        response = self.client.get(reverse('review_list'), params)
+        ids = [review.id for review in response.context['reviews']]
+        while response.context['next_query']:
+            response = self.client.get(f"{reverse('review_list_page')}?{response.context['next_query']}")
+            self.assertNotContains(response, "<html")
+            ids.extend(review.id for review in response.context['reviews'])
+        return ids
+
+    def test_every_sort_mode_pages_through_all_reviews_once(self):
+        for sort_by, column in REVIEW_SORTS.items():
+            for direction, prefix in (('asc', ''), ('desc', '-')):
+                with self.subTest(sort_by=sort_by, direction=direction):
+                    ids = self.collect({'sort_by': sort_by, 'sort_direction': direction})
+                    expected = BookReview.objects.order_by(f"{prefix}{column}", f"{prefix}id")
+                    self.assertEqual(ids, list(expected.values_list('id', flat=True)))
+
+    def test_default_order_is_newest_first(self):
+        ids = self.collect({})
+        self.assertEqual(ids, list(BookReview.objects.order_by('-date', '-id').values_list('id', flat=True)))
+
+    def test_pages_are_bounded_and_skip_offset(self):
+        first = self.client.get(reverse('review_list'), {'sort_by': 'title'})
+        self.assertEqual(len(first.context['reviews']), 20)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f"{reverse('review_list_page')}?{first.context['next_query']}")
+        self.assertFalse(any("OFFSET" in query['sql'] for query in queries))
+
+    def test_bad_cursor(self):
+        response = self.client.get(reverse('review_list_page'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('review_list'), {'cursor': 'garbage'})
+        self.assertEqual(len(response.context['reviews']), 20)
+
+
+    def test_membership_lookup_is_scoped_to_the_page(self):
+        reviews = list(BookReview.objects.order_by('-date', '-id'))
+        BookReviewMembership.objects.create(user=self.user, review=reviews[0])
+        BookReviewMembership.objects.create(user=self.user, review=reviews[-1])
+        self.client.login(username='pager', password='testpassword')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('review_list'))
+        self.assertEqual(response.context['membership_ids'], {reviews[0].id})
+        lookup = [q['sql'] for q in queries if 'reviews_bookreviewmembership' in q['sql']]
+        self.assertEqual(len(lookup), 1)
+        self.assertIn(' IN (', lookup[0])
+
+class ReviewCardQueryTests(TestCase):
+    """Card pages must cost a fixed number of queries however many cards they show."""
+
+    def setUp(self):
+        self.viewer = User.objects.create_user(username='viewer', password='testpassword')
+        self.client.login(username='viewer', password='testpassword')
+        self.review = self.add_reviews(3)[0]
+
+    def add_reviews(self, count):
+        reviews = []
+        for i in range(count):
+            author = User.objects.create_user(
+                username=f'card{User.objects.count()}', first_name='Card', last_name='Writer'
+            )
+            review = BookReview.objects.create(
+                user=author, title="Card Review", author="Card Author", genre="FICT",
+                comment="Shown on a card.", rating=4,
+            )
+            BookReviewMembership.objects.create(user=self.viewer, review=review)
+            reviews.append(review)
+        return reviews
+
+    def add_discussion(self, count):
+        for i in range(count):
+            commenter = User.objects.create_user(username=f'talker{User.objects.count()}')
+            self.review.add_comment(Comment(user=commenter, text="Agreed", rating=3))
+            JoinRequest.objects.create(user=commenter, review=self.review)
+
+    def count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_list_pages_use_fixed_query_count(self):
+        pages = [
+            (reverse('home'), None),
+            (reverse('review_list'), None),
+            (reverse('author_reviews', args=["Card Author"]), None),
+            (reverse('genre_reviews', args=["FICT"]), None),
+            (reverse('search_results'), {'search_query': 'card'}),
+        ]
+        def warm_up():
+            # The viewer's cached roles and the home feed
+            for url, params in pages:
+                self.client.get(url, params)
+
+        warm_up()
+        before = [self.count_queries(url, params) for url, params in pages]
+        self.add_reviews(5)
+        warm_up()
+        after = [self.count_queries(url, params) for url, params in pages]
+        self.assertEqual(before, after)
+
+    def test_review_detail_uses_fixed_query_count(self):
+        self.review.user = self.viewer
+        self.review.save()
+        url = reverse('review_detail', args=[self.review.id])
+        self.add_discussion(1)
+        self.count_queries(url)  # warm the viewer's cached roles
+        before = self.count_queries(url)
+        self.add_discussion(4)
+        self.assertEqual(self.count_queries(url), before)
+
+
+    def test_cards_are_rendered_from_cache_until_the_review_changes(self):
+        self.client.get(reverse('review_list'))
+        # Bulk updates don't bump updated_at, so the cached card stays
+        BookReview.objects.filter(pk=self.review.pk).update(title="Stale Title")
+        self.assertNotContains(self.client.get(reverse('review_list')), "Stale Title")
+
+        self.review.refresh_from_db()
+        self.review.save()
+        self.assertContains(self.client.get(reverse('review_list')), "Stale Title")
+
+        self.review.add_comment(Comment(user=self.viewer, text="Meh", rating=1))
+        self.assertContains(self.client.get(reverse('review_list')), "Rating: 2.50/5")
+
+        self.review.user.first_name = "Renamed"
+        self.review.user.save()
+        self.assertContains(self.client.get(reverse('review_list')), "Renamed Writer")
+
+class RatingAggregateTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='rater', password='testpassword')
+        self.client.login(username='rater', password='testpassword')
+        self.review = BookReview.objects.create(
+            user=self.user, title="Emma", author="Jane Austen", comment="Matchmaking.", rating=4,
+        )
+
+    def post_comment(self, rating):
+        return self.client.post(
+            reverse('review_detail', args=[self.review.id]), {'text': 'Thoughts', 'rating': rating}
+        )
+
+    def test_new_review_averages_its_own_rating(self):
+        self.assertEqual(self.review.average_rating, 4)
+        self.review.refresh_from_db()
+        self.assertEqual((self.review.rating_count, self.review.comment_count), (0, 0))
+
+    def test_comments_update_counters_without_touching_author_rating(self):
+        self.post_comment(1)
+        self.post_comment(2)
+        self.post_comment(2)
+        self.review.refresh_from_db()
+        self.assertEqual(self.review.rating, 4)
+        self.assertEqual((self.review.rating_sum, self.review.rating_count), (5, 3))
+        self.assertEqual(self.review.comment_count, 3)
+        self.assertAlmostEqual(self.review.average_rating, 9 / 4)
+
+    def test_unrated_comment_only_counts_as_comment(self):
+        self.review.add_comment(Comment(user=self.user, text="No score"))
+        self.review.refresh_from_db()
+        self.assertEqual((self.review.comment_count, self.review.rating_count), (1, 0))
+        self.assertEqual(self.review.average_rating, 4)
+
+    def test_changing_own_rating_updates_average(self):
+        self.post_comment(2)
+        self.review.rating = 5
+        self.review.save()
+        self.assertAlmostEqual(self.review.average_rating, 7 / 2)
+        self.review.refresh_from_db()
+        self.assertAlmostEqual(self.review.average_rating, 7 / 2)
+        self.assertEqual((self.review.rating_sum, self.review.rating_count), (2, 1))
+
+    def test_edit_keeps_votes_cast_since_load(self):
+        stale = BookReview.objects.get(pk=self.review.pk)
+        self.post_comment(1)
+        stale.title = "Emma (annotated)"
+        stale.save()
+        self.review.refresh_from_db()
+        self.assertEqual((self.review.rating_sum, self.review.rating_count), (1, 1))
+        self.assertAlmostEqual(self.review.average_rating, 5 / 2)
+
+    def test_deleted_comments_leave_the_counters(self):
+        commenter = User.objects.create_user(username='passerby', password='password123')
+        self.review.add_comment(Comment(user=self.user, text="Mine", rating=2))
+        self.review.add_comment(Comment(user=commenter, text="Theirs", rating=5))
+        self.review.add_comment(Comment(user=commenter, text="No score"))
+
+        Comment.objects.filter(text="Mine").delete()
+        self.review.refresh_from_db()
+        self.assertEqual((self.review.rating_sum, self.review.rating_count), (5, 1))
+        self.assertEqual(self.review.comment_count, 2)
+        self.assertAlmostEqual(self.review.average_rating, 9 / 2)
+
+        # Deleting the account cascades to its comments
+        commenter.delete()
+        self.review.refresh_from_db()
+        self.assertEqual((self.review.rating_sum, self.review.rating_count, self.review.comment_count), (0, 0, 0))
+        self.assertEqual(self.review.average_rating, 4)
+
+    def test_deleting_a_review_leaves_its_comments_uncounted(self):
+        other = BookReview.objects.create(user=self.user, title="Persuasion", author="Jane Austen", rating=3)
+        for review in (self.review, other):
+            for rating in (1, 2, None):
+                review.add_comment(Comment(user=self.user, text="Thoughts", rating=rating))
+
+        for delete in (self.review.delete, BookReview.objects.filter(pk=other.pk).delete):
+            with CaptureQueriesContext(connection) as queries:
+                delete()
+            updates = [q["sql"] for q in queries if q["sql"].startswith('UPDATE "reviews_bookreview"')]
+            self.assertEqual(updates, [])
+        self.assertFalse(Comment.objects.exists())
+
+    def test_migration_backfill_doesnt_count_blended_ratings_twice(self):
+        migration = importlib.import_module("reviews.migrations.0027_bookreview_rating_aggregates")
+        # The old comment handler left the author's 4 and the comments'
+        # 1 and 1 averaged into the rating
+        Comment.objects.bulk_create([
+            Comment(user=self.user, review=self.review, text="Thoughts", rating=1),
+            Comment(user=self.user, review=self.review, text="Thoughts", rating=1),
+        ])
+        BookReview.objects.filter(pk=self.review.pk).update(rating=2, rating_sum=0, rating_count=0)
+
+        migration.populate_rating_aggregates(django_apps, None)
+        self.review.refresh_from_db()
+        self.assertEqual(self.review.rating, 4)
+        self.assertEqual((self.review.rating_sum, self.review.rating_count), (2, 2))
+        self.assertEqual(self.review.average_rating, 2)
+
+    def test_reconcile_rebuilds_drifted_counters(self):
+        self.post_comment(5)
+        Comment.objects.create(user=self.user, review=self.review, text="Imported", rating=3)
+        BookReview.objects.update(rating_sum=99, average_rating=0)
+
+        out = StringIO()
+        call_command('reconcile_review_ratings', '--batch-size', '1', stdout=out)
+        self.review.refresh_from_db()
+        self.assertEqual((self.review.rating_sum, self.review.rating_count), (8, 2))
+        self.assertEqual(self.review.comment_count, 2)
+        self.assertEqual(self.review.average_rating, 4)
+        self.assertIn("Reconciled 1 reviews", out.getvalue())
+
+
+class ReviewSearchTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='searcher', password='testpassword')
+        self.dune = BookReview.objects.create(
+            user=self.user, title="Dune", author="Frank Herbert", genre="SCI_FI",
+            comment="Spice, sandworms and politics.", rating=5,
+        )
+        self.hobbit = BookReview.objects.create(
+            user=self.user, title="The Hobbit", author="J.R.R. Tolkien", genre="FANTASY",
+            comment="Dragons and dwarves; Dune fans will like it.", rating=4,
+            file_description="Map of the Lonely Mountain",
+        )
+
+    def search(self, query, **params):
+        return self.client.get(reverse('search_results'), {'search_query': query, **params})
+
+    def test_results_are_ranked_by_relevance(self):
+        response = self.search('dune')
+        self.assertEqual(response.context['reviews'], [self.dune, self.hobbit])
+
+    def test_search_covers_comment_and_file_description(self):
+        self.assertEqual(self.search('sandworms').context['reviews'], [self.dune])
+        self.assertEqual(self.search('lonely mountain').context['reviews'], [self.hobbit])
+
+    def test_search_by_genre_code(self):
+        self.assertEqual(self.search('SCI_FI').context['reviews'], [self.dune])
+
+    def test_empty_search_lists_every_review(self):
+        response = self.search('')
+        self.assertEqual(set(response.context['reviews']), {self.dune, self.hobbit})
+        self.assertNotContains(response, 'No reviews found')
+        self.assertEqual(self.client.get(reverse('search_results')).context['reviews'], response.context['reviews'])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.hobbit.title = "The Silmarillion"
+        self.hobbit.save()
+        self.assertEqual(self.search('silmarillion').context['reviews'], [self.hobbit])
+        self.hobbit.delete()
+        self.assertEqual(self.search('silmarillion').context['reviews'], [])
+
+    def test_results_are_paginated(self):
+        for i in range(12):
+            BookReview.objects.create(
+                user=self.user, title=f"Paged {i}", author="Someone", comment="x", rating=3,
+            )
+        first = self.search('paged')
+        self.assertEqual(len(first.context['reviews']), 10)
+        self.assertTrue(first.context['has_next'])
+        second = self.search('paged', page=2)
+        self.assertEqual(len(second.context['reviews']), 2)
+        self.assertFalse(second.context['has_next'])
+        self.assertFalse(set(first.context['reviews']) & set(second.context['reviews']))
+
+
+class SearchTriggerTests(TestCase):
+
+    def test_migrations_leave_every_index_synced(self):
+        # The test database is built by running the migrations, so one that
+        # remakes an indexed table without restoring its triggers fails here
+        autodiscover_modules('search')
+        self.assertIn('books_book_search', search_registry)
+        for name, index in search_registry.items():
+            self.assertEqual(index.missing_triggers(), [], name)
+
+    def test_missing_triggers_are_reported(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite trigger names')
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER reviews_bookreview_search_au')
+        self.assertEqual(review_index.missing_triggers(), ['reviews_bookreview_search_au'])
+        review_index.restore_triggers()
+        self.assertEqual(review_index.missing_triggers(), [])
+
+
+class SearchSuggestionTests(TestCase):
+
+    def setUp(self):
+        suggestions.spelling_index.reset()
+        self.addCleanup(suggestions.spelling_index.reset)
+        self.user = User.objects.create_user(username='speller', password='testpassword')
+        BookReview.objects.create(
+            user=self.user, title="The Hobbit", author="J.R.R. Tolkien", genre="FANTASY",
+            comment="There and back again.", rating=5,
+        )
+        Book.objects.create(
+            title="Frankenstein", author="Mary Shelley", genre="Horror", description="",
+            publisher="Lackington", date_published="1818-01-01",
+        )
+
+    def test_spelling_index_corrects_typos(self):
+        index = suggestions.SpellingIndex()
+        index.add_text("Tolkien Shelley Shelby Shelley")
+        self.assertEqual(index.lookup("tolkein"), "tolkien")
+        self.assertEqual(index.lookup("shelly"), "shelley")
+        self.assertIsNone(index.lookup("zzzzzz"))
+        self.assertIsNone(index.suggest("tolkien"))
+
+    def test_search_page_offers_correction_when_nothing_matches(self):
+        response = self.client.get(reverse('search_results'), {'search_query': 'Tolkein hobit'})
+        self.assertEqual(response.context['suggestion'], "tolkien hobbit")
+        self.assertContains(response, "Did you mean")
+
+    def test_json_endpoint_uses_book_vocabulary(self):
+        response = self.client.get(reverse('search_suggestions'), {'q': 'Frankenstien'})
+        self.assertEqual(response.json(), {"query": "Frankenstien", "suggestion": "frankenstein"})
+
+    def test_new_reviews_join_loaded_vocabulary(self):
+        suggestions.spelling_index.get()
+        BookReview.objects.create(
+            user=self.user, title="Neuromancer", author="William Gibson", comment="Cyberpunk.", rating=4,
+        )
+        self.assertEqual(suggestions.suggest("neuromancr"), "neuromancer")
+
+
+class AutocompleteTests(TestCase):
+
+    def setUp(self):
+        autocomplete.prefix_index.reset()
+        self.addCleanup(autocomplete.prefix_index.reset)
+        self.user = User.objects.create_user(username='completer', password='testpassword')
+        self.review = BookReview.objects.create(
+            user=self.user, title="The Hobbit", author="J.R.R. Tolkien", genre="FANTASY",
+            comment="There and back again.", rating=5,
+        )
+        Book.objects.create(
+            title="Hobbit Holes of the Shire", author="Tolkien Estate", genre="Fantasy",
+            description="", publisher="Allen & Unwin", date_published="1980-01-01",
+        )
+
+    def complete(self, prefix):
+        response = self.client.get(reverse('search_autocomplete'), {'q': prefix})
+        return [(result['label'], result['kind']) for result in response.json()['results']]
+
+    def test_prefix_index_matches_word_starts(self):
+        index = autocomplete.PrefixIndex([("The Lord of the Rings", "book_title"), ("Lorde", "author")])
+        self.assertEqual(index.complete("lor"), [("Lorde", "author"), ("The Lord of the Rings", "book_title")])
+        self.assertEqual(index.complete("RINGS"), [("The Lord of the Rings", "book_title")])
+        self.assertEqual(index.complete("ord"), [])
+        self.assertEqual(index.complete("  "), [])
+
+    def test_endpoint_covers_books_reviews_and_authors(self):
+        self.assertEqual(self.complete('hob'), [
+            ("Hobbit Holes of the Shire", "book_title"),
+            ("The Hobbit", "review_title"),
+        ])
+        self.assertEqual(self.complete('tolk'), [
+            ("Tolkien Estate", "author"),
+            ("J.R.R. Tolkien", "author"),
+        ])
+
+    def test_endpoint_does_not_query_database(self):
+        self.complete('hob')
+        with self.assertNumQueries(0):
+            self.complete('the')
+
+    def test_index_follows_writes(self):
+        self.complete('hob')
+        BookReview.objects.create(
+            user=self.user, title="Hobbit Lore", author="Someone", comment="", rating=3,
+        )
+        self.review.delete()
+        self.assertEqual(self.complete('hobbit l'), [("Hobbit Lore", "review_title")])
+        self.assertNotIn(("The Hobbit", "review_title"), self.complete('hob'))
+
+    def test_index_counts_follow_edits(self):
+        self.complete('hob')
+        words = suggestions.spelling_index.get().words
+        self.addCleanup(suggestions.spelling_index.reset)
+        loaded = (words["hobbit"], words["tolkien"])
+        self.review.comment = "Re-read it."
+        self.review.save()
+        self.review.save()
+        self.review.title = "Farmer Giles of Ham"
+        self.review.save()
+        self.assertNotIn(("The Hobbit", "review_title"), self.complete('hob'))
+        self.assertEqual(self.complete('farm'), [("Farmer Giles of Ham", "review_title")])
+        self.assertEqual(autocomplete.prefix_index.loaded().counts["J.R.R. Tolkien", "author"], 1)
+
+        self.review.delete()
+        self.assertEqual(self.complete('farm'), [])
+        self.assertNotIn(("J.R.R. Tolkien", "author"), autocomplete.prefix_index.loaded().counts)
+        self.assertNotIn("giles", words)
+        self.assertEqual((words["hobbit"], words["tolkien"]), (loaded[0] - 1, loaded[1] - 1))
+
+
+class TieredCacheTests(TestCase):
+
+    def make_cache(self, **options):
+        from django.core.cache import caches
+
+        backend = tiered.TieredCache(None, {"OPTIONS": {"SHARED": "shared", **options}})
+        self.addCleanup(caches["shared"].clear)
+        return backend
+
+    def test_local_tier_is_a_bounded_lru(self):
+        from django.core.cache import caches
+
+        backend = self.make_cache(LOCAL_MAX_ENTRIES=2)
+        backend.set("a", 1)
+        backend.set("b", 2)
+        backend.get("a")
+        backend.set("c", 3)
+        self.assertEqual(list(backend._local), [backend.make_key("a"), backend.make_key("c")])
+
+        caches["shared"].delete("a")
+        self.assertEqual(backend.get("a"), 1)
+        # "b" was evicted locally but is still in the shared tier
+        self.assertEqual(backend.get("b"), 2)
+
+    def test_local_copies_expire(self):
+        backend = self.make_cache(LOCAL_TIMEOUT=0)
+        backend.set("k", "v")
+        self.assertEqual(backend._local, {})
+        self.assertEqual(backend.get("k"), "v")
+
+    def test_model_writes_invalidate_tags(self):
+        user = User.objects.create_user(username='tagger')
+        review = BookReview.objects.create(user=user, title="Tagged", author="A", comment="", rating=3)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        tags = [f"review:{review.pk}"]
+        self.assertEqual(tiered.get_or_set_tagged("tagged", tags, compute), 1)
+        self.assertEqual(tiered.get_or_set_tagged("tagged", tags, compute), 1)
+        Comment.objects.create(user=user, review=review, text="New")
+        self.assertEqual(tiered.get_or_set_tagged("tagged", tags, compute), 2)
+
+        genre_tags = ["genre:OTHER"]
+        tiered.get_or_set_tagged("genre", genre_tags, compute)
+        BookReview.objects.create(user=user, title="Other", author="B", comment="", rating=1)
+        self.assertIsNone(tiered.get_tagged("genre", genre_tags))
+
+    def test_stats_are_counted_per_tag_family(self):
+        before = tiered.tag_stats().get("book", {})
+        tiered.get_or_set_tagged("stats", ["book:1"], lambda: "x")
+        tiered.get_or_set_tagged("stats", ["book:1"], lambda: "x")
+        after = tiered.tag_stats()["book"]
+        self.assertEqual(after["misses"] - before.get("misses", 0), 1)
+        self.assertEqual(after["hits"] - before.get("hits", 0), 1)
+
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        overrides = override_settings(METRICS_DIR=self.tmp, METRICS_TOKEN="scraper")
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scraper')
+        self.assertEqual(response.status_code, 200)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith("#"):
+                sample, value = line.rsplit(" ", 1)
+                samples[sample] = float(value)
+        return samples
+
+    def test_requests_are_recorded_per_view(self):
+        before = self.scrape()
+        self.client.get(reverse('books_view'))
+        after = self.scrape()
+
+        def delta(sample):
+            return after.get(sample, 0) - before.get(sample, 0)
+
+        view = 'method="GET",status="200",view="books_view"'
+        self.assertEqual(delta(f'http_request_duration_seconds_count{{{view}}}'), 1)
+        self.assertEqual(delta(f'http_request_duration_seconds_bucket{{{view},le="+Inf"}}'), 1)
+        self.assertGreater(delta('db_queries_per_request_sum{view="books_view"}'), 0)
+        self.assertGreater(delta('db_query_duration_seconds_total{view="books_view"}'), 0)
+        self.assertEqual(delta('template_render_duration_seconds_count{template="books/books_view.html"}'), 1)
+
+        tiered.get_or_set_tagged("metrics", ["book:1"], lambda: "x")
+        self.assertEqual(self.scrape().get('cache_tag_events_total{event="misses",family="book"}'),
+                         tiered.tag_stats()["book"]["misses"])
+
+    def test_counts_from_other_workers_are_added_up_and_kept_after_they_exit(self):
+        import subprocess
+
+        sample = 'db_query_duration_seconds_total{view="worker"}'
+        key = metrics._key({"view": "worker"})
+        exited = subprocess.Popen(["true"])
+        exited.wait()
+        for pid in (os.getppid(), exited.pid):
+            with open(os.path.join(self.tmp, f"{pid}-test.json"), "w") as f:
+                json.dump({"db_query_duration_seconds_total": {key: 1.5}}, f)
+
+        self.assertEqual(self.scrape()[sample], 3.0)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, f"{exited.pid}-test.json")))
+        self.assertEqual(self.scrape()[sample], 3.0)
+
+    def test_endpoint_needs_the_token(self):
+        url = reverse('metrics')
+        # Local addresses aren't trusted by default: a reverse proxy on the host forwards from them
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='127.0.0.1').status_code, 404)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+        response = self.client.get(url, REMOTE_ADDR='203.0.113.9', HTTP_AUTHORIZATION='Bearer scraper')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+        with self.settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer ').status_code, 404)
+        with self.settings(METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+
+SIGNED_STORAGES = {
+    "default": {"BACKEND": "mysite.storage.SignedFileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+@override_settings(STORAGES=SIGNED_STORAGES, ATTACHMENT_URL_MIN_LIFETIME=600)
+class AttachmentURLTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='attacher')
+        self.reviews = [
+            BookReview.objects.create(
+                user=user, title=f"Attached {i}", author="A", comment="", rating=3,
+                file_upload=f"uploads/notes{i}.pdf",
+            )
+            for i in range(3)
+        ]
+        self.storage = self.reviews[0].file_upload.storage
+
+    def test_signed_urls_verify_and_expire(self):
+        url = self.storage.url("uploads/notes0.pdf")
+        self.assertTrue(url.startswith("/media/uploads/notes0.pdf?"))
+        params = dict(pair.split("=") for pair in url.split("?")[1].split("&"))
+        self.assertTrue(self.storage.verify("uploads/notes0.pdf", params["expires"], params["signature"]))
+        self.assertFalse(self.storage.verify("uploads/notes1.pdf", params["expires"], params["signature"]))
+        self.assertFalse(self.storage.verify("uploads/notes0.pdf", 1, params["signature"]))
+
+    def test_urls_are_generated_once_per_name(self):
+        with mock.patch.object(SignedFileSystemStorage, "url", autospec=True, return_value="/signed") as url:
+            files = [review.file_upload for review in self.reviews]
+            self.assertEqual(set(attachment_urls(files).values()), {"/signed"})
+            attachment_urls(files)
+        self.assertEqual(url.call_count, 3)
+
+    def test_urls_near_expiry_are_not_cached(self):
+        self.storage.querystring_expire = 300
+        with mock.patch.object(SignedFileSystemStorage, "url", autospec=True, return_value="/signed") as url:
+            attachment_urls([self.reviews[0].file_upload])
+            attachment_urls([self.reviews[0].file_upload])
+        self.assertEqual(url.call_count, 2)
+
+    def test_page_of_reviews_is_resolved_together(self):
+        reviews = prefetch_attachment_urls(BookReview.objects.order_by('id'))
+        with mock.patch("reviews.attachments.cache.get_many", return_value={}) as get_many:
+            urls = [review.attachment_url for review in reviews]
+        get_many.assert_called_once()
+        self.assertTrue(all(url.startswith("/media/uploads/notes") for url in urls))
+        self.assertEqual(len(set(urls)), 3)
+
+
+FILE_STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+class UploadTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        overrides = override_settings(
+            STORAGES=FILE_STORAGES,
+            MEDIA_ROOT=os.path.join(self.tmp, "media"),
+            UPLOAD_STAGING_DIR=os.path.join(self.tmp, "staging"),
+            BLOB_GC_GRACE=0,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.user = User.objects.create_user(username='uploader', password='password')
+        self.client.login(username='uploader', password='password')
+        self.data = os.urandom(300 * 1024)
+
+    def start(self, filename="notes.pdf", **metadata):
+        metadata = {"filename": filename, **metadata}
+        header = ",".join(f"{key} {base64.b64encode(value.encode()).decode()}" for key, value in metadata.items())
+        return self.client.post(
+            reverse('upload_create'), HTTP_UPLOAD_LENGTH=str(len(self.data)), HTTP_UPLOAD_METADATA=header
+        )
+
+    def patch(self, location, offset, chunk, checksum=None):
+        headers = {"HTTP_UPLOAD_OFFSET": str(offset)}
+        if checksum is None:
+            checksum = hashlib.sha256(chunk).digest()
+        if checksum:
+            headers["HTTP_UPLOAD_CHECKSUM"] = "sha256 " + base64.b64encode(checksum).decode()
+        return self.client.generic(
+            "PATCH", location, chunk, content_type="application/offset+octet-stream", **headers
+        )
+
+    def test_create_form_uses_the_resumable_uploader(self):
+        response = self.client.get(reverse('create_review'))
+        self.assertContains(response, f'data-resumable-upload="{reverse("upload_create")}"')
+        self.assertContains(response, 'data-progress="upload-progress"')
+
+    def test_upload_resumes_from_the_server_offset(self):
+        response = self.start(sha256=hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(response.status_code, 201)
+        location = response["Location"]
+
+        response = self.patch(location, 0, self.data[:100 * 1024])
+        self.assertEqual(response["Upload-Offset"], str(100 * 1024))
+
+        # The client lost track of where it was: ask, then carry on from there
+        offset = int(self.client.head(location)["Upload-Offset"])
+        self.assertEqual(self.patch(location, 0, self.data[:10]).status_code, 409)
+        response = self.patch(location, offset, self.data[offset:])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["complete"])
+
+        session = UploadSession.objects.get()
+        self.assertTrue(session.stored_name.endswith(".pdf"))
+        self.assertFalse(os.path.exists(session.staging_path))
+        with BookReview._meta.get_field("file_upload").storage.open(session.stored_name) as stored:
+            self.assertEqual(stored.read(), self.data)
+
+    def test_corrupt_chunk_is_rejected_without_moving_the_offset(self):
+        location = self.start()["Location"]
+        response = self.patch(location, 0, self.data[:1024], checksum=b"x" * 32)
+        self.assertEqual(response.status_code, 460)
+        self.assertEqual(self.client.head(location)["Upload-Offset"], "0")
+        self.assertEqual(os.path.getsize(UploadSession.objects.get().staging_path), 0)
+
+    def test_whole_file_checksum_mismatch_restarts_the_upload(self):
+        location = self.start(sha256="0" * 64)["Location"]
+        self.assertEqual(self.patch(location, 0, self.data).status_code, 460)
+        session = UploadSession.objects.get()
+        self.assertEqual((session.offset, session.stored_name), (0, ""))
+
+    def test_rejects_disallowed_files_and_other_users(self):
+        self.assertEqual(self.start(filename="script.exe").status_code, 400)
+        location = self.start()["Location"]
+        User.objects.create_user(username='other', password='password')
+        self.client.login(username='other', password='password')
+        self.assertEqual(self.client.head(location).status_code, 404)
+
+    def test_finished_upload_is_attached_to_the_new_review(self):
+        location = self.start()["Location"]
+        self.patch(location, 0, self.data)
+        session = UploadSession.objects.get()
+
+        response = self.client.post(reverse('create_review'), {
+            'title': 'Big file', 'author': 'Someone', 'genre': 'FICT', 'comment': 'Long notes',
+            'rating': 4, 'upload_id': str(session.id),
+        })
+        self.assertEqual(response.status_code, 302)
+        review = BookReview.objects.get(title='Big file')
+        self.assertEqual(review.file_upload.name, session.stored_name)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_clear_stale_uploads(self):
+        self.start()
+        location = self.start()["Location"]
+        self.patch(location, 0, self.data)
+        stored_name = UploadSession.objects.exclude(stored_name="").get().stored_name
+        storage = BookReview._meta.get_field("file_upload").storage
+        self.assertTrue(storage.exists(stored_name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('clear_stale_uploads', max_age=0, stdout=StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(storage.exists(stored_name))
+
+
+class PreviewTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        overrides = override_settings(STORAGES=FILE_STORAGES, MEDIA_ROOT=self.tmp, ATTACHMENT_WORKERS=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.user = User.objects.create_user(username='previewer', password='password')
+        self.storage = BookReview._meta.get_field("file_upload").storage
+
+    def review_with(self, name, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return BookReview.objects.create(
+                user=self.user, title="Attached", author="A", comment="", rating=3,
+                file_upload=self.storage.save(name, ContentFile(data)),
+            )
+
+    def jpeg(self, size=(2000, 1500)):
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.new("RGB", size, "navy").save(buffer, "JPEG")
+        return buffer.getvalue()
+
+    def test_image_preview_is_a_small_jpeg(self):
+        from PIL import Image
+
+        review = self.review_with("uploads/photo.jpg", self.jpeg())
+        review.refresh_from_db()
+        self.assertEqual(review.preview_of, review.file_upload.name)
+        with review.preview.open("rb") as f:
+            image = Image.open(f)
+            self.assertEqual(image.format, "JPEG")
+            self.assertLessEqual(max(image.size), max(previews.PREVIEW_SIZE))
+
+        BookReviewMembership.objects.create(review=review, user=self.user)
+        self.client.login(username='previewer', password='password')
+        response = self.client.get(reverse('review_list'))
+        self.assertContains(response, review.preview.url)
+        self.assertNotContains(response, "<iframe")
+
+    def test_text_and_pdf_attachments_get_previews(self):
+        for name, data in [("uploads/notes.txt", b"First line\nSecond line\n"), ("uploads/notes.pdf", b"%PDF-1.4")]:
+            review = self.review_with(name, data)
+            review.refresh_from_db()
+            self.assertTrue(review.preview.name.startswith("previews/"), name)
+
+    def test_preview_follows_the_attachment(self):
+        review = self.review_with("uploads/photo.jpg", self.jpeg())
+        review.refresh_from_db()
+        first = review.preview.name
+
+        with mock.patch("reviews.signals.schedule_preview") as schedule:
+            review.save()
+        schedule.assert_not_called()
+
+        review.file_upload = self.storage.save("uploads/other.jpg", ContentFile(self.jpeg((640, 480))))
+        with self.captureOnCommitCallbacks(execute=True):
+            review.save()
+        review.refresh_from_db()
+        self.assertNotEqual(review.preview.name, first)
+        self.assertFalse(self.storage.exists(first))
+
+    def test_preview_is_deleted_with_the_attachment_or_review(self):
+        review = self.review_with("uploads/photo.jpg", self.jpeg())
+        review.refresh_from_db()
+        preview = review.preview.name
+        review.file_upload = None
+        with self.captureOnCommitCallbacks(execute=True):
+            review.save()
+        review.refresh_from_db()
+        self.assertEqual((review.preview.name, review.preview_of), ("", ""))
+        self.assertFalse(self.storage.exists(preview))
+
+        review = self.review_with("uploads/photo.jpg", self.jpeg())
+        review.refresh_from_db()
+        preview = review.preview.name
+        self.assertTrue(self.storage.exists(preview))
+        with self.captureOnCommitCallbacks(execute=True):
+            review.delete()
+        self.assertFalse(self.storage.exists(preview))
+
+    def test_broken_files_are_not_retried(self):
+        with self.assertLogs("reviews.derived", "ERROR"):
+            review = self.review_with("uploads/broken.jpg", b"not a jpeg")
+        review.refresh_from_db()
+        self.assertEqual((review.preview.name, review.preview_of), ("", review.file_upload.name))
+        self.assertFalse(previews.generate_preview(review.id))
+
+
+class AttachmentTextTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        overrides = override_settings(STORAGES=FILE_STORAGES, MEDIA_ROOT=self.tmp, ATTACHMENT_WORKERS=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.user = User.objects.create_user(username='extractor')
+        self.storage = BookReview._meta.get_field("file_upload").storage
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review = BookReview.objects.create(
+                user=self.user, title="Annotated", author="A", comment="Notes attached", rating=3,
+                file_upload=self.storage.save("uploads/notes.txt", ContentFile(b"The albatross returns.")),
+            )
+        # Attachment text is only searched for those who may open the attachment
+        self.client.force_login(self.user)
+
+    def search(self, query):
+        return self.client.get(reverse('search_results'), {'search_query': query})
+
+    def test_reviews_are_found_by_attachment_text(self):
+        response = self.search('albatross')
+        self.assertEqual(response.context['reviews'], [self.review])
+        self.assertContains(response, "<mark>albatross</mark>")
+        # Matching both the review and its attachment still lists it once
+        self.assertEqual(self.search('notes').context['reviews'], [self.review])
+
+    def test_attachment_text_is_private_to_those_who_can_open_it(self):
+        outsider = User.objects.create_user(username='outsider')
+        member = User.objects.create_user(username='member')
+        BookReviewMembership.objects.create(review=self.review, user=member)
+        BookReview.objects.filter(pk=self.review.pk).update(comment="Notes attached; the sailor returns")
+
+        for viewer in (None, outsider):
+            self.client.logout()
+            if viewer:
+                self.client.force_login(viewer)
+            self.assertEqual(self.search('albatross').context['reviews'], [])
+            # Found by its own fields; the card shows the comment, not a snippet
+            response = self.search('returns')
+            self.assertEqual(response.context['reviews'], [self.review])
+            self.assertContains(response, "Notes attached; the sailor returns")
+            self.assertNotContains(response, "albatross")
+
+        self.client.force_login(member)
+        self.assertEqual(self.search('albatross').context['reviews'], [self.review])
+
+    def test_attachment_visibility_is_checked_inside_the_search_query(self):
+        member = User.objects.create_user(username='member')
+        BookReviewMembership.objects.create(review=self.review, user=member)
+        self.client.force_login(member)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.search('albatross').context['reviews'], [self.review])
+        searches = [
+            q['sql'] for q in queries
+            if 'reviews_attachmenttext_search MATCH' in q['sql'] and 'OFFSET' in q['sql']
+        ]
+        # A subquery rather than a list of the member's review ids, however many they are in
+        self.assertTrue(all('reviews_bookreviewmembership' in sql for sql in searches))
+        self.assertTrue(searches)
+
+    def test_unchanged_content_is_not_extracted_again(self):
+        with mock.patch("reviews.extraction.extract_text") as extract, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.review.save()
+            extraction.extract_attachment_text(self.review.id)
+        extract.assert_not_called()
+
+        self.review.file_upload = self.storage.save("uploads/new.txt", ContentFile(b"A kestrel now."))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review.save()
+        self.assertEqual(self.search('kestrel').context['reviews'], [self.review])
+        self.assertEqual(self.search('albatross').context['reviews'], [])
+
+    def test_removing_the_attachment_removes_its_text(self):
+        self.review.file_upload = None
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review.save()
+        self.assertFalse(AttachmentText.objects.exists())
+        self.assertEqual(self.search('albatross').context['reviews'], [])
+
+    def test_extraction_stops_at_the_limit(self):
+        text = extraction.extract_text(BytesIO("é".encode() * 100000), "big.txt", max_chars=1000)
+        self.assertEqual(text, "é" * 1000)
+
+
+class BlobStorageTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        overrides = override_settings(
+            STORAGES=FILE_STORAGES, MEDIA_ROOT=self.tmp, ATTACHMENT_WORKERS=0, BLOB_GC_GRACE=0
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.user = User.objects.create_user(username='sharer', password='password')
+        self.client.login(username='sharer', password='password')
+
+    def upload(self, title, data, name="shared.pdf"):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_review'), {
+                'title': title, 'author': 'A', 'genre': 'FICT', 'comment': 'c', 'rating': 3,
+                'file_upload': ContentFile(data, name=name),
+            })
+        return BookReview.objects.get(title=title)
+
+    def stored_blobs(self):
+        blob_dir = os.path.join(self.tmp, blobs.BLOB_PREFIX)
+        return [os.path.join(root, f) for root, _, files in os.walk(blob_dir) for f in files]
+
+    def test_same_content_is_stored_once(self):
+        first = self.upload("First", b"%PDF same bytes")
+        second = self.upload("Second", b"%PDF same bytes", name="renamed.pdf")
+        self.assertEqual(first.file_upload.name, second.file_upload.name)
+        self.assertTrue(blobs.is_blob(first.file_upload.name))
+        self.assertEqual(Blob.objects.get().refcount, 2)
+        self.assertEqual(len(self.stored_blobs()), 1)
+
+    def test_blob_is_deleted_with_its_last_reference(self):
+        first = self.upload("First", b"%PDF same bytes")
+        second = self.upload("Second", b"%PDF same bytes")
+        name = first.file_upload.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(first.file_upload.storage.exists(name))
+
+        # Replacing the attachment drops the reference as well
+        second.file_upload = ContentFile(b"other text", name="other.txt")
+        with self.captureOnCommitCallbacks(execute=True):
+            second.save()
+        self.assertFalse(second.file_upload.storage.exists(name))
+        self.assertEqual(list(Blob.objects.values_list("name", "refcount")), [(second.file_upload.name, 1)])
+
+    def test_gc_blobs_recounts_references(self):
+        review = self.upload("First", b"%PDF same bytes")
+        Blob.objects.update(refcount=5)
+        BookReview.objects.filter(pk=review.pk).update(file_upload="")
+
+        call_command('gc_blobs', recount=True, stdout=StringIO())
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(self.stored_blobs(), [])
+
+
+@override_settings(ATTACHMENT_WORKERS=0, FILE_DELIVERY="django")
+class AttachmentDownloadTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        overrides = override_settings(STORAGES=FILE_STORAGES, MEDIA_ROOT=self.tmp)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.owner = User.objects.create_user(username='owner', password='password')
+        self.member = User.objects.create_user(username='member', password='password')
+        User.objects.create_user(username='outsider', password='password')
+        self.review = BookReview.objects.create(
+            user=self.owner, title="Private notes", author="A", comment="", rating=3,
+            file_title="Chapter notes",
+            file_upload=ContentFile(b"0123456789abcdef", name="notes.txt"),
+        )
+        BookReviewMembership.objects.create(review=self.review, user=self.member)
+        self.url = reverse('review_attachment', args=[self.review.id])
+
+    def get(self, username, **headers):
+        self.client.login(username=username, password='password')
+        return self.client.get(self.url, **headers)
+
+    def test_only_members_can_download(self):
+        self.assertEqual(self.get('outsider').status_code, 403)
+        response = self.get('member')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789abcdef")
+        self.assertIn("Chapter%20notes.txt", response["Content-Disposition"])
+
+    def test_cards_show_the_attachment_only_to_those_who_can_download_it(self):
+        BookReview.objects.filter(pk=self.review.pk).update(
+            preview="previews/notes.webp", file_keywords="marginalia",
+        )
+        pages = [
+            reverse('author_reviews', args=['A']),
+            reverse('genre_reviews', args=['OTHER']),
+            reverse('search_results') + '?search_query=private',
+        ]
+        for username in (None, 'outsider', 'member', 'owner'):
+            self.client.logout()
+            if username:
+                self.client.login(username=username, password='password')
+            for page in pages:
+                response = self.client.get(page)
+                self.assertContains(response, "Private notes")
+                for attachment_detail in ("Chapter notes", "marginalia", "previews/notes.webp", self.url):
+                    if username in ('member', 'owner'):
+                        self.assertContains(response, attachment_detail)
+                    else:
+                        self.assertNotContains(response, attachment_detail)
+
+    def test_cards_dont_sign_an_attachment_url_to_say_where_it_is_hosted(self):
+        self.client.login(username='owner', password='password')
+        with mock.patch.object(BookReview, 'attachment_url', new_callable=mock.PropertyMock) as signed:
+            response = self.client.get(reverse('author_reviews', args=['A']))
+        self.assertContains(response, "Chapter notes")
+        self.assertNotContains(response, "hosted on S3")
+        signed.assert_not_called()
+
+    def test_search_snippets_dont_quote_hidden_attachment_details(self):
+        BookReview.objects.filter(pk=self.review.pk).update(
+            comment="Kept for the reading group", file_keywords="secretword",
+        )
+        self.client.login(username='outsider', password='password')
+        response = self.client.get(reverse('search_results'), {'search_query': 'secretword'})
+        self.assertEqual(response.context['reviews'], [self.review])
+        self.assertNotContains(response, "secretword")
+        self.assertContains(response, "Kept for the reading group")
+
+        self.client.login(username='member', password='password')
+        response = self.client.get(reverse('search_results'), {'search_query': 'secretword'})
+        self.assertContains(response, "<mark>secretword</mark>")
+
+    def test_ranges_and_conditional_requests(self):
+        etag = self.get('member')["ETag"]
+        response = self.get('member', HTTP_RANGE="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 2-5/16")
+        self.assertEqual(b"".join(response.streaming_content), b"2345")
+        self.assertEqual(b"".join(self.get('member', HTTP_RANGE="bytes=-3").streaming_content), b"def")
+        self.assertEqual(self.get('member', HTTP_RANGE="bytes=20-").status_code, 416)
+
+        self.assertEqual(self.get('member', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # A stale If-Range gets the whole file rather than a mismatched piece
+        self.assertEqual(self.get('member', HTTP_RANGE="bytes=2-5", HTTP_IF_RANGE='"old"').status_code, 200)
+
+    @override_settings(FILE_DELIVERY="accel", FILE_ACCEL_PREFIX="/protected/")
+    def test_accel_redirect_hands_off_the_transfer(self):
+        response = self.get('owner')
+        self.assertEqual(response["X-Accel-Redirect"], "/protected/" + self.review.file_upload.name)
+        self.assertEqual(response.content, b"")
+
+    def test_production_media_storage_signs_urls(self):
+        # Otherwise "redirect" delivery streams every download, and the
+        # attachment and preview URLs on cards are public. The settings are
+        # read afresh for each MEDIA_STORAGE, whatever this run was given.
+        for media_storage in ("s3", "local"):
+            with self.subTest(MEDIA_STORAGE=media_storage):
+                spec = importlib.util.find_spec("mysite.settings")
+                settings_module = importlib.util.module_from_spec(spec)
+                with mock.patch.dict(os.environ, {"MEDIA_STORAGE": media_storage}):
+                    spec.loader.exec_module(settings_module)
+                media = settings_module.STORAGES["default"]
+                storage = import_string(media["BACKEND"])(**media.get("OPTIONS", {}))
+                self.assertIsNotNone(url_lifetime(storage))
+                self.assertIn("expires=", storage.url("blobs/notes.txt", expire=60).lower())
+
+    @override_settings(FILE_DELIVERY="redirect")
+    def test_redirect_without_signing_streams_with_a_warning(self):
+        with self.assertLogs("mysite.files", "WARNING"):
+            response = self.get('member')
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789abcdef")
+
+    @override_settings(FILE_DELIVERY="redirect", STORAGES=SIGNED_STORAGES)
+    def test_redirect_to_short_lived_signed_url(self):
+        response = self.get('member')
+        self.assertEqual(response.status_code, 302)
+        expires = int(response["Location"].split("expires=")[1].split("&")[0])
+        self.assertLessEqual(expires, time.time() + 60)
+
+        served = self.client.get(response["Location"], HTTP_RANGE="bytes=0-3")
+        self.assertEqual(b"".join(served.streaming_content), b"0123")
+        self.assertEqual(self.client.get(response["Location"].replace("signature=", "signature=x")).status_code, 404)
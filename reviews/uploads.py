@@ -0,0 +1,155 @@
+"""Resumable, chunked attachment uploads.
+
+A tus-style protocol over three endpoints (see the upload_* views):
+
+* POST creates an UploadSession from Upload-Length (the total size) and
+  Upload-Metadata (``filename`` and, optionally, the file's ``sha256``).
+* HEAD reports how many bytes the server has (Upload-Offset), so an
+  interrupted client knows where to resume.
+* PATCH appends one chunk at Upload-Offset, optionally with an
+  ``Upload-Checksum: sha256 <base64 digest>`` header for that chunk.
+
+Chunks are streamed from the request to a staging file in fixed-size
+blocks, and the finished file is streamed from there to storage, so an
+upload never holds more than one block in memory whatever its size.
+"""
+import base64
+import hashlib
+import os
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import transaction
+
+from .models import BookReview, UploadSession, validate_review_file_name
+
+BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def create_session(user, filename, size, checksum="", max_size=None):
+    filename = os.path.basename(filename or "")
+    try:
+        validate_review_file_name(filename)
+    except ValidationError as e:
+        raise UploadError(e.messages[0])
+    if size <= 0:
+        raise UploadError("Upload-Length must be positive")
+    if max_size is not None and size > max_size:
+        raise UploadError("File too large", status=413)
+
+    session = UploadSession.objects.create(
+        user=user, filename=filename, size=size, checksum=checksum.lower()
+    )
+    os.makedirs(os.path.dirname(session.staging_path), exist_ok=True)
+    open(session.staging_path, "wb").close()
+    return session
+
+
+def parse_metadata(header):
+    """Decode an Upload-Metadata header: comma-separated "key base64value" pairs."""
+    metadata = {}
+    for pair in (header or "").split(","):
+        key, _, value = pair.strip().partition(" ")
+        if not key:
+            continue
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode()
+        except (ValueError, UnicodeDecodeError):
+            raise UploadError("Malformed Upload-Metadata")
+    return metadata
+
+
+def parse_checksum(header):
+    if not header:
+        return None
+    algorithm, _, digest = header.partition(" ")
+    if algorithm.lower() != "sha256":
+        raise UploadError("Unsupported checksum algorithm")
+    try:
+        return base64.b64decode(digest, validate=True)
+    except ValueError:
+        raise UploadError("Malformed Upload-Checksum")
+
+
+def append_chunk(session_id, user, stream, offset, length, checksum=None):
+    """Write ``length`` bytes from ``stream`` at ``offset`` and return the
+    session. A chunk that arrives short or fails its checksum is discarded,
+    leaving the offset where it was."""
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session_id, user=user)
+        if session.is_complete:
+            raise UploadError("Upload already complete", status=409)
+        if offset != session.offset:
+            raise UploadError("Upload-Offset does not match", status=409)
+        if session.offset + length > session.size:
+            raise UploadError("Chunk runs past Upload-Length", status=413)
+
+        digest = hashlib.sha256()
+        received = 0
+        with open(session.staging_path, "r+b") as staged:
+            staged.seek(offset)
+            while received < length:
+                block = stream.read(min(BLOCK_SIZE, length - received))
+                if not block:
+                    break
+                staged.write(block)
+                digest.update(block)
+                received += len(block)
+            if received != length or (checksum is not None and digest.digest() != checksum):
+                staged.truncate(offset)
+                if received != length:
+                    raise UploadError("Chunk ended early")
+                raise UploadError("Checksum mismatch", status=460)
+
+        session.offset += received
+        session.save(update_fields=["offset"])
+
+    if session.offset == session.size:
+        finish(session)
+    return session
+
+
+def finish(session):
+    """Check the assembled file and move it to attachment storage."""
+    path = session.staging_path
+    if session.checksum:
+        digest = hashlib.sha256()
+        with open(path, "rb") as staged:
+            for block in iter(lambda: staged.read(BLOCK_SIZE), b""):
+                digest.update(block)
+        if digest.hexdigest() != session.checksum:
+            # Start over: nothing the client sent can be trusted
+            open(path, "wb").close()
+            session.offset = 0
+            session.save(update_fields=["offset"])
+            raise UploadError("Checksum mismatch", status=460)
+
+    field = BookReview._meta.get_field("file_upload")
+    with open(path, "rb") as staged:
+        file = File(staged, name=session.filename)
+        # Verified above, so blob storage needn't hash the file again
+        file.sha256 = session.checksum
+        name = field.storage.save(
+            field.generate_filename(None, session.filename), file, max_length=field.max_length
+        )
+    session.stored_name = name
+    session.save(update_fields=["stored_name"])
+    os.remove(path)
+
+
+def discard(session):
+    """Delete a session with whatever it has stored. A finished upload that
+    never made it onto a review is removed from attachment storage too."""
+    try:
+        os.remove(session.staging_path)
+    except FileNotFoundError:
+        pass
+    if session.stored_name and not BookReview.objects.filter(file_upload=session.stored_name).exists():
+        BookReview._meta.get_field("file_upload").storage.delete(session.stored_name)
+    session.delete()
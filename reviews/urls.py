@@ -1,20 +1,24 @@
 from django.urls import path
 from . import views
-from django.conf.urls.static import static
-from django.conf import settings
 from .views import join_review
 from django.contrib.auth import views as auth_views
 
 urlpatterns = [
     path('', views.review_list, name='review_list'),
+    path('page/', views.review_list_page, name='review_list_page'),
     path('create/', views.create_review, name='create_review'),
     path('create_review/<int:book_id>/', views.create_review, name='create_review_with_book'),
+    path('uploads/', views.upload_create, name='upload_create'),
+    path('uploads/<uuid:upload_id>/', views.upload_detail, name='upload_detail'),
     path('author/<str:author>/', views.author_reviews, name='author_reviews'),
     path('genre/<str:genre>/', views.genre_reviews, name='genre_reviews'),
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
     path('search/', views.book_list, name='search_results'),
+    path('search/suggest/', views.search_suggestions, name='search_suggestions'),
+    path('search/autocomplete/', views.search_autocomplete, name='search_autocomplete'),
     path('join/<int:review_id>/', join_review, name='join_review'),
     path('review/<int:review_id>/', views.review_detail, name='review_detail'),
+    path('review/<int:review_id>/attachment/', views.review_attachment, name='review_attachment'),
     path('about/', views.about, name='about'),
     path('remove_book_review/<int:review_id>/', views.remove_book_review, name='remove_book_review'),
     path('reviews/<int:review_id>/join-request/', views.join_review_request, name='join_review_request'),
@@ -22,4 +26,4 @@ urlpatterns = [
     path('review/<int:review_id>/leave/', views.leave_review, name='leave_review'),
 
 
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+]
\ No newline at end of file
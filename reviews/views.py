@@ -1,36 +1,65 @@
+import os
 import re
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from .models import BookReview, BookReviewMembership, Comment, JoinRequest
+from .models import BookReview, BookReviewMembership, Comment, JoinRequest, UploadSession
 from .forms import BookReviewForm, BookSearchForm, CommentForm, ReviewForm
-from django.http import JsonResponse
-from django.db.models import Q, Avg
+from .attachments import prefetch_attachment_urls
+from .search import search_reviews
+from . import uploads
+from . import autocomplete, suggestions
+from users import roles
+from django.conf import settings
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotAllowed,
+    JsonResponse,
+)
+from django.db.models import Exists, OuterRef
 import logging
 from django.contrib import messages
 from django.urls import reverse
 from books.models import Book
 from django.utils import timezone
+from mysite.files import serve_file
+from mysite.pagination import InvalidCursor, keyset_paginate
 
 logger = logging.getLogger(__name__)
 
+SEARCH_PAGE_SIZE = 10
+REVIEWS_PAGE_SIZE = 20
+
+# sort_by value -> column; each has a matching (column, id) index
+REVIEW_SORTS = {
+    "rating": "average_rating",
+    "date": "date",
+    "author": "author",
+    "title": "title",
+}
+
 
 def about(request):
-    context  = { "pma_flag": (
-            request.user.groups.filter(name="PMA").exists()
-            if request.user.is_authenticated
-            else False
-        ),}
-    return render(request, "reviews/about.html", context)
+    return render(request, "reviews/about.html")
 
 
 @login_required
 def create_review(request, book_id=None):
     if request.method == "POST":
         form = ReviewForm(request.POST, request.FILES)
+        upload = None
+        if form.is_valid() and form.cleaned_data["upload_id"]:
+            upload = UploadSession.objects.filter(
+                pk=form.cleaned_data["upload_id"], user=request.user
+            ).exclude(stored_name="").first()
+            if upload is None:
+                form.add_error(None, "The attachment upload was not found or is not finished.")
         if form.is_valid():
             review = form.save(commit=False)
             review.user = request.user
+            if upload is not None:
+                review.file_upload.name = upload.stored_name
             review.save()
+            if upload is not None:
+                upload.delete()
 
             membership, created = BookReviewMembership.objects.get_or_create(
                 review=review, 
@@ -51,17 +80,71 @@ def create_review(request, book_id=None):
         else:
             form = ReviewForm()
 
-    context = {"form": form,
-               
-               "pma_flag": (
-                request.user.groups.filter(name="PMA").exists()
-                if request.user.is_authenticated
-                else False
-                ),
-               
-               }
+    context = {"form": form}
     return render(request, "reviews/create_review.html", context)
 
+def upload_status(session, status=200):
+    response = JsonResponse(
+        {"id": str(session.id), "offset": session.offset, "size": session.size,
+         "complete": session.is_complete},
+        status=status,
+    )
+    response["Upload-Offset"] = session.offset
+    response["Upload-Length"] = session.size
+    response["Cache-Control"] = "no-store"
+    return response
+
+
+@login_required
+def upload_create(request):
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    try:
+        metadata = uploads.parse_metadata(request.headers.get("Upload-Metadata"))
+        try:
+            size = int(request.headers.get("Upload-Length", ""))
+        except ValueError:
+            raise uploads.UploadError("Upload-Length is required")
+        session = uploads.create_session(
+            request.user, metadata.get("filename"), size, metadata.get("sha256", ""),
+            max_size=settings.UPLOAD_MAX_SIZE,
+        )
+    except uploads.UploadError as e:
+        return HttpResponse(str(e), status=e.status)
+    response = upload_status(session, status=201)
+    response["Location"] = reverse("upload_detail", args=[session.id])
+    return response
+
+
+@login_required
+def upload_detail(request, upload_id):
+    session = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    if request.method in ("GET", "HEAD"):
+        return upload_status(session)
+    if request.method == "DELETE":
+        uploads.discard(session)
+        return HttpResponse(status=204)
+    if request.method != "PATCH":
+        return HttpResponseNotAllowed(["GET", "HEAD", "PATCH", "DELETE"])
+
+    # Any other type would have Django parse (and buffer) the body as a form
+    if request.content_type != "application/offset+octet-stream":
+        return HttpResponse("Content-Type must be application/offset+octet-stream", status=415)
+    try:
+        offset = int(request.headers.get("Upload-Offset", ""))
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return HttpResponseBadRequest("Upload-Offset and Content-Length are required")
+    if length > settings.UPLOAD_MAX_CHUNK_SIZE:
+        return HttpResponse("Chunk too large", status=413)
+    try:
+        checksum = uploads.parse_checksum(request.headers.get("Upload-Checksum"))
+        session = uploads.append_chunk(session.pk, request.user, request, offset, length, checksum)
+    except uploads.UploadError as e:
+        return HttpResponse(str(e), status=e.status)
+    return upload_status(session)
+
+
 @login_required
 def leave_review(request, review_id):
     review = get_object_or_404(BookReview, id=review_id)
@@ -74,80 +157,88 @@ def leave_review(request, review_id):
     messages.success(request, f"You have left the review for {review.title}")
     return redirect('home')
 
-def review_list(request):
-    reviews = BookReview.objects.all()
+def review_ordering(sort_by, sort_direction):
+    column = REVIEW_SORTS.get(sort_by)
+    if column is None:
+        # Default sorting if no (known) sort parameter is provided
+        return ["-date", "-id"]
+    order_prefix = "-" if sort_direction == "desc" else ""
+    return [f"{order_prefix}{column}", f"{order_prefix}id"]
 
-    sort_by = request.GET.get("sort_by", "")
-    sort_direction = request.GET.get("sort_direction", "desc")
 
-    order_prefix = "-" if sort_direction == "desc" else ""
+def get_reviews_page(request, cursor=None):
+    ordering = review_ordering(
+        request.GET.get("sort_by", ""), request.GET.get("sort_direction", "desc")
+    )
+    return keyset_paginate(BookReview.objects.for_cards(), ordering, cursor, REVIEWS_PAGE_SIZE)
 
-    if sort_by:
-        if sort_by == "rating":
-            reviews = reviews.order_by(f"{order_prefix}rating")
-        elif sort_by == "date":
-            reviews = reviews.order_by(f"{order_prefix}date")
-        elif sort_by == "author":
-            reviews = reviews.order_by(f"{order_prefix}author")
-        elif sort_by == "title":
-            reviews = reviews.order_by(f"{order_prefix}title")
-    else:
-        # Default sorting if no sort parameter is provided
-        reviews = reviews.order_by("-date")
 
-    if request.user.is_authenticated:
-        membership_ids = set(
-            request.user.memberships.values_list("review_id", flat=True)
-        )
-    else:
-        membership_ids = set()
+def membership_ids_for(request, reviews):
+    # The reviews the viewer is a member of, which review_card.html shows in full
+    return BookReviewMembership.objects.review_ids_for(request.user, [review.id for review in reviews])
 
-    context = {
-        "reviews": reviews,
-        "membership_ids": membership_ids,
-        "pma_flag": (
-            request.user.groups.filter(name="PMA").exists()
-            if request.user.is_authenticated
-            else False
-        ),
+
+def review_cards_context(request, page):
+    # Sentinel URLs carry the sort along with the cursor
+    next_query = None
+    if page.has_next:
+        params = request.GET.copy()
+        params["cursor"] = page.next_cursor
+        next_query = params.urlencode()
+
+    return {
+        "reviews": prefetch_attachment_urls(page.object_list),
+        "next_query": next_query,
+        "membership_ids": membership_ids_for(request, page.object_list),
     }
 
+
+def review_list(request):
+    try:
+        page = get_reviews_page(request, request.GET.get("cursor"))
+    except InvalidCursor:
+        page = get_reviews_page(request)
+
+    context = review_cards_context(request, page)
     return render(request, "reviews/review_list.html", context)
 
 
+def review_list_page(request):
+    # Infinite-scroll fragment: the next page of cards plus the next sentinel
+    try:
+        page = get_reviews_page(request, request.GET.get("cursor"))
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor")
+    context = review_cards_context(request, page)
+    return render(request, "reviews/review_cards.html", context)
+
+
 def author_reviews(request, author):
-    reviews = BookReview.objects.filter(author=author)
+    reviews = prefetch_attachment_urls(BookReview.objects.for_cards().filter(author=author))
     return render(
         request,
         "reviews/author_reviews.html",
         {
             "author": author,
             "reviews": reviews,
-            "pma_flag": (
-            request.user.groups.filter(name="PMA").exists()
-            if request.user.is_authenticated
-            else False
-            ),
-
-
+            "membership_ids": membership_ids_for(request, reviews),
         },
     )
 
 
 def genre_reviews(request, genre):
-    reviews = BookReview.objects.filter(genre=genre)
+    reviews = prefetch_attachment_urls(BookReview.objects.for_cards().filter(genre=genre))
     return render(
-        request, "reviews/genre_reviews.html", {"genre": genre, "reviews": reviews, "pma_flag": (
-            request.user.groups.filter(name="PMA").exists()
-            if request.user.is_authenticated
-            else False),}
+        request,
+        "reviews/genre_reviews.html",
+        {"genre": genre, "reviews": reviews, "membership_ids": membership_ids_for(request, reviews)},
     )
 
 
 @login_required
 def remove_book_review(request, review_id):
     review = get_object_or_404(BookReview, id=review_id)
-    if request.user == review.user or request.user.groups.filter(name="PMA").exists():
+    if request.user == review.user or roles.is_pma(request.user):
         review.delete()
         messages.success(request, f"Review for {review.title} deleted successfully.")
     else:
@@ -157,38 +248,64 @@ def remove_book_review(request, review_id):
 
 def book_list(request):
     form = BookSearchForm(request.GET)
-    reviews = BookReview.objects.all()
+    search_query = ""
+    suggestion = None
 
     logger.debug(f"Form data: {request.GET}")
-    logger.debug(f"Form is bound: {form.is_bound}")
 
     if form.is_valid():
-        logger.info("Form is valid")
         search_query = form.cleaned_data.get("search_query")
         logger.info(f"Search query: {search_query}")
-        if search_query:
-            reviews = reviews.filter(
-                Q(title__icontains=search_query)
-                | Q(author__icontains=search_query)
-                | Q(genre__icontains=search_query)
-                | Q(file_title__icontains=search_query)
-                | Q(file_keywords__icontains=search_query)
-            )
-            logger.info(f"Filtered reviews count: {reviews.count()}")
     else:
         logger.warning(f"Form errors: {form.errors}")
 
+    try:
+        page = max(1, int(request.GET.get("page", 1)))
+    except ValueError:
+        page = 1
+    offset = (page - 1) * SEARCH_PAGE_SIZE
+    # One extra review tells us whether there is a next page without a COUNT
+    if search_query:
+        reviews = search_reviews(
+            search_query,
+            queryset=BookReview.objects.for_cards(),
+            limit=SEARCH_PAGE_SIZE + 1,
+            offset=offset,
+            user=request.user,
+        )
+    else:
+        # Nothing to search for: every review, newest first
+        reviews = list(
+            BookReview.objects.for_cards().order_by("-date", "-id")[offset:offset + SEARCH_PAGE_SIZE + 1]
+        )
+    has_next = len(reviews) > SEARCH_PAGE_SIZE
+    reviews = prefetch_attachment_urls(reviews[:SEARCH_PAGE_SIZE])
+    if search_query and not reviews and page == 1:
+        suggestion = suggestions.suggest(search_query)
+
     context = {
         "form": form,
         "reviews": reviews,
-        "pma_flag": (
-            request.user.groups.filter(name="PMA").exists()
-            if request.user.is_authenticated
-            else False
-        ),
+        "membership_ids": membership_ids_for(request, reviews),
+        "page": page,
+        "has_previous": page > 1,
+        "has_next": has_next,
+        "suggestion": suggestion,
     }
     return render(request, "reviews/search_results.html", context)
 
+def search_suggestions(request):
+    query = request.GET.get("q", "")[:100]
+    return JsonResponse({"query": query, "suggestion": suggestions.suggest(query)})
+
+def search_autocomplete(request):
+    # Served from memory only: no ORM access here, so it stays off the database
+    query = request.GET.get("q", "")[:100]
+    results = [
+        {"label": label, "kind": kind} for label, kind in autocomplete.complete(query)
+    ]
+    return JsonResponse({"query": query, "results": results})
+
 @login_required
 def join_review(request, review_id):
     if request.method == "POST" and request.user.is_authenticated:
@@ -200,7 +317,7 @@ def join_review(request, review_id):
             return redirect("review_list")
 
         # Check if user is PMA
-        if request.user.groups.filter(name="PMA").exists():
+        if roles.is_pma(request.user):
             # Direct join for PMA users
             membership, created = BookReviewMembership.objects.get_or_create(
                 review=review, 
@@ -226,14 +343,13 @@ def join_review(request, review_id):
 
     return redirect("home")
 
-from django.db.models import Avg, Count
-
-
 @login_required
 def review_detail(request, review_id):
-    review = get_object_or_404(BookReview, id=review_id)
-    comments = review.comments.all()
-    join_requests = JoinRequest.objects.filter(review=review, status=JoinRequest.PENDING)
+    review = get_object_or_404(BookReview.objects.select_related("user"), id=review_id)
+    comments = review.comments.select_related("user")
+    join_requests = JoinRequest.objects.filter(
+        review=review, status=JoinRequest.PENDING
+    ).select_related("user")
     membership = BookReviewMembership.objects.filter(user=request.user, review=review).first()
 
     if request.method == "POST":
@@ -245,23 +361,8 @@ def review_detail(request, review_id):
         form = CommentForm(request.POST)
         if form.is_valid():
             comment = form.save(commit=False)
-            comment.review = review
             comment.user = request.user
-            comment.save()
-
-            comment_ratings = review.comments.aggregate(Avg("rating"), Count("rating"))
-            total_ratings = (
-                comment_ratings["rating__avg"] * comment_ratings["rating__count"]
-                if comment_ratings["rating__avg"]
-                else 0
-            )
-
-            total_ratings += review.rating
-            total_count = comment_ratings["rating__count"] + 1
-            new_average_rating = total_ratings / total_count if total_count else 0
-
-            review.rating = round(new_average_rating, 2)
-            review.save()
+            review.add_comment(comment)
 
             return redirect("review_detail", review_id=review_id)
     else:
@@ -273,14 +374,33 @@ def review_detail(request, review_id):
         "form": form,
         "join_requests": join_requests,
         "membership": membership,
-        "pma_flag": (
-            request.user.groups.filter(name="PMA").exists()
-            if request.user.is_authenticated
-            else False
-        ),
     }
     return render(request, "reviews/review_detail.html", context)
 
+@login_required
+def review_attachment(request, review_id):
+    # Access is checked here, in the same query as the review; the transfer
+    # itself is handed off (see mysite.files)
+    is_member = BookReviewMembership.objects.filter(review=OuterRef("pk"), user=request.user)
+    review = get_object_or_404(
+        BookReview.objects.only("user_id", "file_upload", "file_title").annotate(
+            is_member=Exists(is_member)
+        ),
+        id=review_id,
+    )
+    if not (review.is_member or review.user_id == request.user.id or roles.is_pma(request.user)):
+        return HttpResponseForbidden("Only members of this review can open its attachment.")
+    if not review.file_upload:
+        raise Http404("This review has no attachment.")
+
+    name = review.file_upload.name
+    # Blob names are content hashes; offer something readable instead
+    extension = os.path.splitext(name)[1]
+    filename = review.file_title or f"attachment-{review.id}"
+    if not filename.lower().endswith(extension.lower()):
+        filename += extension
+    return serve_file(request, review.file_upload.storage, name, filename)
+
 @login_required
 def join_review_request(request, review_id):
     if request.method == "POST":
@@ -308,7 +428,7 @@ def manage_join_requests(request, review_id):
     
     review = get_object_or_404(BookReview, id=review_id)
 
-    if review.user != request.user and not request.user.groups.filter(name="PMA").exists():
+    if review.user != request.user and not roles.is_pma(request.user):
         messages.error(request, "You are not authorized to manage requests for this review.")
         return redirect("review_list")
 
@@ -0,0 +1,93 @@
+"""Process-local, in-memory indexes over catalog and review titles/authors.
+
+Used by the search suggestions and autocomplete. Each index is built lazily
+(or at worker start, see mysite/wsgi.py), kept current by the signal
+handlers in reviews.signals, and rebuilt in a background thread once it is
+older than its max age to pick up writes that bypass signals (bulk imports,
+other worker processes).
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+BOOK_TITLE = "book_title"
+REVIEW_TITLE = "review_title"
+AUTHOR = "author"
+
+
+def catalog_entries():
+    """Yield (text, kind) for every book/review title and author."""
+    from books.models import Book
+
+    from .models import BookReview
+
+    for model, title_kind in ((Book, BOOK_TITLE), (BookReview, REVIEW_TITLE)):
+        for title, author in model.objects.values_list("title", "author").iterator():
+            yield title, title_kind
+            yield author, AUTHOR
+
+
+def entries_for(instance):
+    from books.models import Book
+
+    title_kind = BOOK_TITLE if isinstance(instance, Book) else REVIEW_TITLE
+    return [(instance.title, title_kind), (instance.author, AUTHOR)]
+
+
+class ProcessIndex:
+    def __init__(self, build, max_age_setting, default_max_age=15 * 60):
+        self.build = build
+        self.max_age_setting = max_age_setting
+        self.default_max_age = default_max_age
+        self.index = None
+        self.built_at = 0.0
+        self.rebuilding = False
+        self.lock = threading.Lock()
+
+    def _rebuild(self):
+        try:
+            index = self.build()
+            self.index, self.built_at = index, time.monotonic()
+        finally:
+            self.rebuilding = False
+
+    def _rebuild_in_background(self):
+        try:
+            self._rebuild()
+        finally:
+            connections.close_all()
+
+    def get(self):
+        if self.index is None:
+            with self.lock:
+                if self.index is None:
+                    self._rebuild()
+            return self.index
+
+        max_age = getattr(settings, self.max_age_setting, self.default_max_age)
+        if time.monotonic() - self.built_at > max_age and not self.rebuilding:
+            # Keep answering from the stale index while a fresh one is built
+            with self.lock:
+                if not self.rebuilding:
+                    self.rebuilding = True
+                    threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+        return self.index
+
+    def loaded(self):
+        """The index if this process has built it, else None (nothing to update)."""
+        return self.index
+
+    def reset(self):
+        self.index = None
+
+    def warm_up(self):
+        try:
+            self.get()
+        except DatabaseError:
+            # e.g. before the first migrate; the index builds on first use instead
+            logger.warning("Could not build %s at startup", self.max_age_setting, exc_info=True)
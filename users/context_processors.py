@@ -0,0 +1,25 @@
+from urllib.parse import urlencode
+
+from django.contrib.auth import REDIRECT_FIELD_NAME
+from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
+
+from . import roles
+
+
+def user_roles(request):
+    # Lazy, so pages that never check pma_flag never resolve the user's groups
+    return {"pma_flag": SimpleLazyObject(lambda: roles.is_pma(request.user))}
+
+
+def google_login_url(request):
+    # What {% provider_login_url 'google' %} renders, minus the SocialApp
+    # query allauth runs on every call
+    url = reverse("google_login")
+    next_url = request.GET.get(REDIRECT_FIELD_NAME)
+    return f"{url}?{urlencode({REDIRECT_FIELD_NAME: next_url})}" if next_url else url
+
+
+def login_url(request):
+    # For templates that show a login form per review card
+    return {"login_url": SimpleLazyObject(lambda: google_login_url(request))}
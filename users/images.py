@@ -0,0 +1,117 @@
+"""Pre-sized copies of profile images.
+
+Profile pages used to embed the uploaded original, often a multi-megabyte
+phone photo, in a 150px circle. Once a profile with a new image commits,
+generate_variants() decodes it once and writes each VARIANTS size as WebP
+and JPEG, with the image's metadata (EXIF, GPS, ICC) left behind. The
+names are stored in Profile.image_variants and the templates pick between
+them with srcset. It runs on the attachment worker pool
+(reviews.background), off the request cycle. Replaced variants are
+deleted, and so are the last ones with the profile (see users.signals).
+"""
+import hashlib
+from io import BytesIO
+
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from reviews import derived
+from reviews.background import run_after_commit
+
+from .models import Profile
+
+# name: (size, square). Square variants are cropped to fill a circle;
+# "full" keeps the image's proportions within the box.
+VARIANTS = {
+    "avatar": (64, True),
+    "card": (300, True),
+    "full": (1024, False),
+}
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def decode(file):
+    """The image in ``file`` as upright RGB, decoded no larger than the
+    biggest variant needs."""
+    image = Image.open(file)
+    largest = max(size for size, _ in VARIANTS.values())
+    # JPEGs decode straight at 1/2, 1/4 or 1/8 scale when that's still big enough
+    image.draft("RGB", (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    image = image.convert("RGB")
+    image.thumbnail((largest, largest), reducing_gap=2.0)
+    # Nothing from the upload's metadata is carried into the variants
+    image.info = {}
+    return image
+
+
+def resize(image, size, square):
+    if square:
+        return ImageOps.fit(image, (size, size), Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail((size, size), Image.LANCZOS)
+    return image
+
+
+def render_variants(file):
+    """{(variant, format): bytes} for the image in ``file``."""
+    image = decode(file)
+    rendered = {}
+    for variant, (size, square) in VARIANTS.items():
+        resized = resize(image, size, square)
+        for extension, (pil_format, options) in FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, pil_format, **options)
+            rendered[variant, extension] = buffer.getvalue()
+    return rendered
+
+
+def generate_variants(profile_id):
+    """Render and store the variants of a profile's current image, unless
+    they are up to date. Returns whether variants were stored."""
+    profile = Profile.objects.filter(pk=profile_id).only(
+        "user_id", "profile_image", "image_variants", "image_variants_of"
+    ).first()
+    if profile is None or not needs_variants(profile):
+        return False
+
+    source = profile.profile_image.name or ""
+    digest = hashlib.md5(source.encode()).hexdigest()[:12]
+
+    def render(file):
+        return {
+            (variant, extension): (f"profile_images/{profile.user_id}-{digest}-{variant}.{extension}", data)
+            for (variant, extension), data in render_variants(file).items()
+        }
+
+    def record(stored):
+        variants = {}
+        for (variant, extension), name in stored.items():
+            variants.setdefault(variant, {})[extension] = name
+        return {"image_variants": variants, "image_variants_of": source}
+
+    return derived.regenerate(
+        profile, "profile_image", default_storage, render, record,
+        variant_names(profile.image_variants), f"user:{profile.user_id}",
+    )
+
+
+def variant_names(variants):
+    return {name for formats in variants.values() for name in formats.values()}
+
+
+def schedule_variants(profile_id):
+    """Generate the variants of ``profile_id``'s image once the current transaction commits."""
+    run_after_commit(generate_variants, profile_id)
+
+
+def needs_variants(profile):
+    return profile.image_variants_of != (profile.profile_image.name or "")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from users.images import generate_variants
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Generate missing or outdated profile image variants, e.g. for images uploaded before variants existed."
+
+    def handle(self, *args, **options):
+        profile_ids = (
+            Profile.objects.exclude(profile_image="").exclude(profile_image__isnull=True)
+            .exclude(image_variants_of=F("profile_image")).values_list("id", flat=True)
+        )
+        generated = 0
+        for profile_id in profile_ids.iterator():
+            generated += generate_variants(profile_id)
+            if options["verbosity"] >= 2:
+                self.stdout.write(f"{generated} profile images processed")
+        self.stdout.write(self.style.SUCCESS(f"Generated variants of {generated} profile images"))
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:04
+
+from django.db import migrations, models
+import reviews.blobs
+import users.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_userbook'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='profile_image',
+            field=models.ImageField(blank=True, null=True, storage=reviews.blobs.get_blob_storage, upload_to='uploads/', validators=[users.models.validate_profile_image]),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_profile_image_blob_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='image_variants_of',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+    ]
@@ -2,31 +2,66 @@ from django.db import models
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
+from django.core.files.storage import default_storage
 from django.dispatch import receiver
 from books.models import Book
+from reviews.blobs import get_blob_storage
 
 # Create your models here.
 
+# Widths of the square variants (users.images.VARIANTS) the profile picture chooses between
+VARIANT_WIDTHS = {"avatar": 64, "card": 300}
+
+PROFILE_IMAGE_EXTENSIONS = ("jpg", "jpeg", "png", "webp")
+
+
 def validate_profile_image(value):
+    # Stored images were checked on upload; reading one back would fetch it from S3
+    if getattr(value, "_committed", False):
+        return
     extension = value.name.split(".")[-1].lower()
-    
+
     # Can change this parameter later, just want to make sure my AWS S3 storage is not bombarded
-    if value.file.size > 5*1024*1024:
-        raise ValidationError("Image file too large ( > 1mb )")
-    if extension != ".jpg":
-        raise ValidationError("Image file must be of type .jpg")
-    
+    if value.size > 5*1024*1024:
+        raise ValidationError("Image file too large ( > 5mb )")
+    if extension not in PROFILE_IMAGE_EXTENSIONS:
+        raise ValidationError("Image file must be of type .jpg, .png or .webp")
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
-    profile_image = models.ImageField(upload_to="uploads/", validators=[validate_profile_image], blank=True, null=True)
+    profile_image = models.ImageField(upload_to="uploads/", storage=get_blob_storage, validators=[validate_profile_image], blank=True, null=True)
     reading_goal = models.PositiveIntegerField(null=True, blank=True)
     display_reading_goal = models.BooleanField(default=False)
+    # Pre-sized copies of profile_image (users.images), by variant and
+    # format, for the image named in image_variants_of
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    image_variants_of = models.CharField(max_length=255, blank=True, editable=False)
 
     # Optional Additional Parameters: , blank=True, null=True
     
     def __str__(self):
         return f"Profile of user: {self.user.username}"
 
+    def image_srcset(self, extension):
+        return ", ".join(
+            f"{default_storage.url(formats[extension])} {VARIANT_WIDTHS[variant]}w"
+            for variant, formats in self.image_variants.items()
+            if variant in VARIANT_WIDTHS and extension in formats
+        )
+
+    @property
+    def image_sources(self):
+        """srcset values for the profile picture, or None until the
+        variants exist."""
+        if not self.image_variants or self.image_variants_of != self.profile_image.name:
+            return None
+        return {
+            "webp": self.image_srcset("webp"),
+            "jpeg": self.image_srcset("jpeg"),
+            "src": default_storage.url(self.image_variants["card"]["jpeg"]),
+            "full": default_storage.url(self.image_variants["full"]["jpeg"]),
+        }
+
 class UserBook(models.Model):
     STATUS_CHOICES = (
         ('read', 'Read'),
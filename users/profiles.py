@@ -0,0 +1,59 @@
+"""Data and cached rendering for the profile page.
+
+load_profile() gathers everything the profile content shows in a fixed
+number of queries. Visitors viewing someone else's profile get a rendered
+copy of that content from the cache, tagged with the owner's "user:{id}"
+tag so it is dropped when their profile, reviews, comments or shelves
+change.
+"""
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from mysite.cache import get_or_set_tagged
+from reviews.models import BookReview, Comment
+
+from .models import Profile
+
+# Kept well under the lifetime of signed S3 URLs in the rendered HTML
+PROFILE_CACHE_TIMEOUT = 10 * 60
+
+
+def _cache_key(user_id):
+    return f"profile:rendition:{user_id}"
+
+
+def load_profile(profile_user):
+    profile, created = Profile.objects.get_or_create(user=profile_user)
+    reviews_written = profile_user.book_reviews.only("id", "title", "comment", "date", "rating")
+    commented_reviews = BookReview.objects.filter(
+        id__in=Comment.objects.filter(user=profile_user).values("review_id")
+    ).only("id", "title", "genre", "date")
+    shelves = profile_user.user_books.select_related("book").only(
+        "user", "status", "book__id", "book__title", "book__description"
+    )
+
+    books = {"read": [], "want_to_read": []}
+    for userbook in shelves:
+        books.setdefault(userbook.status, []).append(userbook)
+
+    return {
+        "profile_user": profile_user,
+        "profile": profile,
+        "reviews_written": list(reviews_written),
+        "commented_reviews": list(commented_reviews),
+        "books_read": books["read"],
+        "books_want_to_read": books["want_to_read"],
+        # Not called (or queried) unless a template uses it
+        "is_google_user": profile_user.socialaccount_set.exists,
+    }
+
+
+def render_visitor_profile(profile_user):
+    def render():
+        context = {**load_profile(profile_user), "is_current_user": False}
+        return render_to_string("users/profile_content.html", context)
+
+    html = get_or_set_tagged(
+        _cache_key(profile_user.pk), [f"user:{profile_user.pk}"], render, PROFILE_CACHE_TIMEOUT
+    )
+    return mark_safe(html)
@@ -0,0 +1,42 @@
+"""Role lookups for the current user.
+
+A user's group names are loaded once per request (memoized on the user
+object) and shared across requests through the cache. The entry is
+dropped whenever the user's group membership changes (see users.signals).
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+PMA_GROUP = "PMA"
+ROLES_CACHE_TIMEOUT = 60 * 60
+
+
+def _cache_key(user_id):
+    return f"roles:user:{user_id}"
+
+
+def group_names(user):
+    if not user.is_authenticated:
+        return frozenset()
+    try:
+        return user._group_names
+    except AttributeError:
+        pass
+    key = _cache_key(user.pk)
+    names = cache.get(key)
+    if names is None:
+        names = frozenset(user.groups.values_list("name", flat=True))
+        cache.set(key, names, ROLES_CACHE_TIMEOUT)
+    user._group_names = names
+    return names
+
+
+def is_pma(user):
+    return PMA_GROUP in group_names(user)
+
+
+def invalidate(user_ids):
+    keys = [_cache_key(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    # Again after commit, in case another request cached the old groups meanwhile
+    transaction.on_commit(lambda: cache.delete_many(keys))
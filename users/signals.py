@@ -0,0 +1,55 @@
+from django.contrib.auth.models import Group, User
+from django.core.files.storage import default_storage
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+from mysite.cache import register_tags
+from reviews import blobs, derived
+
+from . import roles
+from .images import needs_variants, schedule_variants, variant_names
+from .models import Profile, UserBook
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_changed_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # group.user_set.add(...) etc.; clear() doesn't say which users it removes
+        if action == "pre_clear":
+            roles.invalidate(instance.user_set.values_list("pk", flat=True))
+        elif action in ("post_add", "post_remove"):
+            roles.invalidate(pk_set)
+    elif action in ("post_add", "post_remove", "post_clear"):
+        roles.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_group_members(sender, instance, **kwargs):
+    # Renaming or deleting a group changes its members' roles
+    if instance.pk is not None:
+        roles.invalidate(instance.user_set.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=User)
+def forget_new_user_roles(sender, instance, created, **kwargs):
+    # A new user may reuse the id of a deleted one
+    if created:
+        roles.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=Profile)
+def queue_image_variants(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and "profile_image" not in update_fields:
+        return
+    if needs_variants(instance):
+        schedule_variants(instance.pk)
+
+
+register_tags(User, lambda user: [f"user:{user.pk}"])
+register_tags(Profile, lambda profile: [f"user:{profile.user_id}"])
+register_tags(UserBook, lambda userbook: [f"user:{userbook.user_id}", f"book:{userbook.book_id}"])
+
+
+blobs.track(Profile, "profile_image")
+derived.track(Profile, default_storage, lambda profile: variant_names(profile.image_variants))
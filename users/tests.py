@@ -1,13 +1,37 @@
 from django.test import TestCase, Client
 from django.urls import reverse
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from users import roles
 from reviews.models import Comment, BookReview
+from books.models import Book
+from users.models import UserBook
 import os
+import shutil
+import tempfile
+from io import BytesIO
 from django.conf import settings
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from users import images
+from users.models import Profile
 
 class UserAccessTests(TestCase):
     def setUp(self):
+        # The reviews below store their attachments; keep them out of MEDIA_ROOT
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        overrides = override_settings(
+            STORAGES={
+                "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+                "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+            },
+            MEDIA_ROOT=self.tmp,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
         self.client = Client()
         self.user = User.objects.create_user(username='regularuser', password='thisisnotasecurepassword')
         self.admin_user = User.objects.create_superuser(username='adminuser', password='adminpassword123')
@@ -135,4 +159,255 @@ class UserAccessTests(TestCase):
         response = self.client.post(reverse('join_review', args=[self.review1.id]))
         self.assertEqual(response.status_code, 302)
         self.assertFalse(BookReview.objects.filter(title='Back to the Future 1', author='Robert Zemeckis').exists()) 
- 
\ No newline at end of file
+ 
+
+
+class UserRolesTests(TestCase):
+
+    def setUp(self):
+        self.pma = Group.objects.create(name='PMA')
+        self.user = User.objects.create_user(username='roleuser', password='rolepassword')
+        self.client.login(username='roleuser', password='rolepassword')
+
+    def group_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [q for q in queries if 'auth_group' in q['sql']]
+
+    def test_pma_flag_reaches_templates_without_view_queries(self):
+        self.user.groups.add(self.pma)
+        response, queries = self.group_queries(reverse('about'))
+        self.assertTrue(response.context['pma_flag'])
+        self.assertEqual(len(queries), 1)
+
+        # Cached across requests
+        response, queries = self.group_queries(reverse('review_list'))
+        self.assertTrue(response.context['pma_flag'])
+        self.assertEqual(queries, [])
+
+    def test_anonymous_users_are_not_pma(self):
+        self.client.logout()
+        response, queries = self.group_queries(reverse('home'))
+        self.assertFalse(response.context['pma_flag'])
+        self.assertEqual(queries, [])
+
+    def test_group_changes_invalidate_cached_roles(self):
+        self.assertFalse(roles.is_pma(User.objects.get(pk=self.user.pk)))
+        self.user.groups.add(self.pma)
+        self.assertTrue(roles.is_pma(User.objects.get(pk=self.user.pk)))
+        self.pma.user_set.remove(self.user)
+        self.assertFalse(roles.is_pma(User.objects.get(pk=self.user.pk)))
+        self.pma.user_set.add(self.user)
+        self.pma.user_set.clear()
+        self.assertFalse(roles.is_pma(User.objects.get(pk=self.user.pk)))
+        self.user.groups.add(self.pma)
+        self.pma.name = 'Former PMA'
+        self.pma.save()
+        self.assertFalse(roles.is_pma(User.objects.get(pk=self.user.pk)))
+
+
+class ProfilePageTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='shelfowner', password='ownerpassword')
+        self.visitor = User.objects.create_user(username='visitor', password='visitorpassword')
+        self.review = BookReview.objects.create(
+            user=self.visitor, title='Persuasion', author='Jane Austen', comment='Quiet.', rating=4,
+        )
+        self.add_books(1)
+
+    def add_books(self, count):
+        for i in range(count):
+            book = Book.objects.create(
+                title=f'Shelf Book {Book.objects.count()}', author='Someone', genre='Fiction',
+                description='On a shelf.', publisher='Publisher', date_published='2000-01-01',
+            )
+            UserBook.objects.create(user=self.owner, book=book, status='read')
+            UserBook.objects.create(user=self.owner, book=book, status='want_to_read')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_own_profile_query_count_is_bounded(self):
+        self.client.login(username='shelfowner', password='ownerpassword')
+        self.count_queries(reverse('user_profile'))
+        _, before = self.count_queries(reverse('user_profile'))
+        self.add_books(5)
+        self.review.add_comment(Comment(user=self.owner, text='Agreed.', rating=5))
+        response, after = self.count_queries(reverse('user_profile'))
+        self.assertEqual(after, before)
+        self.assertContains(response, 'Shelf Book 5')
+        self.assertContains(response, 'Persuasion')
+
+    def test_visitors_get_cached_profile_until_owner_changes_it(self):
+        self.client.login(username='visitor', password='visitorpassword')
+        url = reverse('view_profile', args=['shelfowner'])
+        _, first = self.count_queries(url)
+        response, cached = self.count_queries(url)
+        self.assertLess(cached, first)
+        self.assertNotContains(response, 'Remove')
+
+        self.add_books(1)
+        response, _ = self.count_queries(url)
+        self.assertContains(response, 'Shelf Book 1')
+
+        self.review.add_comment(Comment(user=self.owner, text='Agreed.', rating=5))
+        response, _ = self.count_queries(url)
+        self.assertContains(response, 'Persuasion')
+
+
+class ProfileImageTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        overrides = override_settings(
+            STORAGES={
+                "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+                "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+            },
+            MEDIA_ROOT=self.tmp, ATTACHMENT_WORKERS=0, BLOB_GC_GRACE=0,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = User.objects.create_user(username='pictured', password='password')
+        self.client.login(username='pictured', password='password')
+
+    def photo(self, size=(3000, 2000), name='photo.jpg'):
+        from PIL import Image
+
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise
+        exif[0x010F] = 'Phone Maker'
+        buffer = BytesIO()
+        Image.new('RGB', size, 'teal').save(buffer, 'JPEG', quality=95, exif=exif)
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def upload(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('user_profile'), {
+                'username': 'pictured', 'email': '', 'reading_goal': '', **data,
+            })
+
+    def test_upload_creates_small_variants_without_metadata(self):
+        from PIL import Image
+
+        response = self.upload(profile_image=self.photo())
+        self.assertEqual(response.status_code, 302)
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual(profile.image_variants_of, profile.profile_image.name)
+        self.assertEqual(set(profile.image_variants), set(images.VARIANTS))
+
+        for variant, (size, square) in images.VARIANTS.items():
+            for extension in images.FORMATS:
+                with default_storage.open(profile.image_variants[variant][extension]) as f:
+                    image = Image.open(f)
+                    image.load()
+                # Turned upright, then scaled into the variant's box
+                expected = (size, size) if square else (round(size * 2 / 3), size)
+                self.assertEqual(image.size, expected)
+                self.assertEqual(len(image.getexif()), 0)
+                self.assertNotIn('icc_profile', image.info)
+
+    def test_profile_page_offers_variants_by_srcset(self):
+        self.upload(profile_image=self.photo())
+        profile = Profile.objects.get(user=self.user)
+        visitor = User.objects.create_user(username='onlooker', password='password')
+        self.client.force_login(visitor)
+        response = self.client.get(reverse('view_profile', args=['pictured']))
+        card = default_storage.url(profile.image_variants['card']['webp'])
+        self.assertContains(response, f'{card} 300w')
+        self.assertContains(response, 'type="image/webp"')
+        self.assertNotContains(response, profile.profile_image.url)
+
+    def test_replacing_or_clearing_the_image_replaces_its_variants(self):
+        self.upload(profile_image=self.photo())
+        first = images.variant_names(Profile.objects.get(user=self.user).image_variants)
+
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.new('RGBA', (400, 400), (255, 0, 0, 0)).save(buffer, 'PNG')
+        self.upload(profile_image=SimpleUploadedFile('avatar.png', buffer.getvalue(), content_type='image/png'))
+        profile = Profile.objects.get(user=self.user)
+        self.assertTrue(profile.image_variants)
+        self.assertFalse(first & images.variant_names(profile.image_variants))
+        self.assertFalse(any(default_storage.exists(name) for name in first))
+
+        second = images.variant_names(profile.image_variants)
+        self.upload(**{'profile_image-clear': 'on'})
+        profile.refresh_from_db()
+        self.assertEqual((profile.image_variants, profile.image_variants_of), ({}, ''))
+        self.assertFalse(any(default_storage.exists(name) for name in second))
+
+    def test_variants_are_deleted_with_the_account(self):
+        self.upload(profile_image=self.photo())
+        names = images.variant_names(Profile.objects.get(user=self.user).image_variants)
+        self.assertTrue(names)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+
+    def test_unsupported_and_oversized_images_are_rejected(self):
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.new('RGB', (10, 10)).save(buffer, 'GIF')
+        response = self.upload(profile_image=SimpleUploadedFile('moving.gif', buffer.getvalue()))
+        self.assertContains(response, 'must be of type')
+        padded = self.photo((20, 20)).read() + bytes(6 * 1024 * 1024)
+        response = self.upload(profile_image=SimpleUploadedFile('huge.jpg', padded, content_type='image/jpeg'))
+        self.assertContains(response, 'too large')
+        self.assertFalse(Profile.objects.get(user=self.user).profile_image)
+
+
+class HomeFeedTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='feedauthor', password='authorpassword')
+        self.review = BookReview.objects.create(
+            user=self.author, title='Middlemarch', author='George Eliot', comment='Long.', rating=4,
+        )
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_anonymous_home_page_runs_no_queries_once_cached(self):
+        self.count_queries()
+        response, queries = self.count_queries()
+        self.assertEqual(queries, 0)
+        self.assertContains(response, 'Middlemarch')
+        self.assertContains(response, reverse('google_login'))
+
+    def test_review_writes_refresh_the_feed(self):
+        self.count_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            BookReview.objects.create(
+                user=self.author, title='Daniel Deronda', author='George Eliot', comment='', rating=3,
+            )
+        # Rebuilt on commit, so the next visitor still gets a cached page
+        response, queries = self.count_queries()
+        self.assertEqual(queries, 0)
+        self.assertContains(response, 'Daniel Deronda')
+
+        self.review.delete()
+        response, _ = self.count_queries()
+        self.assertNotContains(response, 'Middlemarch')
+
+    def test_membership_overlay_is_per_user(self):
+        self.review.add_comment(Comment(user=self.author, text='Agreed.', rating=2))
+        self.client.login(username='feedauthor', password='authorpassword')
+        response, _ = self.count_queries()
+        self.assertNotContains(response, 'Long.')
+
+        self.review.memberships.create(user=self.author)
+        response, _ = self.count_queries()
+        self.assertContains(response, 'Long.')
+        self.assertContains(response, 'Rating: 3/5')
+        self.assertContains(response, 'Delete Review')
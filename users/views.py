@@ -1,26 +1,23 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
-from reviews.models import BookReview, Comment
+from reviews.feed import home_feed
+from reviews.models import BookReviewMembership, Comment
 from allauth.socialaccount.models import SocialAccount
 from .forms import UserDetailsForm, UserUpdateForm
-from .models import Profile
+from .profiles import load_profile, render_visitor_profile
 from django.contrib.auth.models import User
 
 def home(request):
-    reviews = BookReview.objects.all().order_by("-date")[:10]
+    feed = home_feed()
     user = request.user
 
-    if user.is_authenticated:
-        membership_ids = set(user.memberships.values_list("review_id", flat=True))
-    else:
-        membership_ids = set()
-
     context = {
         "first_name": user.first_name if user.is_authenticated else "Guest",
-        "pma_flag": user.groups.filter(name="PMA").exists(),
-        "reviews": reviews,
-        "membership_ids": membership_ids,
+        "feed": feed,
+        "membership_ids": BookReviewMembership.objects.review_ids_for(
+            user, [entry["id"] for entry in feed]
+        ),
     }
     return render(request, "home.html", context)
 
@@ -31,90 +28,41 @@ def logout_view(request):
     return redirect("home")
 
 
-@login_required
-def user_profile(request):
+def own_profile(request, success_url):
     profile_user = request.user
-    profile, created = Profile.objects.get_or_create(user=profile_user)
-    reviews_written = profile_user.book_reviews.all()
-    commented_reviews = BookReview.objects.filter(comments__user=profile_user).distinct()
-
-    # get bookshelves
-    books_read = profile_user.user_books.filter(status='read')
-    books_want_to_read = profile_user.user_books.filter(status='want_to_read')
+    context = load_profile(profile_user)
 
     if request.method == 'POST':
         user_form = UserUpdateForm(request.POST, instance=profile_user)
-        details_form = UserDetailsForm(request.POST, request.FILES, instance=profile)
+        details_form = UserDetailsForm(request.POST, request.FILES, instance=context['profile'])
         if user_form.is_valid() and details_form.is_valid():
             user_form.save()
             details_form.save()
-            return redirect('user_profile')
+            return redirect(success_url)  # redirects to avoid resubmission
     else:
         user_form = UserUpdateForm(instance=profile_user)
-        details_form = UserDetailsForm(instance=profile)
+        details_form = UserDetailsForm(instance=context['profile'])
 
-    context = {
-        'profile_user': profile_user,
-        'profile': profile,
-        'reviews_written': reviews_written,
-        'commented_reviews': commented_reviews,
+    context.update({
         'user_form': user_form,
         'details_form': details_form,
-        'is_google_user': profile_user.socialaccount_set.exists(),
         'is_current_user': True,
-        'books_read': books_read,
-        'books_want_to_read': books_want_to_read,
-        "pma_flag": (
-            request.user.groups.filter(name="PMA").exists()
-            if request.user.is_authenticated
-            else False
-        ),
-    }
+    })
     return render(request, 'users/profile.html', context)
 
+@login_required
+def user_profile(request):
+    return own_profile(request, 'user_profile')
+
 def view_profile(request, username):
     profile_user = get_object_or_404(User, username=username)
-    profile, created = Profile.objects.get_or_create(user=profile_user)
-    reviews_written = profile_user.book_reviews.all()
-    commented_reviews = BookReview.objects.filter(comments__user=profile_user).distinct()
-
-    is_current_user = request.user == profile_user  # viewing own profile check
-
-    # get bookshelves
-    books_read = profile_user.user_books.filter(status='read')
-    books_want_to_read = profile_user.user_books.filter(status='want_to_read')
-
-    if is_current_user:
-        if request.method == 'POST':
-            user_form = UserUpdateForm(request.POST, instance=profile_user)
-            details_form = UserDetailsForm(request.POST, request.FILES, instance=profile)
-            if user_form.is_valid() and details_form.is_valid():
-                user_form.save()
-                details_form.save()
-                return redirect('view_profile', username=username)  # redirects to avoid resubmission
-        else:
-            user_form = UserUpdateForm(instance=profile_user)
-            details_form = UserDetailsForm(instance=profile)
-    else:
-        # forms not needed when viewing someone else's profile
-        user_form = None
-        details_form = None
+    if request.user == profile_user:
+        return own_profile(request, request.path)
 
+    # Read-only view of someone else's profile; forms not needed
     context = {
         'profile_user': profile_user,
-        'profile': profile,
-        'reviews_written': reviews_written,
-        'commented_reviews': commented_reviews,
-        'is_google_user': profile_user.socialaccount_set.exists(),
-        'is_current_user': is_current_user,
-        'books_read': books_read,
-        'books_want_to_read': books_want_to_read,
-        'user_form': user_form,
-        'details_form': details_form,
-        'pma_flag': (
-            request.user.groups.filter(name="PMA").exists()
-            if request.user.is_authenticated
-            else False
-        ),
+        'profile_content': render_visitor_profile(profile_user),
+        'is_current_user': False,
     }
-    return render(request, 'users/profile.html', context)
\ No newline at end of file
+    return render(request, 'users/profile.html', context)